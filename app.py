@@ -4,12 +4,20 @@ from dotenv import load_dotenv
 from io import BytesIO
 import pandas as pd
 import json
-import tiktoken
+import re
+import time
 from zipfile import ZipFile
+from collections import Counter
 
 # Importando as funções dos outros arquivos
-from relatorio import get_token, get_workspaces_id, scan_workspace, clean_reports, upload_file
-from documenta import generate_docx, generate_excel, text_to_document, Documenta, defined_prompt_fontes, defined_prompt_medidas, generate_promt_medidas, generate_promt_fontes, defined_prompt, generate_promt
+from relatorio import get_token, get_http_metrics, get_workspaces_id, workspace_name_filter, scan_workspace, scan_workspaces, DatasetIndex, upload_file, upload_files, ModelSnapshot
+from catalogo import connect as connect_catalog, incremental_scan, list_datasets, load_model
+from tokenizador import count_tokens, count_tokens_batch
+import cache_llm
+import tarefas
+from limitador import get_limiter_metrics
+from esquemas import get_parse_metrics
+from documenta import CHUNK_PACKING, MODELO_RESERVA, generate_docx, generate_excel, text_to_document, gerar_documentacao, gerar_documentacao_lote, defined_prompt_fontes, defined_prompt_medidas, generate_promt_medidas, generate_promt_fontes, defined_prompt, generate_promt
 
 # Importando o sistema de internacionalização
 from i18n import init_i18n, t, language_selector
@@ -25,13 +33,32 @@ MAX_TOKENS = 0
 MAX_TOKENS_SAIDA = 0
 
 def counttokens(text):
-    # Inicializando o tokenizador para o modelo desejado (neste exemplo, GPT-4)
-    encoding = tiktoken.get_encoding("cl100k_base")
-    
-    # Contar o número de tokens no texto fornecido
-    tokens = len(encoding.encode(text))
-    
-    return tokens
+    # Usa o tokenizador compartilhado, que guarda as contagens já feitas
+    return count_tokens(text)
+
+def token_analysis(document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes):
+    """Monta o texto do painel de tokens, contando cada parte uma única vez."""
+    total_tokens = 0
+    stringmostra = ""
+    conta_interacao = 0
+    tokens_all = counttokens(document_text_all)
+    if tokens_all < MAX_TOKENS:
+        conta_interacao += 1
+        total_tokens += tokens_all
+        stringmostra += f"{t('ui.first_interaction')}      | {t('ui.tokens_count')} {tokens_all:,}\n"
+    else:
+        # Ocupação de cada chamada em relação ao limite de tokens
+        for tokens in count_tokens_batch(dados_relatorio_PBI_medidas):
+            conta_interacao += 1
+            total_tokens += tokens
+            stringmostra += f"{conta_interacao}{t('ui.measures_interaction')}      | {t('ui.tokens_count')} {tokens:,} | {tokens / MAX_TOKENS:.0%}\n"
+        for tokens in count_tokens_batch(dados_relatorio_PBI_fontes):
+            conta_interacao += 1
+            total_tokens += tokens
+            stringmostra += f"{conta_interacao}{t('ui.sources_interaction')} | {t('ui.tokens_count')} {tokens:,} | {tokens / MAX_TOKENS:.0%}\n"
+        stringmostra += f"\n{t('ui.chunk_packing', mode=CHUNK_PACKING)} | {t('ui.average_fill')} {total_tokens / (conta_interacao * MAX_TOKENS):.0%}"
+    stringmostra += f"\n{t('ui.total_interactions')} {conta_interacao}\n{t('ui.total_tokens')} {total_tokens:,} tokens.\n"
+    return stringmostra
 
 def configure_app():
     """Configura a aparência e o layout do aplicativo Streamlit."""    
@@ -218,7 +245,19 @@ def sidebar_description():
     if st.session_state.get('show_description', False):
         detailed_description()
                 
-def main_content(headers=None, uploaded_files=None):
+def upload_error_message(error_message):
+    """Traduz a mensagem de erro retornada por upload_file."""
+    if "Arquivo inválido: não contém 'DataModelSchema'" in error_message or "não é um ZIP/PBIT válido" in error_message:
+        return t('errors.invalid_powerbi_file')
+    elif "Arquivo não suportado" in error_message:
+        return t('errors.file_not_supported')
+    elif "arquivo vazio" in error_message.lower():
+        return t('errors.empty_file')
+    elif "corrompido" in error_message.lower() or "falha" in error_message.lower():
+        return t('errors.corrupted_file')
+    return t('errors.processing_error', error=error_message)
+
+def main_content(headers=None, uploaded_files=None, tenant_id=None):
     """Exibe as informações principais do aplicativo."""    
     if 'all_reports_data' not in st.session_state:
         st.session_state['all_reports_data'] = []
@@ -235,45 +274,25 @@ def main_content(headers=None, uploaded_files=None):
                 try:
                     result = upload_file(uploaded_files[0])
                     
-                    # Verificar se o resultado é uma string (erro) ou tupla (sucesso)
+                    # Verificar se o resultado é uma string (erro) ou o modelo (sucesso)
                     if isinstance(result, str):
-                        # É uma mensagem de erro
-                        error_message = result
-                        if "Arquivo inválido: não contém 'DataModelSchema'" in error_message or "não é um ZIP/PBIT válido" in error_message:
-                            st.error(t('errors.invalid_powerbi_file'))
-                        elif "Arquivo não suportado" in error_message:
-                            st.error(t('errors.file_not_supported'))
-                        elif "arquivo vazio" in error_message.lower():
-                            st.error(t('errors.empty_file'))
-                        elif "corrompido" in error_message.lower() or "falha" in error_message.lower():
-                            st.error(t('errors.corrupted_file'))
-                        else:
-                            st.error(t('errors.processing_error', error=error_message))
+                        st.error(upload_error_message(result))
                         return
                     
-                    # Se chegou aqui, deve ser uma tupla com os dados
-                    if isinstance(result, tuple) and len(result) == 2:
-                        df_normalized, df_relationships = result
+                    # Se chegou aqui, deve ser o modelo normalizado
+                    if isinstance(result, ModelSnapshot):
+                        model = result
                     else:
                         st.error(t('errors.invalid_powerbi_file'))
                         return
                     
-                except ValueError as e:
-                    if "too many values to unpack" in str(e):
-                        st.error(t('errors.invalid_powerbi_file'))
-                    else:
-                        st.error(t('errors.processing_error', error=str(e)))
-                    return
                 except Exception as e:
                     st.error(t('errors.processing_error', error=str(e)))
                     return
 
-            # Store the df_relationships data in the session state for later use
-            st.session_state['df_relationships'] = df_relationships
-
-            if isinstance(df_normalized, pd.DataFrame) and not df_normalized.empty:
+            if not model.empty:
                 st.success(t('messages.file_processed'))
-                buttons_download(df_normalized)
+                buttons_download(model)
             else:
                 st.error(t('errors.no_data_found'))
         else:
@@ -284,49 +303,30 @@ def main_content(headers=None, uploaded_files=None):
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for idx, uploaded_file in enumerate(uploaded_files):
-                status_text.text(f"{t('messages.processing_file')} {idx + 1}/{len(uploaded_files)}: {uploaded_file.name}")
-                progress_bar.progress((idx) / len(uploaded_files))
-                
-                try:
-                    result = upload_file(uploaded_file)
-                    
-                    # Verificar se o resultado é uma string (erro) ou tupla (sucesso)
-                    if isinstance(result, str):
-                        error_message = result
-                        if "Arquivo inválido: não contém 'DataModelSchema'" in error_message or "não é um ZIP/PBIT válido" in error_message:
-                            errors.append(f"{uploaded_file.name}: {t('errors.invalid_powerbi_file')}")
-                        elif "Arquivo não suportado" in error_message:
-                            errors.append(f"{uploaded_file.name}: {t('errors.file_not_supported')}")
-                        elif "arquivo vazio" in error_message.lower():
-                            errors.append(f"{uploaded_file.name}: {t('errors.empty_file')}")
-                        elif "corrompido" in error_message.lower() or "falha" in error_message.lower():
-                            errors.append(f"{uploaded_file.name}: {t('errors.corrupted_file')}")
-                        else:
-                            errors.append(f"{uploaded_file.name}: {t('errors.processing_error', error=error_message)}")
-                        continue
-                    
-                    # Se chegou aqui, deve ser uma tupla com os dados
-                    if isinstance(result, tuple) and len(result) == 2:
-                        df_normalized, df_relationships = result
-                        if isinstance(df_normalized, pd.DataFrame) and not df_normalized.empty:
-                            st.session_state['all_reports_data'].append({
-                                'df': df_normalized,
-                                'df_relationships': df_relationships,
-                                'filename': uploaded_file.name.rsplit('.', 1)[0]
-                            })
-                        else:
-                            errors.append(f"{uploaded_file.name}: {t('errors.no_data_found')}")
+            # Os arquivos são processados em paralelo e chegam na ordem em que terminam
+            reports_by_index = {}
+            for done, (idx, file_name, result) in enumerate(upload_files(uploaded_files), start=1):
+                status_text.text(f"{t('messages.processing_file')} {done}/{len(uploaded_files)}: {file_name}")
+                progress_bar.progress(done / len(uploaded_files))
+
+                # Verificar se o resultado é uma exceção, uma string (erro) ou o modelo (sucesso)
+                if isinstance(result, Exception):
+                    errors.append(f"{file_name}: {t('errors.processing_error', error=str(result))}")
+                elif isinstance(result, str):
+                    errors.append(f"{file_name}: {upload_error_message(result)}")
+                elif isinstance(result, ModelSnapshot):
+                    if not result.empty:
+                        reports_by_index[idx] = {
+                            'model': result,
+                            'filename': file_name.rsplit('.', 1)[0]
+                        }
                     else:
-                        errors.append(f"{uploaded_file.name}: {t('errors.invalid_powerbi_file')}")
-                    
-                except ValueError as e:
-                    if "too many values to unpack" in str(e):
-                        errors.append(f"{uploaded_file.name}: {t('errors.invalid_powerbi_file')}")
-                    else:
-                        errors.append(f"{uploaded_file.name}: {t('errors.processing_error', error=str(e))}")
-                except Exception as e:
-                    errors.append(f"{uploaded_file.name}: {t('errors.processing_error', error=str(e))}")
+                        errors.append(f"{file_name}: {t('errors.no_data_found')}")
+                else:
+                    errors.append(f"{file_name}: {t('errors.invalid_powerbi_file')}")
+
+            # Mantém a ordem original dos arquivos
+            st.session_state['all_reports_data'] = [reports_by_index[idx] for idx in sorted(reports_by_index)]
             
             progress_bar.progress(1.0)
             status_text.empty()
@@ -343,66 +343,205 @@ def main_content(headers=None, uploaded_files=None):
                     st.warning(error)
 
     if headers:        
+        workspace_filter = st.text_input(t('ui.workspace_filter'), help=t('ui.workspace_filter_help'))
         with st.spinner(t('messages.loading_workspaces')):
-            workspace_dict = get_workspaces_id(headers)
+            workspace_dict = get_workspaces_id(headers, tenant_id, workspace_name_filter(workspace_filter))
         
         if workspace_dict:
-            option = st.selectbox(
+            if st.checkbox(t('ui.scan_all_workspaces')):
+                scan_all_workspaces(headers, workspace_dict)
+                return
+
+            if st.checkbox(t('ui.local_catalog')):
+                browse_catalog(headers, tenant_id)
+                return
+
+            workspace_id = st.selectbox(
                 t('ui.workspace_selector'), 
-                list(workspace_dict.keys()), 
+                list(workspace_dict), 
                 index=None, 
+                format_func=workspace_label(workspace_dict),
                 placeholder=t('ui.workspace_placeholder')
             )
-            if option:
-                with st.spinner(t('messages.scanning_workspace')):
-                    workspace_id = workspace_dict[option]
-                    scan_response = scan_workspace(headers, workspace_id)
-                    display_reports(scan_response)
+            if workspace_id:
+                # O índice do escaneamento fica na sessão: os reruns da mesma workspace não reescaneiam
+                cached = st.session_state.get('dataset_index')
+                if not cached or cached['workspace_id'] != workspace_id:
+                    with st.spinner(t('messages.scanning_workspace')):
+                        try:
+                            scan_response = scan_workspace(headers, workspace_id)
+                        except Exception as e:
+                            st.error(t('errors.api_error', error=str(e)))
+                            return
+                    cached = st.session_state['dataset_index'] = {'workspace_id': workspace_id, 'index': DatasetIndex(scan_response)}
+                display_reports(cached['index'])
+
+def workspace_label(workspace_dict):
+    """Função de rótulo para os seletores de workspace: o nome, seguido do ID quando o nome se repete."""
+    repeated = {name for name, count in Counter(workspace_dict.values()).items() if count > 1}
+
+    def label(workspace_id):
+        name = workspace_dict.get(workspace_id, workspace_id)
+        return f'{name} ({workspace_id})' if name in repeated else name
+    return label
+
+def scan_all_workspaces(headers, workspace_dict):
+    """Escaneia todas as workspaces do tenant em lotes e permite navegar pelos resultados."""
+    if st.button(t('ui.start_tenant_scan')):
+        scanned = {}
+        errors = []
+        total = len(workspace_dict)
+        done = 0
+
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+
+        # Os lotes chegam à medida que cada escaneamento termina
+        for workspace_ids, result in scan_workspaces(headers, list(workspace_dict)):
+            done += len(workspace_ids)
+            if isinstance(result, Exception):
+                errors.append(t('errors.api_error', error=str(result)))
+            else:
+                for workspace in result.get('workspaces', []):
+                    scanned[workspace.get('id')] = DatasetIndex(workspace)
+            status_text.text(t('messages.workspaces_scanned', done=done, total=total))
+            progress_bar.progress(done / total)
+
+        status_text.empty()
+        progress_bar.empty()
+        st.session_state['tenant_scan'] = scanned
+        st.session_state['tenant_scan_names'] = dict(workspace_dict)
+
+        for error in errors:
+            st.warning(error)
+
+    scanned = st.session_state.get('tenant_scan')
+    if scanned:
+        names = st.session_state.get('tenant_scan_names', {})
+        label = workspace_label(names)
+        option = st.selectbox(
+            t('ui.workspace_selector'), 
+            sorted(scanned, key=label), 
+            index=None, 
+            format_func=label,
+            placeholder=t('ui.workspace_placeholder')
+        )
+        if option:
+            display_reports(scanned[option])
+
+def browse_catalog(headers, tenant_id):
+    """Atualiza o catálogo local apenas com as workspaces alteradas e permite navegar pelos datasets."""
+    conn = connect_catalog()
+    try:
+        if st.button(t('ui.update_catalog'), help=t('ui.update_catalog_help')):
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+
+            def progress(done, total):
+                status_text.text(t('messages.workspaces_scanned', done=done, total=total))
+                progress_bar.progress(done / total)
+
+            try:
+                updated, errors = incremental_scan(headers, tenant_id, conn, progress)
+            except Exception as e:
+                st.error(t('errors.api_error', error=str(e)))
+                return
+            finally:
+                status_text.empty()
+                progress_bar.empty()
+
+            st.success(t('messages.catalog_updated', count=updated))
+            for error in errors:
+                st.warning(t('errors.api_error', error=error))
+
+        datasets = list_datasets(conn, tenant_id)
+        datasets = datasets[datasets['content_provider_type'].fillna('').str.contains('PbixInImportMode')]
+        if datasets.empty:
+            st.info(t('messages.catalog_empty'))
+            return
+
+        labels = dict(zip(datasets['workspace_name'] + ' / ' + datasets['dataset_name'], datasets['dataset_id']))
+        option = st.selectbox(
+            t('ui.report_selector'),
+            list(labels),
+            index=None,
+            placeholder=t('ui.report_placeholder')
+        )
+        if option:
+            buttons_download(load_model(conn, labels[option]))
+    finally:
+        conn.close()
 
-def display_reports(scan_response):
+def display_reports(index):
     """Exibe os painéis e lida com a seleção do usuário."""    
-    report_names = [report_info['name'] for report_info in scan_response['datasets'] if 'PbixInImportMode' in report_info['contentProviderType'] and 'Usage Metrics Report' not in report_info['name']]
-    
+    if st.checkbox(t('ui.document_all_datasets')):
+        # Todos os datasets de importação são normalizados em uma única passada
+        models = index.models(index.report_names())
+        all_reports_data = [{'model': model, 'filename': re.sub(r'[\\/:*?"<>|]', '_', name)}
+                            for name, model in models.items() if not model.empty]
+        if all_reports_data:
+            buttons_download_batch(all_reports_data)
+        else:
+            st.error(t('errors.no_data_found'))
+        return
+
     option = st.selectbox(
         t('ui.report_selector'), 
-        list(report_names), 
+        index.report_names(), 
         index=None, 
         placeholder=t('ui.report_placeholder')
     )
     
     if option:
-        df_desnormalized = clean_reports(scan_response, option)
-        buttons_download(df_desnormalized)
+        model = index.get(option)
+        buttons_download(model)
 
 def click_button():
     st.session_state.button = not st.session_state.button
     
-# Function to recursively update the 'FonteDados' field
-def update_fonte_dados(data, tables_df):
-    if isinstance(data, dict):
-        # Collect keys to modify in a separate list
-        keys_to_update = []
-        for key, value in data.items():
-            if key == 'NomeTabela' and value in tables_df['NomeTabela'].to_list():
-                keys_to_update.append((key, value))
-            elif isinstance(value, (dict, list)):
-                update_fonte_dados(value, tables_df)
-        
-        # Apply the modifications
-        for key, value in keys_to_update:
-            table_index = tables_df[tables_df['NomeTabela'] == value].index[0]
-            data['FonteDados'] = tables_df['FonteDados'].iloc[table_index]
-            
-    elif isinstance(data, list):
-        for item in data:
-            update_fonte_dados(item, tables_df)  
-
-def buttons_download(df):
+def show_model_data(model):
+    """Exibe as tabelas, medidas, colunas e relacionamentos do modelo normalizado."""
+    st.write(f"**{t('documentation.tables_heading')}**")
+    st.dataframe(model.tables)
+    st.write(f"**{t('documentation.measures_heading')}**")
+    st.dataframe(model.measures_frame())
+    st.write(f"**{t('documentation.columns_heading')}**")
+    st.dataframe(model.columns_frame())
+    if not model.relationships.empty:
+        st.write(f"**{t('documentation.relationships_heading')}**")
+        st.dataframe(model.relationships)
+
+def live_items(area, interval=0.5):
+    """Retorna um callback on_item que mostra na área as medidas e fontes já documentadas, conforme chegam."""
+    labels = {'Medidas_do_Relatorio': t('documentation.measures_heading'), 'Fontes_de_Dados': t('documentation.data_sources_heading')}
+    itens = []
+    shown = [0.0]
+
+    def on_item(array, item):
+        itens.append({'Tipo': labels.get(array, array), 'Nome': item.get('Nome'), 'Descricao': item.get('Descricao')})
+        # Redesenhar a tabela a cada item deixaria a página lenta em modelos com muitas medidas
+        now = time.monotonic()
+        if now - shown[0] >= interval:
+            shown[0] = now
+            with area.container():
+                st.caption(t('messages.items_documented', count=len(itens)))
+                st.dataframe(pd.DataFrame(itens[::-1]), hide_index=True, height=250)
+
+    return on_item
+
+def fallback_warning(result, filename=None):
+    """Avisa quando parte da documentação foi gerada pelo modelo reserva, e não pelo escolhido."""
+    chamadas = result.get('chamadas_reserva')
+    if chamadas:
+        message = t('messages.fallback_model_used', model=MODELO, count=len(chamadas), error=chamadas[0], fallback=MODELO_RESERVA)
+        st.warning(f'{message} - {filename}' if filename else message)
+
+def buttons_download(model):
     """Exibe botões para download e visualização dos dados processados."""    
-    if not df.empty and 'ReportName' in df.columns:
-        report_name = df['ReportName'].iloc[0].replace(' ', '_')
-    else:
-        report_name = "PBIReport"
+    report_name = (model.report_name or "PBIReport").replace(' ', '_')
+
+    # Guarda os relacionamentos do modelo para as exportações e o chat
+    st.session_state['df_relationships'] = model.relationships
 
     if 'button' not in st.session_state:
         st.session_state.button = True
@@ -413,36 +552,22 @@ def buttons_download(df):
 
     on = st.checkbox(t('ui.view_report_data'))
     if on:
-        st.dataframe(df)
+        show_model_data(model)
 
     verprompt_completo = st.checkbox(t('ui.show_prompt'))
     if verprompt_completo:
-        document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(df, max_tokens=MAX_TOKENS)
+        document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(model, max_tokens=MAX_TOKENS)
         prompt = generate_promt(document_text_all, t('language_name'))
         st.text_area("Prompt:", value=prompt, height=300)
 
     mostra_total_tokens = st.checkbox(t('ui.show_tokens'))
     if mostra_total_tokens:
-        document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(df, max_tokens=MAX_TOKENS)
-        total_tokens = 0
-        stringmostra = ""
-        conta_interacao= 0
-        if counttokens(document_text_all) < MAX_TOKENS:
-            conta_interacao += 1
-            total_tokens += counttokens(document_text_all)
-            stringmostra += f"{t('ui.first_interaction')}      | {t('ui.tokens_count')} {counttokens(document_text_all):,}\n"
-        else:
-            for text in dados_relatorio_PBI_medidas:
-                conta_interacao += 1
-                total_tokens += counttokens(text)
-                stringmostra += f"{conta_interacao}{t('ui.measures_interaction')}      | {t('ui.tokens_count')} {counttokens(text):,}\n"
-            for text in dados_relatorio_PBI_fontes:
-                conta_interacao += 1
-                total_tokens += counttokens(text)
-                stringmostra += f"{conta_interacao}{t('ui.sources_interaction')} | {t('ui.tokens_count')} {counttokens(text):,}\n"
-        stringmostra += f"\n{t('ui.total_interactions')} {conta_interacao}\n{t('ui.total_tokens')} {total_tokens:,} tokens.\n"
+        document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(model, max_tokens=MAX_TOKENS)
+        stringmostra = token_analysis(document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes)
         st.text_area(t('ui.token_analysis_label'), value=stringmostra, height=300)
 
+    regenerar = st.checkbox(t('ui.regenerate_all'), help=t('ui.regenerate_all_help'))
+
     colA, colB = st.columns(2)
     with colA:
         gerar_doc = st.button(t('ui.generate_doc'), disabled=st.session_state.get('show_chat', False))
@@ -450,64 +575,34 @@ def buttons_download(df):
         conversar = st.button(t('ui.chat'), disabled=st.session_state.get('show_chat', False))
 
     if gerar_doc and not st.session_state.get('show_chat', False):
-        conta_interacao = 1
         gerando = t('messages.generating_documentation')
         with st.spinner(gerando):
-            document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(df, max_tokens=MAX_TOKENS)
-            medidas_do_relatorio_df = pd.DataFrame()
-            fontes_de_dados_df = pd.DataFrame()
-            Uma = True
-            response_info = {}
-            response_tables = []
-            if counttokens(document_text_all) < MAX_TOKENS:
-                response = Documenta(defined_prompt(t('language_name')), document_text_all, MODELO, max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA)
-                conta_interacao += 1
-                if Uma and 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
-                    Uma = False
-                    response_info = response['Relatorio']
-                    response_tables = response['Tabelas_do_Relatorio']
-                response_measures = response['Medidas_do_Relatorio']
-                response_source = response['Fontes_de_Dados']
-            else:
-                for text in dados_relatorio_PBI_medidas:
-                    gerando = f"{conta_interacao}{t('ui.interaction_progress')}"
-                    with st.spinner(gerando):
-                        response = Documenta(defined_prompt_medidas(t('language_name')), text, MODELO, max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA)
-                        conta_interacao += 1
-                        if Uma and 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
-                            Uma = False
-                            response_info = response['Relatorio']
-                            response_tables = response['Tabelas_do_Relatorio']
-                        if 'Medidas_do_Relatorio'  in response:
-                            medidas_do_relatorio_df = pd.concat([medidas_do_relatorio_df, pd.DataFrame(response["Medidas_do_Relatorio"])], ignore_index=True)
-                for text in dados_relatorio_PBI_fontes:
-                    gerando = f"{conta_interacao}{t('ui.interaction_progress')}"
-                    with st.spinner(gerando):
-                        response = Documenta(defined_prompt_fontes(t('language_name')), text, MODELO, max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA)
-                        conta_interacao += 1
-                        if Uma and 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
-                            print(response)
-                            Uma = False
-                            response_info = response['Relatorio']
-                            response_tables = response['Tabelas_do_Relatorio']
-                        if 'Fontes_de_Dados' in response:
-                            fontes_de_dados_df = pd.concat([fontes_de_dados_df, pd.DataFrame(response["Fontes_de_Dados"])], ignore_index=True)
-                response_measures = medidas_do_relatorio_df.to_dict(orient='records')
-                response_source = fontes_de_dados_df.to_dict(orient='records')
-            
-            update_fonte_dados(response_source, tables_df)
-            
-            st.session_state['response_info'] = response_info
-            st.session_state['response_tables'] = response_tables
-            st.session_state['response_measures'] = response_measures
-            st.session_state['response_source'] = response_source
-            st.session_state['measures_df'] = measures_df
-            st.session_state['df_colunas'] = df_colunas
+            status_text = st.empty()
+            itens_area = st.empty()
+            try:
+                result = gerar_documentacao(model, MODELO, t('language_name'), max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA,
+                                            progress=lambda done, total: status_text.text(t('messages.chunks_documented', done=done, total=total)),
+                                            incremental=False if regenerar else None,
+                                            on_item=live_items(itens_area))
+            except Exception as e:
+                # As partes concluídas ficam gravadas (tarefas); gerar de novo envia só as que faltam
+                st.error(t('errors.documentation_interrupted', error=str(e)))
+                return
+            finally:
+                status_text.empty()
+                itens_area.empty()
+
+            for key in ('response_info', 'response_tables', 'response_measures', 'response_source', 'measures_df', 'df_colunas'):
+                st.session_state[key] = result[key]
             st.session_state.button = False
             st.session_state['doc_gerada'] = True  # <-- Seta flag após gerar documentação
             st.session_state['modelo'] = MODELO
             st.session_state.show_chat = False
             st.success(t('messages.documentation_generated'))
+            fallback_warning(result)
+            reaproveitados = result['reaproveitados']
+            if reaproveitados['medidas'] or reaproveitados['fontes']:
+                st.info(t('messages.descriptions_reused', measures=reaproveitados['medidas'], sources=reaproveitados['fontes']))
 
     if conversar and not st.session_state.get('show_chat', False):
         st.session_state.show_chat = True
@@ -516,7 +611,7 @@ def buttons_download(df):
     if st.session_state.show_chat:
         # --- Chat interface ---
         # Prepare chat prompt from the report
-        document_text_all, _, _, _, _, _ = text_to_document(df, max_tokens=MAX_TOKENS)        # Adiciona colunas ao contexto
+        document_text_all, _, _, _, _, _ = text_to_document(model, max_tokens=MAX_TOKENS)        # Adiciona colunas ao contexto
         df_colunas = st.session_state.get('df_colunas')
         if df_colunas is not None and not df_colunas.empty:
             colunas_texto = '\n'.join([
@@ -605,6 +700,13 @@ def buttons_download(df):
 
 def buttons_download_batch(all_reports_data):
     """Exibe botões para processamento e download em lote de múltiplos relatórios."""
+    # Um novo conjunto de relatórios descarta a documentação gerada para o anterior
+    batch_key = tuple(report_data['filename'] for report_data in all_reports_data)
+    if st.session_state.get('batch_key') != batch_key:
+        st.session_state['batch_key'] = batch_key
+        for key in ('batch_button', 'batch_doc_gerada', 'batch_results'):
+            st.session_state.pop(key, None)
+
     if 'batch_button' not in st.session_state:
         st.session_state.batch_button = True
     if 'batch_doc_gerada' not in st.session_state:
@@ -624,13 +726,13 @@ def buttons_download_batch(all_reports_data):
     if on:
         for idx, report_data in enumerate(all_reports_data):
             st.write(f"**{report_data['filename']}**")
-            st.dataframe(report_data['df'])
+            show_model_data(report_data['model'])
     
     verprompt_completo = st.checkbox(t('ui.show_prompt'))
     if verprompt_completo:
         for report_data in all_reports_data:
             st.write(f"**{report_data['filename']}**")
-            document_text_all, _, _, _, _, _ = text_to_document(report_data['df'], max_tokens=MAX_TOKENS)
+            document_text_all, _, _, _, _, _ = text_to_document(report_data['model'], max_tokens=MAX_TOKENS)
             prompt = generate_promt(document_text_all, t('language_name'))
             st.text_area(f"Prompt - {report_data['filename']}:", value=prompt, height=300, key=f"prompt_{report_data['filename']}")
     
@@ -638,24 +740,8 @@ def buttons_download_batch(all_reports_data):
     if mostra_total_tokens:
         for report_data in all_reports_data:
             st.write(f"**{report_data['filename']}**")
-            document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, _, _, _ = text_to_document(report_data['df'], max_tokens=MAX_TOKENS)
-            total_tokens = 0
-            stringmostra = ""
-            conta_interacao = 0
-            if counttokens(document_text_all) < MAX_TOKENS:
-                conta_interacao += 1
-                total_tokens += counttokens(document_text_all)
-                stringmostra += f"{t('ui.first_interaction')}      | {t('ui.tokens_count')} {counttokens(document_text_all):,}\n"
-            else:
-                for text in dados_relatorio_PBI_medidas:
-                    conta_interacao += 1
-                    total_tokens += counttokens(text)
-                    stringmostra += f"{conta_interacao}{t('ui.measures_interaction')}      | {t('ui.tokens_count')} {counttokens(text):,}\n"
-                for text in dados_relatorio_PBI_fontes:
-                    conta_interacao += 1
-                    total_tokens += counttokens(text)
-                    stringmostra += f"{conta_interacao}{t('ui.sources_interaction')} | {t('ui.tokens_count')} {counttokens(text):,}\n"
-            stringmostra += f"\n{t('ui.total_interactions')} {conta_interacao}\n{t('ui.total_tokens')} {total_tokens:,} tokens.\n"
+            document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, _, _, _ = text_to_document(report_data['model'], max_tokens=MAX_TOKENS)
+            stringmostra = token_analysis(document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes)
             st.text_area(f"{t('ui.token_analysis_label')} - {report_data['filename']}", value=stringmostra, height=200, key=f"tokens_{report_data['filename']}")
     
     gerar_batch = st.button(t('ui.generate_batch_docs'), disabled=st.session_state.get('batch_doc_gerada', False))
@@ -665,68 +751,26 @@ def buttons_download_batch(all_reports_data):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for idx, report_data in enumerate(all_reports_data):
-            df = report_data['df']
-            df_relationships = report_data['df_relationships']
-            filename = report_data['filename']
-            
-            status_text.text(f"{t('messages.processing_report')} {idx + 1}/{len(all_reports_data)}: {filename}")
-            progress_bar.progress(idx / len(all_reports_data))
-            
-            try:
-                conta_interacao = 1
-                document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(df, max_tokens=MAX_TOKENS)
-                medidas_do_relatorio_df = pd.DataFrame()
-                fontes_de_dados_df = pd.DataFrame()
-                Uma = True
-                response_info = {}
-                response_tables = []
-                
-                if counttokens(document_text_all) < MAX_TOKENS:
-                    response = Documenta(defined_prompt(t('language_name')), document_text_all, MODELO, max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA)
-                    conta_interacao += 1
-                    if Uma and 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
-                        Uma = False
-                        response_info = response['Relatorio']
-                        response_tables = response['Tabelas_do_Relatorio']
-                    response_measures = response['Medidas_do_Relatorio']
-                    response_source = response['Fontes_de_Dados']
-                else:
-                    for text in dados_relatorio_PBI_medidas:
-                        response = Documenta(defined_prompt_medidas(t('language_name')), text, MODELO, max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA)
-                        conta_interacao += 1
-                        if Uma and 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
-                            Uma = False
-                            response_info = response['Relatorio']
-                            response_tables = response['Tabelas_do_Relatorio']
-                        if 'Medidas_do_Relatorio' in response:
-                            medidas_do_relatorio_df = pd.concat([medidas_do_relatorio_df, pd.DataFrame(response["Medidas_do_Relatorio"])], ignore_index=True)
-                    for text in dados_relatorio_PBI_fontes:
-                        response = Documenta(defined_prompt_fontes(t('language_name')), text, MODELO, max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA)
-                        conta_interacao += 1
-                        if Uma and 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
-                            Uma = False
-                            response_info = response['Relatorio']
-                            response_tables = response['Tabelas_do_Relatorio']
-                        if 'Fontes_de_Dados' in response:
-                            fontes_de_dados_df = pd.concat([fontes_de_dados_df, pd.DataFrame(response["Fontes_de_Dados"])], ignore_index=True)
-                    response_measures = medidas_do_relatorio_df.to_dict(orient='records')
-                    response_source = fontes_de_dados_df.to_dict(orient='records')
-                
-                update_fonte_dados(response_source, tables_df)
-                
-                st.session_state['batch_results'].append({
-                    'filename': filename,
-                    'response_info': response_info,
-                    'response_tables': response_tables,
-                    'response_measures': response_measures,
-                    'response_source': response_source,
-                    'measures_df': measures_df,
-                    'df_relationships': df_relationships,
-                    'df_colunas': df_colunas
-                })
-            except Exception as e:
-                st.error(f"{t('errors.processing_error', error=str(e))} - {filename}")
+        # O nome do idioma é resolvido aqui, pois as threads não têm acesso à sessão do Streamlit
+        language_name = t('language_name')
+        results_by_index = {}
+        done = 0
+        status_text.text(f"{t('messages.processing_report')} 0/{len(all_reports_data)}")
+        for idx, result in gerar_documentacao_lote([report_data['model'] for report_data in all_reports_data], MODELO, language_name,
+                                                   max_tokens=MAX_TOKENS, max_tokens_saida=MAX_TOKENS_SAIDA):
+            done += 1
+            filename = all_reports_data[idx]['filename']
+            status_text.text(f"{t('messages.processing_report')} {done}/{len(all_reports_data)}: {filename}")
+            progress_bar.progress(done / len(all_reports_data))
+
+            if isinstance(result, Exception):
+                st.error(f"{t('errors.processing_error', error=str(result))} - {filename}")
+            else:
+                results_by_index[idx] = {'filename': filename, **result}
+                fallback_warning(result, filename)
+
+        # Mantém a ordem original dos relatórios
+        st.session_state['batch_results'] = [results_by_index[idx] for idx in sorted(results_by_index)]
         
         progress_bar.progress(1.0)
         status_text.empty()
@@ -861,6 +905,22 @@ def buttons_download_batch(all_reports_data):
                         )
 
         
+def llm_cache_panel():
+    """Mostra os acertos e erros do cache de respostas do LLM e permite esvaziá-lo."""
+    stats = cache_llm.stats()
+    if not (stats['hits'] or stats['misses'] or stats['entries']):
+        return
+    with st.expander(t('ui.llm_cache')):
+        col1, col2, col3 = st.columns(3)
+        col1.metric(t('ui.llm_cache_hits'), stats['hits'])
+        col2.metric(t('ui.llm_cache_misses'), stats['misses'])
+        col3.metric(t('ui.llm_cache_entries'), stats['entries'], help=f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+        if st.button(t('ui.llm_cache_clear'), help=t('ui.llm_cache_clear_help')):
+            # As partes gravadas de gerações interrompidas também são descartadas
+            tarefas.invalidate()
+            st.success(t('messages.llm_cache_cleared', count=cache_llm.invalidate()))
+
+
 def main():    
     """Função principal do aplicativo, onde todas as funções são chamadas."""        
     configure_app()
@@ -876,11 +936,28 @@ def main():
     if app_id and tenant_id and secret_value:
         headers = get_token(app_id, tenant_id, secret_value)
         if headers:
-            main_content(headers, None)
+            main_content(headers, None, tenant_id)
+
+            api_metrics = get_http_metrics()
+            if not api_metrics.empty:
+                with st.expander(t('ui.api_metrics')):
+                    st.dataframe(api_metrics, hide_index=True)
     
     if uploaded_files:
         main_content(None, uploaded_files)
 
+    llm_cache_panel()
+
+    llm_metrics = get_limiter_metrics()
+    if not llm_metrics.empty:
+        with st.expander(t('ui.llm_rate_limits')):
+            st.dataframe(llm_metrics, hide_index=True)
+
+    parse_metrics = get_parse_metrics()
+    if not parse_metrics.empty:
+        with st.expander(t('ui.llm_parse_metrics')):
+            st.dataframe(parse_metrics, hide_index=True)
+
     if 'show_description' not in st.session_state:
         st.session_state.show_description = False
 
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from relatorio import CACHE_DIR
+
+# Cache persistente das respostas do LLM, endereçado pelo hash de (modelo, temperatura,
+# max_tokens, mensagens e, quando há, o esquema da resposta). Guarda o JSON já interpretado, então gerar de novo a documentação
+# de um relatório sem alterações não repete nenhuma chamada.
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE', '1') != '0'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(CACHE_DIR, 'llm_cache.sqlite'))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv('LLM_CACHE_MAX_AGE_DAYS', 30))
+# A limpeza por idade e tamanho roda a cada tantas gravações
+_EVICT_EVERY = 50
+
+_local = threading.local()
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_puts = 0  # protegido por _stats_lock
+
+def _connection():
+    """Conexão SQLite da thread atual (o sqlite3 não compartilha conexões entre threads)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(LLM_CACHE_PATH)), exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                            key TEXT PRIMARY KEY,
+                            model TEXT NOT NULL,
+                            response TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            used_at REAL NOT NULL)""")
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_used_at ON responses (used_at)')
+        _local.conn = conn
+    return conn
+
+def cache_key(model, temperature, max_tokens, messages, schema=None):
+    # Sem esquema a chave é a mesma de antes dele existir, preservando as respostas guardadas
+    key = [model, temperature, max_tokens, messages] + ([schema] if schema is not None else [])
+    payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _count(kind):
+    with _stats_lock:
+        _stats[kind] += 1
+
+def get(model, temperature, max_tokens, messages, schema=None):
+    """Retorna a resposta guardada para a chamada ou None."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    key = cache_key(model, temperature, max_tokens, messages, schema)
+    try:
+        conn = _connection()
+        row = conn.execute('SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or time.time() - row[1] > LLM_CACHE_MAX_AGE_DAYS * 86400:
+            _count('misses')
+            return None
+        with conn:
+            conn.execute('UPDATE responses SET used_at = ? WHERE key = ?', (time.time(), key))
+    except sqlite3.Error:
+        _count('misses')
+        return None
+    _count('hits')
+    return json.loads(row[0])
+
+def put(model, temperature, max_tokens, messages, response, schema=None):
+    """Guarda a resposta interpretada da chamada."""
+    global _puts
+    if not LLM_CACHE_ENABLED:
+        return
+    data = json.dumps(response, ensure_ascii=False)
+    now = time.time()
+    try:
+        conn = _connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO responses (key, model, response, size, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)',
+                         (cache_key(model, temperature, max_tokens, messages, schema), model, data, len(data.encode('utf-8')), now, now))
+        with _stats_lock:
+            _puts += 1
+            due = _puts % _EVICT_EVERY == 0
+        if due:
+            evict()
+    except sqlite3.Error:
+        # O cache é só uma otimização; uma falha ao gravar não interrompe a documentação
+        pass
+
+def evict():
+    """Remove as respostas vencidas e, acima do limite de tamanho, as usadas há mais tempo."""
+    conn = _connection()
+    with conn:
+        conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - LLM_CACHE_MAX_AGE_DAYS * 86400,))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total > LLM_CACHE_MAX_BYTES:
+            excess = total - LLM_CACHE_MAX_BYTES
+            removed = 0
+            keys = []
+            for key, size in conn.execute('SELECT key, size FROM responses ORDER BY used_at'):
+                if removed >= excess:
+                    break
+                keys.append((key,))
+                removed += size
+            conn.executemany('DELETE FROM responses WHERE key = ?', keys)
+
+def invalidate(model=None):
+    """Apaga as respostas guardadas (todas ou só as do modelo informado). Retorna quantas foram apagadas."""
+    conn = _connection()
+    with conn:
+        if model is None:
+            return conn.execute('DELETE FROM responses').rowcount
+        return conn.execute('DELETE FROM responses WHERE model = ?', (model,)).rowcount
+
+def stats():
+    """Acertos e erros do processo, mais a quantidade e o tamanho das respostas guardadas."""
+    with _stats_lock:
+        result = dict(_stats)
+    try:
+        entries, size = _connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+    except sqlite3.Error:
+        entries, size = 0, 0
+    result['entries'] = entries
+    result['bytes'] = size
+    return result
@@ -0,0 +1,176 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from relatorio import (CACHE_DIR, ModelSnapshot, child_frame, get_modified_workspaces, get_workspaces_id,
+                       scan_workspaces, snapshots_from_datasets, tables_frame)
+
+# Catálogo local dos metadados escaneados, usado para atualizações incrementais do tenant
+CATALOG_PATH = os.getenv('AUTODOC_CATALOG', os.path.join(CACHE_DIR, 'catalog.sqlite'))
+
+# A API de workspaces modificadas só aceita datas dos últimos 30 dias
+MODIFIED_SINCE_MAX_AGE = timedelta(days=30)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_runs (
+    tenant TEXT PRIMARY KEY,
+    last_scan TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workspaces (
+    id TEXT PRIMARY KEY,
+    tenant TEXT,
+    name TEXT,
+    scanned_at TEXT
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    id TEXT PRIMARY KEY,
+    workspace_id TEXT NOT NULL,
+    name TEXT,
+    configured_by TEXT,
+    content_provider_type TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_datasets_workspace ON datasets (workspace_id);
+CREATE INDEX IF NOT EXISTS ix_datasets_name ON datasets (name);
+CREATE TABLE IF NOT EXISTS tables (
+    dataset_id TEXT NOT NULL,
+    table_key INTEGER NOT NULL,
+    name TEXT,
+    storage_mode TEXT,
+    source TEXT,
+    PRIMARY KEY (dataset_id, table_key)
+);
+CREATE TABLE IF NOT EXISTS measures (
+    dataset_id TEXT NOT NULL,
+    table_key INTEGER NOT NULL,
+    name TEXT,
+    expression TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_measures_dataset ON measures (dataset_id);
+CREATE TABLE IF NOT EXISTS columns (
+    dataset_id TEXT NOT NULL,
+    table_key INTEGER NOT NULL,
+    name TEXT,
+    data_type TEXT,
+    column_type TEXT,
+    expression TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_columns_dataset ON columns (dataset_id);
+"""
+
+def connect(path=None):
+    """Abre (e cria, se necessário) o catálogo SQLite."""
+    path = path or CATALOG_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _delete_workspace_datasets(conn, workspace_id):
+    dataset_ids = [row[0] for row in conn.execute('SELECT id FROM datasets WHERE workspace_id = ?', (workspace_id,))]
+    for table in ('tables', 'measures', 'columns'):
+        conn.executemany(f'DELETE FROM {table} WHERE dataset_id = ?', [(dataset_id,) for dataset_id in dataset_ids])
+    conn.execute('DELETE FROM datasets WHERE workspace_id = ?', (workspace_id,))
+
+def _rows(dataset_id, df, columns):
+    # Converte NaN/NA do pandas em NULL do SQLite
+    values = df[['TableKey'] + columns].astype(object).where(df[['TableKey'] + columns].notna(), None)
+    return [(dataset_id, int(row[0]), *row[1:]) for row in values.itertuples(index=False, name=None)]
+
+def merge_workspace(conn, tenant_id, workspace, scanned_at):
+    """Substitui no catálogo os datasets da workspace pelo resultado do escaneamento."""
+    with conn:
+        _delete_workspace_datasets(conn, workspace['id'])
+        conn.execute('INSERT OR REPLACE INTO workspaces (id, tenant, name, scanned_at) VALUES (?, ?, ?, ?)',
+                     (workspace['id'], tenant_id, workspace.get('name'), scanned_at))
+
+        datasets = workspace.get('datasets', [])
+        for dataset, model in zip(datasets, snapshots_from_datasets(datasets)):
+            conn.execute('INSERT OR REPLACE INTO datasets (id, workspace_id, name, configured_by, content_provider_type) VALUES (?, ?, ?, ?, ?)',
+                         (dataset['id'], workspace['id'], dataset.get('name'), dataset.get('configuredBy'), dataset.get('contentProviderType')))
+
+            conn.executemany('INSERT INTO tables (dataset_id, table_key, name, storage_mode, source) VALUES (?, ?, ?, ?, ?)',
+                             _rows(dataset['id'], model.tables.astype({'NomeTabela': str}), ['NomeTabela', 'storageMode', 'FonteDados']))
+            conn.executemany('INSERT INTO measures (dataset_id, table_key, name, expression) VALUES (?, ?, ?, ?)',
+                             _rows(dataset['id'], model.measures, ['NomeMedida', 'ExpressaoMedida']))
+            conn.executemany('INSERT INTO columns (dataset_id, table_key, name, data_type, column_type, expression) VALUES (?, ?, ?, ?, ?, ?)',
+                             _rows(dataset['id'], model.columns, ['NomeColuna', 'TipoDadoColuna', 'TipoColuna', 'ExpressaoColuna']))
+
+def load_model(conn, dataset_id):
+    """Reconstrói o ModelSnapshot de um dataset a partir do catálogo."""
+    dataset = conn.execute('SELECT name, configured_by FROM datasets WHERE id = ?', (dataset_id,)).fetchone()
+    if dataset is None:
+        return None
+
+    tables = pd.read_sql_query('SELECT name, source, storage_mode FROM tables WHERE dataset_id = ? ORDER BY table_key', conn, params=(dataset_id,))
+    measures = pd.read_sql_query('SELECT table_key, name, expression FROM measures WHERE dataset_id = ? ORDER BY rowid', conn, params=(dataset_id,))
+    columns = pd.read_sql_query('SELECT table_key, name, data_type, column_type, expression FROM columns WHERE dataset_id = ? ORDER BY rowid', conn, params=(dataset_id,))
+
+    return ModelSnapshot(
+        tables=tables_frame(tables['name'].tolist(), tables['source'].tolist(), tables['storage_mode'].tolist()),
+        measures=child_frame(measures['table_key'].tolist(), NomeMedida=measures['name'], ExpressaoMedida=measures['expression']),
+        columns=child_frame(columns['table_key'].tolist(), NomeColuna=columns['name'], TipoDadoColuna=columns['data_type'],
+                             TipoColuna=columns['column_type'], ExpressaoColuna=columns['expression']),
+        report_name=dataset[0] or 'PBIReport',
+        dataset_id=dataset_id,
+        configured_by=dataset[1]
+    )
+
+def list_datasets(conn, tenant_id=None):
+    """Lista os datasets do catálogo com a workspace de origem."""
+    query = """SELECT d.id AS dataset_id, d.name AS dataset_name, w.name AS workspace_name, d.content_provider_type, w.scanned_at
+               FROM datasets d JOIN workspaces w ON w.id = d.workspace_id"""
+    params = ()
+    if tenant_id is not None:
+        query += ' WHERE w.tenant = ?'
+        params = (tenant_id,)
+    return pd.read_sql_query(query + ' ORDER BY w.name, d.name', conn, params=params)
+
+def incremental_scan(headers, tenant_id, conn=None, progress=None):
+    """Atualiza o catálogo escaneando apenas as workspaces alteradas desde a última execução.
+
+    Na primeira execução (ou se a última tiver mais de 30 dias) todas as workspaces do
+    tenant são escaneadas. 'progress', se informado, recebe (concluídas, total) a cada lote.
+    Retorna (quantidade de workspaces atualizadas, lista de erros).
+    """
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        started_at = datetime.now(timezone.utc)
+        row = conn.execute('SELECT last_scan FROM scan_runs WHERE tenant = ?', (tenant_id,)).fetchone()
+        last_scan = datetime.fromisoformat(row[0]) if row else None
+
+        if last_scan is not None and started_at - last_scan < MODIFIED_SINCE_MAX_AGE:
+            workspace_ids = get_modified_workspaces(headers, last_scan)
+        else:
+            workspaces = get_workspaces_id(headers, tenant_id, refresh=True)
+            workspace_ids = list(workspaces) if workspaces is not None else None
+
+        # Sem a listagem das workspaces não há o que escanear, e a marca de tempo não avança
+        if workspace_ids is None:
+            return 0, ['Não foi possível listar as workspaces do tenant']
+
+        updated, errors = 0, []
+        done = 0
+        for batch, result in scan_workspaces(headers, workspace_ids):
+            done += len(batch)
+            if isinstance(result, Exception):
+                errors.append(str(result))
+            else:
+                for workspace in result.get('workspaces', []):
+                    merge_workspace(conn, tenant_id, workspace, started_at.isoformat())
+                    updated += 1
+            if progress:
+                progress(done, len(workspace_ids))
+
+        # Só avança a marca de tempo se todos os lotes foram escaneados
+        if not errors:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO scan_runs (tenant, last_scan) VALUES (?, ?)',
+                             (tenant_id, started_at.isoformat()))
+        return updated, errors
+    finally:
+        if own_conn:
+            conn.close()
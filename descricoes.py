@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from relatorio import CACHE_DIR
+
+# Acervo das últimas descrições geradas para cada medida e fonte de dados, por idioma.
+# Cada item é endereçado pelo hash do nome e da expressão (ou da fonte, no caso das tabelas),
+# então ao documentar de novo um modelo só os itens novos ou alterados vão para o LLM.
+DOC_STORE_PATH = os.getenv('DOC_STORE_PATH', os.path.join(CACHE_DIR, 'descricoes.sqlite'))
+INCREMENTAL_DOCS = os.getenv('INCREMENTAL_DOCS', '1') != '0'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS descriptions (
+    kind TEXT NOT NULL,
+    language TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    name TEXT,
+    item TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, language, item_key)
+);
+"""
+
+def connect(path=None):
+    """Abre (e cria, se necessário) o acervo de descrições."""
+    path = path or DOC_STORE_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def item_key(*parts):
+    """Hash do conteúdo que define um item (ex.: nome e expressão da medida)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8', 'surrogatepass'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+def lookup(conn, kind, language, keys):
+    """Retorna {chave: item} das descrições guardadas para as chaves informadas."""
+    found = {}
+    keys = list(dict.fromkeys(keys))
+    # O SQLite limita a quantidade de parâmetros por consulta
+    for start in range(0, len(keys), 500):
+        batch = keys[start:start + 500]
+        rows = conn.execute(f"SELECT item_key, item FROM descriptions WHERE kind = ? AND language = ? AND item_key IN ({','.join('?' * len(batch))})",
+                            [kind, language, *batch])
+        found.update((key, json.loads(item)) for key, item in rows)
+    return found
+
+def save(conn, kind, language, items):
+    """Guarda as descrições geradas; 'items' é uma lista de (chave, nome, item)."""
+    now = time.time()
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO descriptions (kind, language, item_key, name, item, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                         [(kind, language, key, name, json.dumps(item, ensure_ascii=False), now) for key, name, item in items])
+
+def invalidate(conn, language=None):
+    """Apaga as descrições guardadas (todas ou só as do idioma informado)."""
+    with conn:
+        if language is None:
+            return conn.execute('DELETE FROM descriptions').rowcount
+        return conn.execute('DELETE FROM descriptions WHERE language = ?', (language,)).rowcount
@@ -1,5 +1,6 @@
 import json
-from litellm import completion
+from litellm import (completion, acompletion, APIConnectionError, BadGatewayError, InternalServerError, ServiceUnavailableError,
+                     Timeout)
 import pandas as pd
 import io
 from docx import Document
@@ -8,9 +9,46 @@ from docx.shared import Pt, Inches, RGBColor
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from datetime import date, datetime
-import tiktoken
+from tokenizador import count_tokens, count_tokens_batch
+import cache_llm
+import descricoes
+import limitador
+from extrator_json import JSONItemExtractor, repair_json
+import esquemas
+import tarefas
+import os
+import asyncio
+import threading
+import contextvars
+from dataclasses import dataclass
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from i18n import translate_to_language
 
+# Limite global de chamadas simultâneas ao LLM, compartilhado por todas as sessões do processo
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+_llm_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Partes (medidas/fontes) de um mesmo relatório enviadas ao mesmo tempo pelo motor assíncrono
+LLM_ASYNC_CONCURRENCY = int(os.getenv('LLM_ASYNC_CONCURRENCY', 8))
+
+# Respostas recebidas em streaming: cada medida/fonte é repassada assim que o seu objeto fecha.
+# Se a resposta for cortada pelo limite de tokens de saída, só os itens que não chegaram
+# completos são pedidos de novo, em até LLM_TRUNCATION_RETRIES rodadas.
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') != '0'
+LLM_TRUNCATION_RETRIES = int(os.getenv('LLM_TRUNCATION_RETRIES', 3))
+ARRAYS_ITENS = ('Medidas_do_Relatorio', 'Fontes_de_Dados')
+# Modelo chamado quando o provedor do modelo escolhido está indisponível (erros 5xx, de conexão
+# ou de tempo esgotado). Os demais erros sobem ao chamador: um 429 já foi esperado e repetido pelo
+# limitador, e uma resposta não interpretável ou uma requisição inválida não se resolvem trocando
+# de modelo em silêncio.
+MODELO_RESERVA = 'groq/meta-llama/llama-4-scout-17b-16e-instruct'
+ERROS_PROVEDOR = (ServiceUnavailableError, InternalServerError, BadGatewayError, APIConnectionError, Timeout)
+# Erros que levaram ao modelo reserva na geração em andamento (ver gerar_documentacao)
+_chamadas_reserva = contextvars.ContextVar('chamadas_reserva', default=None)
+# Temperatura enviada em todas as chamadas de documentação; faz parte da chave do cache_llm
+LLM_TEMPERATURE = 0
+
 # Funções de definição dos Prompts para a medida e fontes dos dados
 
 def defined_prompt(language_name="🇧🇷 Portuguese"):
@@ -256,85 +294,619 @@ Abaixo estão dados do relatório do Power BI a ser documentado:"""
 def split_by_tag(text):
     return [t for t in text.split("<tag>") if t != '' and ' ']
 
-def chunk_text_by_tag(text, max_tokens):
-    """Splits text by <tag> and groups segments into chunks within max_tokens."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    segments = split_by_tag(text)
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
-    for segment in segments:
-        seg_tokens = len(encoding.encode(segment))
-        if current_chunk and current_tokens + seg_tokens > max_tokens:
-            chunks.append(current_chunk)
-            current_chunk = segment
-            current_tokens = seg_tokens
+# Modo de agrupamento dos trechos: 'ffd' (first-fit decreasing, menos chamadas ao LLM) ou
+# 'ordered' (guloso na ordem original)
+CHUNK_PACKING = os.getenv('CHUNK_PACKING', 'ffd')
+
+@dataclass
+class ChunkPlan:
+    """Resultado do agrupamento dos trechos: os textos de cada chamada e os tokens de cada um."""
+    chunks: list
+    token_counts: list
+    max_tokens: int
+    mode: str
+
+    @property
+    def calls(self):
+        return len(self.chunks)
+
+    @property
+    def fill_ratios(self):
+        return [tokens / self.max_tokens for tokens in self.token_counts] if self.max_tokens else []
+
+def _pack_ordered(seg_tokens, max_tokens):
+    bins = []
+    current, current_tokens = [], 0
+    for i, tokens in enumerate(seg_tokens):
+        if current and current_tokens + tokens > max_tokens:
+            bins.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        bins.append(current)
+    return bins
+
+def _pack_ffd(seg_tokens, max_tokens):
+    # Os maiores trechos entram primeiro, cada um no primeiro grupo em que ainda couber
+    bins, free = [], []
+    for i in sorted(range(len(seg_tokens)), key=lambda i: -seg_tokens[i]):
+        tokens = seg_tokens[i]
+        for b, space in enumerate(free):
+            if tokens <= space:
+                bins[b].append(i)
+                free[b] -= tokens
+                break
         else:
-            current_chunk += segment
-            current_tokens += seg_tokens
-    if current_chunk:
-        chunks.append(current_chunk)
-    return chunks
+            bins.append([i])
+            free.append(max_tokens - tokens)
+    # Dentro de cada grupo, e entre os grupos, mantém a ordem original dos trechos
+    return sorted((sorted(b) for b in bins), key=lambda b: b[0])
+
+def plan_chunks(segments, max_tokens, mode=None):
+    """Agrupa os trechos em chamadas de até max_tokens tokens.
+
+    Um trecho maior que max_tokens fica sozinho na sua chamada.
+    """
+    mode = mode or CHUNK_PACKING
+    seg_tokens = count_tokens_batch(segments)
+    pack = _pack_ffd if mode == 'ffd' else _pack_ordered
+    bins = pack(seg_tokens, max_tokens)
+    return ChunkPlan(
+        chunks=[''.join(segments[i] for i in b) for b in bins],
+        token_counts=[sum(seg_tokens[i] for i in b) for b in bins],
+        max_tokens=max_tokens,
+        mode=mode
+    )
+
+def chunk_text_by_tag(text, max_tokens, mode=None):
+    """Splits text by <tag> and groups segments into chunks within max_tokens."""
+    return plan_chunks(split_by_tag(text), max_tokens, mode).chunks
 
-def client_chat_LiteLLM(modelo, messages, maxtokens=4096):    
+def parse_model_response(model_response, repair=True):
+    """Converte o texto retornado pelo modelo em JSON.
+
+    Se o texto não for um JSON válido e 'repair' for verdadeiro, tenta de novo após
+    repair_json (texto em volta do JSON, vírgulas sobrando, strings e chaves não fechadas).
+    """
+    #remove the ```json and ``` from the response
+    model_response = model_response.replace('```json', '').replace('```', '').replace('```JSON', '')
+    try:
+        return json.loads(model_response)
+    except ValueError:
+        if not repair:
+            raise
+        return json.loads(repair_json(model_response))
+
+def _interpreta_resposta(modelo, structured, text, finish_reason=None):
+    """Interpreta a resposta, registrando em esquemas se ela veio válida, reparada, truncada ou com falha.
+
+    Retorna None para uma resposta cortada pelo limite de tokens de saída, que não deve ser
+    reparada (o reparo fecharia o JSON e esconderia os itens que faltam).
+    """
+    try:
+        response_content = parse_model_response(text, repair=False)
+    except ValueError:
+        if finish_reason == 'length':
+            esquemas.record_parse(modelo, structured, 'truncada')
+            return None
+        try:
+            response_content = parse_model_response(text)
+        except ValueError:
+            esquemas.record_parse(modelo, structured, 'falha')
+            raise
+        esquemas.record_parse(modelo, structured, 'reparada')
+        return response_content
+    esquemas.record_parse(modelo, structured, 'ok')
+    return response_content
+
+def client_chat_LiteLLM(modelo, messages, maxtokens=4096, esquema=None):    
     """Interage com qualquer modelo unsando LiteLLM para obter respostas.
        Mais informações em: https://docs.litellm.ai/docs/providers
+       'esquema' é o nome (esquemas.ESQUEMAS) do formato da resposta pedida pelo prompt.
     """    
-    count = 1
+    cached = cache_llm.get(modelo, LLM_TEMPERATURE, maxtokens, messages, esquema)
+    if cached is not None:
+        return cached
+
+    formato = esquemas.response_format(modelo, esquema)
+    extra = {'response_format': formato} if formato else {}
+
     try:
-        response = completion(
+        response = limitador.chamar(modelo, messages, maxtokens, lambda: completion(
             model=modelo,
-            temperature=0,
+            temperature=LLM_TEMPERATURE,
             max_tokens=maxtokens,
-            messages=messages
-        )
+            messages=messages,
+            **extra
+        ))
         
         model_response = response.choices[0].message.content
         
-        #remove the ```json and ``` from the response
-        model_response = model_response.replace('```json', '').replace('```', '').replace('```JSON', '')
-        
         #save the response to a file for debugging wih timestamp
         #timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")                
         #with open('response_' + timestamp + '_' +  modelo.replace('/', '_') + '.json', 'w', encoding='utf-8') as f:        
         #    f.write(model_response)
         
-        response_content = json.loads( model_response )
-
-        count += 1
-    except Exception as e:
-        print(f"Erro ao chamar a API do modelo: {modelo}, corrigindo automaticamente executando o modelo gpt-4.1-nano da Open AI. {str(e)}. Tentativa:", count)
-
-        response = completion(
-            model='groq/meta-llama/llama-4-scout-17b-16e-instruct',
-            temperature=0,
+        response_content = _interpreta_resposta(modelo, formato is not None, model_response)
+        cache_llm.put(modelo, LLM_TEMPERATURE, maxtokens, messages, response_content, esquema)
+    except ERROS_PROVEDOR as e:
+        _registra_reserva(modelo, e)
+        response = limitador.chamar(MODELO_RESERVA, messages, maxtokens, lambda: completion(
+            model=MODELO_RESERVA,
+            temperature=LLM_TEMPERATURE,
             max_tokens=maxtokens,
             messages=messages
-        )
-        response_content = json.loads( response.choices[0].message.content )
-        count += 1
-        print(f"Modelo groq/meta-llama/llama-4-scout-17b-16e-instruct da Meta executado com sucesso.")
-        if count > 10:
-            print(f"Erro ao chamar a API {str(e)}")
-            raise Exception(f"Erro ao chamar a API {str(e)}")
-        
-        
+        ))
+        response_content = parse_model_response(response.choices[0].message.content)
+        print(f"Modelo reserva {MODELO_RESERVA} executado com sucesso.")
+
     return response_content
 
-def Documenta(prompt, text, modelo, max_tokens=4096, max_tokens_saida=4096):
-    """Gera a documentação do relatório em formato JSON."""
-    
-    messages = [
+def _registra_reserva(modelo, erro):
+    print(f"Provedor do modelo {modelo} indisponível ({erro}); usando o modelo reserva {MODELO_RESERVA}.")
+    chamadas = _chamadas_reserva.get()
+    if chamadas is not None:
+        chamadas.append(f'{modelo}: {erro}')
+
+class RespostaTruncada(dict):
+    """Resposta cortada pelo limite de tokens de saída, só com os valores e itens que chegaram completos."""
+
+def _itens_unicos(on_item):
+    """Envolve on_item para que cada medida ou fonte seja repassada uma única vez.
+
+    Uma parte refeita (nova tentativa, modelo reserva após uma resposta interrompida no meio
+    do streaming ou parte retomada de uma tarefa) reenvia os itens que já tinham chegado.
+    """
+    if on_item is None:
+        return None
+    vistos = set()
+
+    def repassa(array, item):
+        nome = _nome_fonte(item) if array == 'Fontes_de_Dados' else _nome_medida(item)
+        if nome is not None:
+            if (array, nome) in vistos:
+                return
+            vistos.add((array, nome))
+        on_item(array, item)
+    return repassa
+
+def _emite_itens(response, on_item):
+    if on_item:
+        for array in ARRAYS_ITENS:
+            for item in response.get(array, []):
+                on_item(array, item)
+
+async def _acompletion_texto(modelo, messages, maxtokens, on_item, formato=None):
+    """Chama o modelo e retorna o texto, o finish_reason e o consumo de tokens da resposta.
+
+    Em streaming, cada item completo dos arrays de ARRAYS_ITENS é repassado a on_item
+    enquanto o restante da resposta ainda está chegando. 'formato' é o response_format
+    (esquema JSON) a enviar, quando o modelo aceita saída estruturada.
+    """
+    extra = {'response_format': formato} if formato else {}
+    if not LLM_STREAMING:
+        response = await acompletion(model=modelo, temperature=LLM_TEMPERATURE, max_tokens=maxtokens, messages=messages, **extra)
+        choice = response.choices[0]
+        return SimpleNamespace(text=choice.message.content, finish_reason=getattr(choice, 'finish_reason', None),
+                               usage=getattr(response, 'usage', None), streamed=False)
+
+    extractor = JSONItemExtractor(ARRAYS_ITENS)
+    finish_reason = None
+    stream = await acompletion(model=modelo, temperature=LLM_TEMPERATURE, max_tokens=maxtokens, messages=messages, stream=True, **extra)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = getattr(choice.delta, 'content', None)
+        if delta:
+            for array, item in extractor.feed(delta):
+                if on_item:
+                    on_item(array, item)
+        finish_reason = choice.finish_reason or finish_reason
+    # O streaming não traz o consumo; a estimativa serve para ajustar a reserva do limitador
+    usage = SimpleNamespace(total_tokens=limitador.estimate_tokens(messages, 0) + count_tokens(extractor.text))
+    return SimpleNamespace(text=extractor.text, finish_reason=finish_reason, usage=usage, streamed=True)
+
+async def _chama_modelo_async(modelo, messages, maxtokens, on_item, esquema):
+    """Chama o modelo e interpreta a resposta; retorna (conteúdo, cortada).
+
+    Uma resposta cortada pelo limite de tokens de saída volta como RespostaTruncada, só com
+    o que chegou completo. Os itens são repassados a on_item conforme chegam.
+    """
+    formato = esquemas.response_format(modelo, esquema)
+    response = await limitador.chamar_async(modelo, messages, maxtokens, lambda: _acompletion_texto(modelo, messages, maxtokens, on_item, formato))
+    response_content = _interpreta_resposta(modelo, formato is not None, response.text, response.finish_reason)
+    if response_content is None:
+        print(f"Resposta do modelo {modelo} cortada pelo limite de {maxtokens} tokens de saída; os itens incompletos serão pedidos de novo.")
+        extractor = JSONItemExtractor(ARRAYS_ITENS)
+        extractor.feed(response.text)
+        response_content = RespostaTruncada(extractor.partial())
+    if not response.streamed:
+        _emite_itens(response_content, on_item)
+    return response_content, isinstance(response_content, RespostaTruncada)
+
+async def client_chat_LiteLLM_async(modelo, messages, maxtokens=4096, on_item=None, use_cache=True, esquema=None):
+    """Versão assíncrona de client_chat_LiteLLM, usando litellm.acompletion.
+
+    'on_item', se informado, recebe (array, item) para cada medida ou fonte documentada, assim
+    que ela chega. Uma resposta cortada pelo limite de tokens de saída volta como
+    RespostaTruncada, com o que chegou completo, e não é guardada no cache. O modelo reserva
+    (MODELO_RESERVA), usado só quando o provedor está indisponível (ERROS_PROVEDOR), passa pelo
+    mesmo streaming e tratamento de respostas cortadas.
+
+    Com use_cache=False o cache_llm não é consultado e o modelo é sempre chamado; a resposta
+    nova substitui a guardada. 'esquema' é o nome (esquemas.ESQUEMAS) do formato da resposta.
+    """
+    cached = cache_llm.get(modelo, LLM_TEMPERATURE, maxtokens, messages, esquema) if use_cache else None
+    if cached is not None:
+        _emite_itens(cached, on_item)
+        return cached
+
+    try:
+        response_content, truncada = await _chama_modelo_async(modelo, messages, maxtokens, on_item, esquema)
+        if not truncada:
+            cache_llm.put(modelo, LLM_TEMPERATURE, maxtokens, messages, response_content, esquema)
+        return response_content
+    except ERROS_PROVEDOR as e:
+        _registra_reserva(modelo, e)
+        response_content, _ = await _chama_modelo_async(MODELO_RESERVA, messages, maxtokens, on_item, esquema)
+        return response_content
+
+def documenta_messages(prompt, text):
+    return [
         {"role": "system", "content": "Você é um documentador especializado em relatórios do Power BI."},
         {"role": "user", "content": f"{prompt}\n<INICIO DADOS RELATORIO POWER BI>\n{text}\n<FIM DADOS RELATORIO POWER BI>"}
     ]
+
+def Documenta(prompt, text, modelo, max_tokens=4096, max_tokens_saida=4096, esquema=None):
+    """Gera a documentação do relatório em formato JSON."""
+    
+    messages = documenta_messages(prompt, text)
     
     print('Usando o modelo:', modelo, 'Máximo de tokens de saída:', max_tokens_saida)
     
-    response = client_chat_LiteLLM(modelo, messages, max_tokens_saida)
+    with _llm_semaphore:
+        response = client_chat_LiteLLM(modelo, messages, max_tokens_saida, esquema)
         
     return response
 
+async def DocumentaAsync(prompt, text, modelo, max_tokens=4096, max_tokens_saida=4096, on_item=None, use_cache=True, esquema=None):
+    """Versão assíncrona de Documenta, respeitando o mesmo limite global de chamadas."""
+    messages = documenta_messages(prompt, text)
+
+    print('Usando o modelo:', modelo, 'Máximo de tokens de saída:', max_tokens_saida)
+
+    # O semáforo global é de threads; a espera acontece fora do loop de eventos
+    await asyncio.to_thread(_llm_semaphore.acquire)
+    try:
+        return await client_chat_LiteLLM_async(modelo, messages, max_tokens_saida, on_item, use_cache, esquema)
+    finally:
+        _llm_semaphore.release()
+
+async def _documenta_partes(partes, modelo, max_tokens, max_tokens_saida, concurrency, progress, on_item, conn, use_cache):
+    semaphore = asyncio.Semaphore(concurrency)
+    job = None
+    prontas = {}
+    if conn is not None:
+        job = tarefas.job_id(modelo, max_tokens_saida, partes)
+        prontas = tarefas.start_job(conn, job, modelo, len(partes))
+        if prontas:
+            print('Retomando a tarefa', job[:12], '-', len(prontas), 'de', len(partes), 'partes já concluídas')
+    done = len(prontas)
+    if done and progress:
+        progress(done, len(partes))
+
+    async def documenta_parte(idx, prompt, text, esquema=None):
+        nonlocal done
+        if idx in prontas:
+            response, truncada = prontas[idx]
+            response = RespostaTruncada(response) if truncada else response
+            _emite_itens(response, on_item)
+            return response
+        # Uma parte que falha é repetida sozinha, sem afetar as demais
+        for tentativa in range(tarefas.JOB_PART_RETRIES + 1):
+            try:
+                async with semaphore:
+                    response = await DocumentaAsync(prompt, text, modelo, max_tokens=max_tokens, max_tokens_saida=max_tokens_saida, on_item=on_item,
+                                                    use_cache=use_cache, esquema=esquema)
+                break
+            except Exception as e:
+                print('Erro na parte', idx + 1, 'de', len(partes), f'(tentativa {tentativa + 1}):', e)
+                if job is not None:
+                    tarefas.fail_part(conn, job, idx, repr(e))
+                if tentativa == tarefas.JOB_PART_RETRIES:
+                    raise
+                await asyncio.sleep(2 ** tentativa)
+        if job is not None:
+            tarefas.save_part(conn, job, idx, response, isinstance(response, RespostaTruncada))
+        done += 1
+        if progress:
+            progress(done, len(partes))
+        return response
+
+    # Sem cancelamento no primeiro erro: cada parte termina e libera o semáforo global
+    results = await asyncio.gather(*(documenta_parte(idx, *parte) for idx, parte in enumerate(partes)), return_exceptions=True)
+    if job is not None:
+        tarefas.finish_job(conn, job, 'failed' if any(isinstance(result, BaseException) for result in results) else 'done')
+    return results
+
+def documenta_partes(partes, modelo, max_tokens=4096, max_tokens_saida=4096, concurrency=None, progress=None, on_item=None, resumable=None,
+                     use_cache=True):
+    """Envia as partes (prompt, texto[, esquema]) ao LLM em paralelo e retorna as respostas na ordem das partes.
+
+    'esquema' é o nome (esquemas.ESQUEMAS) do formato de resposta pedido pelo prompt da parte.
+
+    No máximo 'concurrency' partes (LLM_ASYNC_CONCURRENCY por padrão) ficam em andamento ao
+    mesmo tempo; 'progress', se informado, recebe (concluídas, total) a cada resposta e
+    'on_item', (array, item) a cada medida ou fonte que chega, uma vez por item mesmo que a
+    parte seja refeita.
+
+    Com 'resumable' (DOC_JOBS por padrão) o envio é uma tarefa (tarefas) e a resposta de cada
+    parte é gravada assim que chega; uma nova chamada com as mesmas partes, mesmo após um
+    rerun ou o reinício do processo, só envia as que ainda não foram concluídas. Cada parte
+    que falha é repetida sozinha até JOB_PART_RETRIES vezes; se ainda assim alguma falhar, a
+    exceção da primeira parte com erro é levantada, com as demais já gravadas.
+
+    Com use_cache=False as respostas guardadas no cache_llm são ignoradas (ver
+    client_chat_LiteLLM_async).
+    """
+    if not partes:
+        return []
+    if resumable is None:
+        resumable = tarefas.DOC_JOBS
+    conn = tarefas.connect() if resumable else None
+    on_item = _itens_unicos(on_item)
+    try:
+        results = asyncio.run(_documenta_partes(partes, modelo, max_tokens, max_tokens_saida, concurrency or LLM_ASYNC_CONCURRENCY, progress, on_item, conn,
+                                                use_cache))
+    finally:
+        if conn is not None:
+            conn.close()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+# Function to recursively update the 'FonteDados' field
+def update_fonte_dados(data, tables_df):
+    if isinstance(data, dict):
+        # Collect keys to modify in a separate list
+        keys_to_update = []
+        for key, value in data.items():
+            if key == 'NomeTabela' and value in tables_df['NomeTabela'].to_list():
+                keys_to_update.append((key, value))
+            elif isinstance(value, (dict, list)):
+                update_fonte_dados(value, tables_df)
+        
+        # Apply the modifications
+        for key, value in keys_to_update:
+            table_index = tables_df[tables_df['NomeTabela'] == value].index[0]
+            data['FonteDados'] = tables_df['FonteDados'].iloc[table_index]
+            
+    elif isinstance(data, list):
+        for item in data:
+            update_fonte_dados(item, tables_df)
+
+def _nome_fonte(item):
+    return item.get('NomeTabela') or item.get('Nome')
+
+def _nome_medida(item):
+    return item.get('Nome')
+
+def _guarda_itens(conn, kind, language_name, fresh, names, keys, name_of):
+    """Guarda no acervo as descrições recebidas do LLM cujo nome corresponde a um item do modelo."""
+    by_name = {name_of(item): item for item in fresh if isinstance(item, dict)}
+    descricoes.save(conn, kind, language_name, [(key, name, by_name[name]) for name, key in zip(names, keys) if name in by_name])
+
+def _combina_itens(fresh, names, keys, stored, name_of):
+    """Junta as descrições novas com as guardadas, na ordem dos itens do modelo.
+
+    Itens devolvidos pelo LLM que não correspondem a nenhum nome do modelo vão para o final.
+    """
+    by_name = {name_of(item): item for item in fresh}
+    items, used = [], set()
+    for name, key in zip(names, keys):
+        if name in by_name:
+            items.append(by_name[name])
+            used.add(name)
+        elif key in stored:
+            items.append(stored[key])
+    items += [item for item in fresh if name_of(item) not in used]
+    return items
+
+def _partes_medidas_fontes(language_name, textos_m, textos_f, com_relatorio):
+    """Partes (prompt, texto, esquema) das medidas seguidas das fontes de dados.
+
+    Com 'com_relatorio' só a primeira parte pede também as informações do relatório e das
+    tabelas; as demais usam os esquemas sem elas.
+    """
+    partes = ([(defined_prompt_medidas(language_name), text, 'documentacao_medidas') for text in textos_m] +
+              [(defined_prompt_fontes(language_name), text, 'documentacao_fontes') for text in textos_f])
+    if com_relatorio and partes:
+        prompt, text, esquema = partes[0]
+        partes[0] = (prompt, text, f'{esquema}_relatorio')
+    return partes
+
+def _pede_itens_faltantes(medidas, fontes, enviadas_medidas, enviadas_fontes, tables_df, report_name, modelo, language_name,
+                          max_tokens, max_tokens_saida, progress, on_item, resumable, use_cache):
+    """Pede de novo ao LLM só as medidas e fontes que ficaram sem descrição por respostas cortadas.
+
+    A cada rodada as partes têm metade do tamanho da anterior, para que as respostas caibam
+    no limite de tokens de saída.
+    """
+    for rodada in range(1, LLM_TRUNCATION_RETRIES + 1):
+        max_tokens_parte = max(1, max_tokens >> rodada)
+        faltam_medidas = enviadas_medidas[~enviadas_medidas['NomeMedida'].isin({_nome_medida(item) for item in medidas})]
+        faltam_fontes = enviadas_fontes[~enviadas_fontes['NomeTabela'].isin({_nome_fonte(item) for item in fontes})]
+        if faltam_medidas.empty and faltam_fontes.empty:
+            break
+        textos_m = textos_medidas(faltam_medidas, tables_df, report_name, max_tokens_parte) if not faltam_medidas.empty else []
+        textos_f = textos_fontes(faltam_fontes, report_name, max_tokens_parte) if not faltam_fontes.empty else []
+        partes = _partes_medidas_fontes(language_name, textos_m, textos_f, com_relatorio=False)
+        responses = documenta_partes(partes, modelo, max_tokens=max_tokens, max_tokens_saida=max_tokens_saida, progress=progress, on_item=on_item,
+                                     resumable=resumable, use_cache=use_cache)
+        medidas = medidas + [item for response in responses[:len(textos_m)] for item in response.get('Medidas_do_Relatorio', [])]
+        fontes = fontes + [item for response in responses[len(textos_m):] for item in response.get('Fontes_de_Dados', [])]
+        if not any(isinstance(response, RespostaTruncada) for response in responses):
+            break
+    return medidas, fontes
+
+def gerar_documentacao(model, modelo, language_name, max_tokens=4096, max_tokens_saida=4096, progress=None, incremental=None, on_item=None):
+    """Gera a documentação completa de um modelo, chamando o LLM uma ou mais vezes.
+
+    Se o texto do relatório cabe em 'max_tokens' é feita uma única chamada; senão as partes
+    de medidas e de fontes de dados são enviadas em paralelo (documenta_partes) e as
+    respostas são combinadas na ordem das partes, independente da ordem de chegada.
+    'progress', se informado, recebe (concluídas, total). 'language_name' deve ser resolvido
+    pelo chamador (t('language_name')), pois esta função pode rodar fora da thread do Streamlit.
+
+    Com 'incremental' (INCREMENTAL_DOCS por padrão), as descrições já geradas no mesmo idioma
+    são reaproveitadas do acervo (descricoes) e só as medidas e fontes novas ou alteradas vão
+    para o LLM. As informações do relatório e das tabelas são reaproveitadas enquanto o nome do
+    relatório e a lista de tabelas não mudarem; quando mudam, o modelo é documentado por inteiro.
+
+    'on_item', se informado, recebe (array, item) a cada medida ou fonte documentada, conforme
+    as respostas chegam. Itens de respostas cortadas pelo limite de tokens de saída são
+    pedidos de novo, sem repetir os que já chegaram completos.
+
+    As partes concluídas de uma geração interrompida são retomadas (tarefas), exceto com
+    incremental=False ("regenerar tudo"), que não retoma tarefas nem lê o cache_llm e chama o
+    LLM de novo para todas as partes; as respostas novas substituem as guardadas.
+
+    Em 'chamadas_reserva' o resultado traz os erros das chamadas que foram respondidas pelo
+    MODELO_RESERVA porque o provedor do modelo escolhido estava indisponível.
+    """
+    regenerar = incremental is False
+    resumable = False if regenerar else None
+    if incremental is None:
+        incremental = descricoes.INCREMENTAL_DOCS
+    conn = descricoes.connect() if incremental else None
+    chamadas_reserva = []
+    token = _chamadas_reserva.set(chamadas_reserva)
+    try:
+        result = _gerar_documentacao(model, modelo, language_name, max_tokens, max_tokens_saida, progress, conn, on_item, resumable, not regenerar)
+    finally:
+        _chamadas_reserva.reset(token)
+        if conn is not None:
+            conn.close()
+    result['chamadas_reserva'] = chamadas_reserva
+    return result
+
+def _gerar_documentacao(model, modelo, language_name, max_tokens, max_tokens_saida, progress, conn, on_item, resumable, use_cache):
+    document_text_all, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, measures_df, tables_df, df_colunas = text_to_document(model, max_tokens=max_tokens)
+    response_info = {}
+    response_tables = []
+
+    report_name = model.report_name or "PBIReport"
+    measure_names = measures_df['NomeMedida'].to_list()
+    source_names = tables_df['NomeTabela'].to_list()
+    measure_keys = [descricoes.item_key(name, expression) for name, expression in zip(measure_names, measures_df['ExpressaoMedida'])]
+    source_keys = [descricoes.item_key(name, source) for name, source in zip(source_names, tables_df['FonteDados'])]
+    report_key = descricoes.item_key(report_name, *source_names)
+
+    stored_report = None
+    stored_measures, stored_sources = {}, {}
+    enviadas_medidas, enviadas_fontes = measures_df, tables_df
+    if conn is not None:
+        stored_report = descricoes.lookup(conn, 'report', language_name, [report_key]).get(report_key)
+
+    if stored_report is not None:
+        # Só as medidas e fontes sem descrição guardada (novas ou com expressão alterada) vão para o LLM
+        stored_measures = descricoes.lookup(conn, 'measure', language_name, measure_keys)
+        stored_sources = descricoes.lookup(conn, 'source', language_name, source_keys)
+        enviadas_medidas = measures_df[[key not in stored_measures for key in measure_keys]]
+        enviadas_fontes = tables_df[[key not in stored_sources for key in source_keys]]
+        dados_relatorio_PBI_medidas = textos_medidas(enviadas_medidas, tables_df, report_name, max_tokens) if not enviadas_medidas.empty else []
+        dados_relatorio_PBI_fontes = textos_fontes(enviadas_fontes, report_name, max_tokens) if not enviadas_fontes.empty else []
+        chamada_unica = False
+    else:
+        chamada_unica = count_tokens(document_text_all) < max_tokens
+
+    if chamada_unica:
+        partes = [(defined_prompt(language_name), document_text_all, 'documentacao_relatorio')]
+    else:
+        partes = _partes_medidas_fontes(language_name, dados_relatorio_PBI_medidas, dados_relatorio_PBI_fontes, com_relatorio=stored_report is None)
+
+    responses = documenta_partes(partes, modelo, max_tokens=max_tokens, max_tokens_saida=max_tokens_saida, progress=progress, on_item=on_item,
+                                 resumable=resumable, use_cache=use_cache)
+
+    if stored_report is not None:
+        response_info = stored_report['Relatorio']
+        response_tables = stored_report['Tabelas_do_Relatorio']
+    else:
+        # As informações do relatório e das tabelas vêm da primeira parte que as trouxer
+        for response in responses:
+            if 'Relatorio' in response and 'Tabelas_do_Relatorio' in response:
+                response_info = response['Relatorio']
+                response_tables = response['Tabelas_do_Relatorio']
+                break
+
+    if chamada_unica:
+        novas_descricoes_medidas = responses[0].get('Medidas_do_Relatorio', [])
+        novas_descricoes_fontes = responses[0].get('Fontes_de_Dados', [])
+    else:
+        n_medidas = len(dados_relatorio_PBI_medidas)
+        novas_descricoes_medidas = [item for response in responses[:n_medidas] for item in response.get('Medidas_do_Relatorio', [])]
+        novas_descricoes_fontes = [item for response in responses[n_medidas:] for item in response.get('Fontes_de_Dados', [])]
+
+    if any(isinstance(response, RespostaTruncada) for response in responses):
+        novas_descricoes_medidas, novas_descricoes_fontes = _pede_itens_faltantes(
+            novas_descricoes_medidas, novas_descricoes_fontes, enviadas_medidas, enviadas_fontes, tables_df, report_name,
+            modelo, language_name, max_tokens, max_tokens_saida, progress, on_item, resumable, use_cache)
+
+    if chamada_unica:
+        response_measures = novas_descricoes_medidas
+        response_source = novas_descricoes_fontes
+    else:
+        if stored_report is not None:
+            novas_descricoes_medidas = _combina_itens(novas_descricoes_medidas, measure_names, measure_keys, stored_measures, _nome_medida)
+            novas_descricoes_fontes = _combina_itens(novas_descricoes_fontes, source_names, source_keys, stored_sources, _nome_fonte)
+        response_measures = pd.DataFrame(novas_descricoes_medidas).to_dict(orient='records')
+        response_source = pd.DataFrame(novas_descricoes_fontes).to_dict(orient='records')
+
+    if conn is not None:
+        # Guarda antes de update_fonte_dados, que acrescenta a expressão M a cada fonte
+        _guarda_itens(conn, 'measure', language_name, novas_descricoes_medidas, measure_names, measure_keys, _nome_medida)
+        _guarda_itens(conn, 'source', language_name, novas_descricoes_fontes, source_names, source_keys, _nome_fonte)
+        if stored_report is None and response_info:
+            descricoes.save(conn, 'report', language_name, [(report_key, report_name, {'Relatorio': response_info, 'Tabelas_do_Relatorio': response_tables})])
+
+    update_fonte_dados(response_source, tables_df)
+
+    return {
+        'response_info': response_info,
+        'response_tables': response_tables,
+        'response_measures': response_measures,
+        'response_source': response_source,
+        'measures_df': measures_df,
+        'df_relationships': model.relationships,
+        'df_colunas': df_colunas,
+        'reaproveitados': {
+            'medidas': sum(key in stored_measures for key in measure_keys),
+            'fontes': sum(key in stored_sources for key in source_keys)
+        }
+    }
+
+def gerar_documentacao_lote(models, modelo, language_name, max_tokens=4096, max_tokens_saida=4096, max_workers=None, incremental=None):
+    """Gera a documentação de vários modelos em paralelo.
+
+    Produz (índice, resultado) na ordem em que cada relatório termina; o resultado é o
+    dicionário de gerar_documentacao ou a exceção levantada. O total de chamadas simultâneas
+    ao LLM continua limitado por LLM_MAX_CONCURRENCY.
+    """
+    if not models:
+        return
+    max_workers = max_workers or min(LLM_MAX_CONCURRENCY, len(models))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(gerar_documentacao, model, modelo, language_name, max_tokens, max_tokens_saida, None, incremental): idx
+                   for idx, model in enumerate(models)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
 def set_heading(doc, text, level=1):
     heading = doc.add_heading(level=level)
     run = heading.add_run(text)
@@ -725,78 +1297,71 @@ def generate_excel(response_info, response_tables, response_measures, response_s
 
 # Funçcão para preparar o relatório do Power BI para enviar para o modelo LLM por prompt
 
-def text_to_document(df, df_relationships=None, max_tokens=4096):
-    """Gera o texto para documentação baseado nos dados do DataFrame."""
+def textos_medidas(measures_df, tables_df, report_name, max_tokens=4096):
+    """Monta os textos das chamadas de medidas, agrupando as medidas em partes de até max_tokens tokens."""
+    chunks_medidas = chunk_text_by_tag(measures_df['NomeMedidaExpressao'].to_string(index=False), max_tokens)
+
+    # monta o texto baseados na medidas
+    return [f"""
+                  Relatório: {report_name}
+
+                  Tabelas:
+                  {tables_df['NomeTabela'].to_string(index=False)}
+
+                  Medidas:
+                  {chunk}
+                  """ for chunk in chunks_medidas]
+
+def textos_fontes(tables_df, report_name, max_tokens=4096):
+    """Monta os textos das chamadas de fontes de dados, agrupando as tabelas em partes de até max_tokens tokens."""
+    chunks_fontes = chunk_text_by_tag(tables_df['NomeTabelaFonteDados'].to_string(index=False), max_tokens)
+
+    # monta o texto baseados nas fontes de dados
+    return [f"""
+                  Relatório: {report_name}
+
+                  Fontes dos dados das tabelas:
+                  {chunk}
+                  """ for chunk in chunks_fontes]
+
+def text_to_document(model, df_relationships=None, max_tokens=4096):
+    """Gera o texto para documentação baseado no modelo normalizado do relatório."""
     
     # Define o tamanho máximo de tokens para o modelo LLM
     pd.set_option('display.max_colwidth', None)
     
     # Faz a leitura dos dados do relatório do Power BI para a preparação para gerar o relatório
-    tables_df = df[df['NomeTabela'].notnull() & df['FonteDados'].notnull()]
-    tables_df = tables_df[['NomeTabela', 'FonteDados']].drop_duplicates().reset_index(drop=True)
+    tables_df = model.tables[model.tables['NomeTabela'].notnull() & model.tables['FonteDados'].notnull()]
+    tables_df = tables_df[['NomeTabela', 'FonteDados']].astype({'NomeTabela': str, 'FonteDados': str}).drop_duplicates().reset_index(drop=True)
 
-    measures_df = df[df['NomeMedida'].notnull() & df['ExpressaoMedida'].notnull()]
-    measures_df = measures_df[['NomeMedida', 'ExpressaoMedida']].drop_duplicates().reset_index(drop=True)
+    measures_df = model.measures[model.measures['NomeMedida'].notnull() & model.measures['ExpressaoMedida'].notnull()]
+    measures_df = measures_df[['NomeMedida', 'ExpressaoMedida']].astype(str).drop_duplicates().reset_index(drop=True)
 
-    df_colunas = df[['NomeTabela','NomeColuna', 'TipoDadoColuna', 'TipoColuna', 'ExpressaoColuna']]
+    df_colunas = model.columns_frame().astype({'NomeTabela': str})
     df_colunas = df_colunas[df_colunas['NomeTabela'] != 'Medidas']
 
     df_colunas['TipoColuna'] = df_colunas['TipoColuna'].replace('N/A', '')
     df_colunas['ExpressaoColuna'] = df_colunas['ExpressaoColuna'].replace('N/A', '')
 
     # filter the df_colunas not null
-    df_colunas = df_colunas[df_colunas['NomeColuna'].notnull()]
+    df_colunas = df_colunas[df_colunas['NomeColuna'].notnull()].reset_index(drop=True)
 
-    if not df.empty and 'ReportName' in df.columns:
-        report_name = df['ReportName'].iloc[0]
-    else:
-        report_name = "PBIReport"
+    report_name = model.report_name or "PBIReport"
 
     if df_relationships is None:
-        df_relationships = pd.DataFrame()
+        df_relationships = model.relationships
 
     # Prepara para enviar as medidas do relatório em partes por causa da limitação de tokens do modelo
     #monta um texto com o nome da medida e a expressao da medida    
     measures_df['NomeMedidaExpressao'] = '<tag> Nome da medida: ' + measures_df['NomeMedida'] + ' Expressão da medida: ' + measures_df['ExpressaoMedida']
 
-    chunks_medidas = chunk_text_by_tag(measures_df['NomeMedidaExpressao'].to_string(index=False), max_tokens)
-
     # Prepara para enviar as fontes dos dados do relatório em partes por causa da limitação de tokens do modelo
     #monta um texto com o nome da tabela e fontededados
     tables_df['NomeTabelaFonteDados'] = '<tag> NomeTabela: ' + tables_df['NomeTabela'] + ' Fonte de Dados: ' + tables_df['FonteDados']
 
-    chunks_fontes = chunk_text_by_tag(tables_df['NomeTabelaFonteDados'].to_string(index=False), max_tokens)
-
     # define uma lista para armazenar todos os textos para o modelo LLM
-    document_texts_medidas = []
-    document_texts_fontes = []
-
-    # monta o texto baseados na medidas
-    for chunk in chunks_medidas:
-        document_texts_medidas.append(
-
-            f"""
-                  Relatório: {report_name}
-
-                  Tabelas:
-                  {tables_df['NomeTabela'].to_string(index=False)}
-
-                  Medidas:
-                  {chunk}
-                  """
-            )
-
-    # monta o texto baseados nas fontes de dados
-    for chunk in chunks_fontes:
-        document_texts_fontes.append(
-
-            f"""
-                  Relatório: {report_name}
-
-                  Fontes dos dados das tabelas:
-                  {chunk}
-                  """
-            )
+    document_texts_medidas = textos_medidas(measures_df, tables_df, report_name, max_tokens)
+    document_texts_fontes = textos_fontes(tables_df, report_name, max_tokens)
 
     # monta o texto final para o relatório
     document_text_all = f"""
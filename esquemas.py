@@ -0,0 +1,94 @@
+import os
+import threading
+from functools import lru_cache
+
+import pandas as pd
+import litellm
+
+# Esquemas JSON das respostas pedidas por defined_prompt, defined_prompt_medidas e
+# defined_prompt_fontes, escolhidos pelo nome em ESQUEMAS por quem monta cada parte. Nos
+# modelos com saída estruturada eles vão como response_format e o provedor garante o formato;
+# nos demais a resposta passa pelo parser tolerante.
+STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', '1') != '0'
+
+def _objeto(properties):
+    return {'type': 'object', 'properties': properties, 'required': list(properties), 'additionalProperties': False}
+
+def _lista(items):
+    return {'type': 'array', 'items': items}
+
+_TEXTO = {'type': 'string'}
+
+_RELATORIO = _objeto({
+    'Titulo': _TEXTO,
+    'Descricao': _TEXTO,
+    'Principais_KPIs_e_Metricas': _lista(_TEXTO),
+    'Publico_Alvo': _TEXTO,
+    'Exemplos_de_Uso': _lista(_TEXTO)
+})
+_ITEM = _objeto({'Nome': _TEXTO, 'Descricao': _TEXTO})
+_FONTE = _objeto({'Nome': _TEXTO, 'Descricao': _TEXTO, 'Tabelas_Contidas_no_M': _lista(_TEXTO), 'NomeTabela': _TEXTO})
+
+SCHEMA_RELATORIO = _objeto({
+    'Relatorio': _RELATORIO,
+    'Tabelas_do_Relatorio': _lista(_ITEM),
+    'Medidas_do_Relatorio': _lista(_ITEM),
+    'Fontes_de_Dados': _lista(_FONTE)
+})
+# Partes só de medidas ou só de fontes de dados: as informações do relatório e das tabelas
+# são pedidas em uma única parte (variantes "_relatorio"), e não repetidas em todas
+SCHEMA_MEDIDAS = _objeto({'Medidas_do_Relatorio': _lista(_ITEM)})
+SCHEMA_FONTES = _objeto({'Fontes_de_Dados': _lista(_FONTE)})
+SCHEMA_MEDIDAS_RELATORIO = _objeto({
+    'Relatorio': _RELATORIO,
+    'Tabelas_do_Relatorio': _lista(_ITEM),
+    'Medidas_do_Relatorio': _lista(_ITEM)
+})
+SCHEMA_FONTES_RELATORIO = _objeto({
+    'Relatorio': _RELATORIO,
+    'Tabelas_do_Relatorio': _lista(_ITEM),
+    'Fontes_de_Dados': _lista(_FONTE)
+})
+
+ESQUEMAS = {
+    'documentacao_relatorio': SCHEMA_RELATORIO,
+    'documentacao_medidas': SCHEMA_MEDIDAS,
+    'documentacao_fontes': SCHEMA_FONTES,
+    'documentacao_medidas_relatorio': SCHEMA_MEDIDAS_RELATORIO,
+    'documentacao_fontes_relatorio': SCHEMA_FONTES_RELATORIO
+}
+
+@lru_cache(maxsize=None)
+def supports_schema(modelo):
+    try:
+        return bool(litellm.supports_response_schema(model=modelo))
+    except Exception:
+        return False
+
+def response_format(modelo, esquema):
+    """response_format com o esquema de nome 'esquema' (ESQUEMAS), ou None sem esquema ou se o modelo não aceita saída estruturada."""
+    if esquema is None or not STRUCTURED_OUTPUT or not supports_schema(modelo):
+        return None
+    return {'type': 'json_schema', 'json_schema': {'name': esquema, 'schema': ESQUEMAS[esquema], 'strict': True}}
+
+# Resultado da interpretação de cada resposta, por modelo: 'ok' (JSON válido), 'reparada'
+# (válida após o parser tolerante), 'truncada' (cortada pelo limite de saída) ou 'falha'
+# (não interpretável, o que leva a uma nova tentativa da parte)
+_PARSE_RESULTS = ('ok', 'reparada', 'truncada', 'falha')
+_parse_counts = {}
+_parse_lock = threading.Lock()
+
+def record_parse(modelo, structured, result):
+    with _parse_lock:
+        counts = _parse_counts.setdefault((modelo, structured), dict.fromkeys(_PARSE_RESULTS, 0))
+        counts[result] += 1
+
+def get_parse_metrics():
+    """Respostas de cada modelo por resultado da interpretação e a taxa de falhas (novas chamadas)."""
+    with _parse_lock:
+        rows = [{'Modelo': modelo, 'Esquema': structured, **counts} for (modelo, structured), counts in _parse_counts.items()]
+    df = pd.DataFrame(rows, columns=['Modelo', 'Esquema', *_PARSE_RESULTS])
+    df = df.rename(columns={'ok': 'Validas', 'reparada': 'Reparadas', 'truncada': 'Truncadas', 'falha': 'Falhas'})
+    total = df[['Validas', 'Reparadas', 'Truncadas', 'Falhas']].sum(axis=1)
+    df['TaxaFalha'] = (df['Falhas'] / total.where(total > 0)).fillna(0).round(3)
+    return df
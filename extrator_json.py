@@ -0,0 +1,148 @@
+import json
+
+# Leitura incremental da resposta do LLM enquanto ela chega em partes (streaming). Cada item
+# dos arrays de interesse (ex.: Medidas_do_Relatorio) é devolvido assim que o seu objeto
+# fecha, e os valores de primeiro nível (objetos e arrays) assim que terminam; se a resposta
+# for interrompida, o que já estava completo é aproveitado. repair_json corrige os defeitos
+# mais comuns de JSON gerado por LLM quando a resposta inteira não pôde ser interpretada.
+
+class JSONItemExtractor:
+    """Extrai itens completos de arrays de primeiro nível de um JSON recebido aos pedaços."""
+
+    def __init__(self, arrays):
+        self.arrays = set(arrays)
+        self.text = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_string = None
+        self.key = None
+        self.value_key = None
+        self.value_start = None
+        self.array = None
+        self.item_start = None
+        self.values = {}
+        self.items = {name: [] for name in self.arrays}
+
+    def feed(self, delta):
+        """Acrescenta um pedaço da resposta e retorna [(array, item)] dos itens que ficaram completos."""
+        self.text += delta
+        found = []
+        text = self.text
+        for pos in range(self.pos, len(text)):
+            char = text[pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    try:
+                        self.last_string = json.loads(text[self.string_start:pos + 1])
+                    except ValueError:
+                        self.last_string = None
+                continue
+            if char == '"':
+                self.in_string = True
+                self.string_start = pos
+            elif char == ':':
+                if self.depth == 1:
+                    self.key = self.last_string
+            elif char == ',':
+                if self.depth == 1:
+                    self.key = None
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == 2 and self.key is not None:
+                    self.value_key, self.value_start = self.key, pos
+                    if char == '[' and self.key in self.arrays:
+                        self.array = self.key
+                elif self.depth == 3 and self.array is not None and char == '{':
+                    self.item_start = pos
+            elif char in '}]':
+                if self.depth == 3 and self.array is not None and self.item_start is not None:
+                    item = self._load(text[self.item_start:pos + 1])
+                    if item is not None:
+                        self.items[self.array].append(item)
+                        found.append((self.array, item))
+                    self.item_start = None
+                elif self.depth == 2 and self.value_start is not None:
+                    value = self._load(text[self.value_start:pos + 1])
+                    if value is not None:
+                        self.values[self.value_key] = value
+                    self.value_key = self.value_start = self.array = None
+                self.depth -= 1
+        self.pos = len(text)
+        return found
+
+    @staticmethod
+    def _load(fragment):
+        try:
+            return json.loads(fragment)
+        except ValueError:
+            return None
+
+    def partial(self):
+        """Os valores de primeiro nível completos, com os arrays de interesse só com os itens completos."""
+        result = dict(self.values)
+        for name, items in self.items.items():
+            result.setdefault(name, list(items))
+        return result
+
+_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+def repair_json(text):
+    """Corrige defeitos comuns em JSON gerado por LLM, para uma nova tentativa de json.loads.
+
+    Descarta o texto antes do primeiro '{' e depois do último '}', escapa quebras de linha
+    dentro de strings, remove vírgulas antes de '}' ou ']' e fecha strings, objetos e arrays
+    que ficaram abertos.
+    """
+    start = text.find('{')
+    if start < 0:
+        return text
+    end = text.rfind('}')
+    text = text[start:end + 1] if end > start else text[start:]
+
+    out = []
+    stack = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char in _ESCAPES:
+                char = _ESCAPES[char]
+            out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+        out.append(char)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    _drop_trailing_comma(out)
+    out.extend(reversed(stack))
+    return ''.join(out)
+
+def _drop_trailing_comma(out):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ',':
+        del out[i]
@@ -0,0 +1,186 @@
+import os
+import time
+import random
+import asyncio
+import threading
+
+import pandas as pd
+from litellm import RateLimitError
+
+from tokenizador import count_tokens
+
+# Limites de requisições e tokens por minuto de cada modelo, no formato
+# "modelo=rpm:tpm,outro/modelo=rpm:tpm" (0 ou ausente = sem limite). Os nomes são os mesmos
+# de AVAILABLE_MODELS; modelos que não aparecem usam LLM_DEFAULT_RPM e LLM_DEFAULT_TPM.
+LLM_RATE_LIMITS = os.getenv('LLM_RATE_LIMITS', '')
+LLM_DEFAULT_RPM = int(os.getenv('LLM_DEFAULT_RPM', 0))
+LLM_DEFAULT_TPM = int(os.getenv('LLM_DEFAULT_TPM', 0))
+# Quantas vezes uma chamada recusada pelo provedor (429) volta para a fila antes de falhar
+LLM_RATE_LIMIT_RETRIES = int(os.getenv('LLM_RATE_LIMIT_RETRIES', 8))
+LLM_RATE_LIMIT_BACKOFF = 2.0
+LLM_RATE_LIMIT_BACKOFF_MAX = 60.0
+
+def parse_limits(spec):
+    """Converte "modelo=rpm:tpm,..." em {modelo: (rpm, tpm)}."""
+    limits = {}
+    for entry in spec.split(','):
+        model, _, values = entry.strip().rpartition('=')
+        if not model:
+            continue
+        rpm, _, tpm = values.partition(':')
+        limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+    return limits
+
+class TokenBucket:
+    """Balde reabastecido continuamente até 'per_minute' unidades por minuto."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Segundos até haver 'amount' disponível (0 se já houver)."""
+        self._refill(now)
+        # Uma reserva maior que a capacidade espera o balde encher e fica devendo o restante
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+class RateLimiter:
+    """Limites de um modelo: cada chamada reserva uma requisição e os tokens estimados antes de sair."""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+    def _try_reserve(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            if wait <= 0:
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(tokens)
+                self.calls += 1
+            return wait
+
+    def reserve(self, tokens):
+        """Espera (sem falhar) até haver capacidade para a chamada e a reserva."""
+        start = time.monotonic()
+        while (wait := self._try_reserve(tokens)) > 0:
+            time.sleep(wait)
+        self._add_wait(time.monotonic() - start)
+
+    async def reserve_async(self, tokens):
+        start = time.monotonic()
+        while (wait := self._try_reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+        self._add_wait(time.monotonic() - start)
+
+    def _add_wait(self, seconds):
+        with self.lock:
+            self.waited += seconds
+
+    def settle(self, reserved, used):
+        """Ajusta a reserva de tokens ao consumo informado pelo provedor."""
+        if self.tokens is not None and used is not None:
+            with self.lock:
+                self.tokens.give_back(reserved - used)
+
+    def pause(self, seconds):
+        """Segura todas as chamadas do modelo após uma recusa (429) do provedor."""
+        with self.lock:
+            self.rate_limited += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+_configured = parse_limits(LLM_RATE_LIMITS)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(modelo):
+    """Limitador compartilhado do modelo (um por processo)."""
+    with _limiters_lock:
+        limiter = _limiters.get(modelo)
+        if limiter is None:
+            rpm, tpm = _configured.get(modelo, (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM))
+            limiter = _limiters[modelo] = RateLimiter(rpm, tpm)
+        return limiter
+
+def estimate_tokens(messages, maxtokens):
+    """Tokens reservados para a chamada: as mensagens mais o máximo de tokens de saída."""
+    return sum(count_tokens(message.get('content') or '') for message in messages) + maxtokens
+
+def _used_tokens(response):
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None)
+
+def _retry_after(error, attempt):
+    """Espera indicada pelo provedor no 429 ou, sem ela, backoff exponencial com jitter."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return min(LLM_RATE_LIMIT_BACKOFF_MAX, LLM_RATE_LIMIT_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def chamar(modelo, messages, maxtokens, call):
+    """Executa call() respeitando os limites do modelo e voltando para a fila a cada 429."""
+    limiter = get_limiter(modelo)
+    reserved = estimate_tokens(messages, maxtokens)
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        limiter.reserve(reserved)
+        try:
+            response = call()
+        except RateLimitError as e:
+            limiter.settle(reserved, 0)
+            if attempt == LLM_RATE_LIMIT_RETRIES:
+                raise
+            limiter.pause(_retry_after(e, attempt))
+            continue
+        limiter.settle(reserved, _used_tokens(response))
+        return response
+
+async def chamar_async(modelo, messages, maxtokens, call):
+    """Versão assíncrona de chamar; 'call' retorna uma corrotina."""
+    limiter = get_limiter(modelo)
+    reserved = estimate_tokens(messages, maxtokens)
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        await limiter.reserve_async(reserved)
+        try:
+            response = await call()
+        except RateLimitError as e:
+            limiter.settle(reserved, 0)
+            if attempt == LLM_RATE_LIMIT_RETRIES:
+                raise
+            limiter.pause(_retry_after(e, attempt))
+            continue
+        limiter.settle(reserved, _used_tokens(response))
+        return response
+
+def get_limiter_metrics():
+    """Chamadas, recusas (429) e tempo em fila de cada modelo usado no processo."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return pd.DataFrame([{'Modelo': modelo, 'Chamadas': limiter.calls, 'Recusas_429': limiter.rate_limited, 'Espera_s': round(limiter.waited, 1)}
+                         for modelo, limiter in limiters.items()],
+                        columns=['Modelo', 'Chamadas', 'Recusas_429', 'Espera_s'])
@@ -1,17 +1,204 @@
 import msal
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import time
 from zipfile import ZipFile, BadZipFile
-import io, json
+from dataclasses import dataclass, field
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import io, json, re, codecs, mmap, os, shutil, tempfile, hashlib, threading, random, atexit, multiprocessing
+from tmdl import find_definition, tmdl_events
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Backend de decodificação JSON: 'auto' usa o orjson quando instalado e o json padrão caso contrário
+JSON_BACKEND = os.getenv('AUTODOC_JSON_BACKEND', 'auto')
+
+def json_backend():
+    """Nome do backend JSON em uso ('orjson' ou 'json')."""
+    if JSON_BACKEND != 'json' and orjson is not None:
+        return 'orjson'
+    return 'json'
+
+def json_loads(data):
+    """Decodifica JSON a partir de bytes (UTF-8) ou str com o backend configurado."""
+    if json_backend() == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+def response_json(response):
+    """Decodifica o corpo de uma resposta HTTP direto dos bytes, sem passar pelo response.json()."""
+    return json_loads(response.content)
+
+RELATIONSHIP_COLUMNS = ['FromTable', 'FromColumn', 'ToTable', 'ToColumn', 'Cardinality']
+
+@dataclass
+class ModelSnapshot:
+    """Modelo normalizado de um relatório do Power BI.
+
+    Tabelas, medidas, colunas e relacionamentos ficam em DataFrames separados. Medidas e
+    colunas apontam para a tabela pela chave inteira 'TableKey' (posição em 'tables') e o
+    nome da tabela é categórico, então memória e CPU crescem com o tamanho do modelo e
+    não com o produto tabelas × medidas × colunas.
+    """
+    tables: pd.DataFrame
+    measures: pd.DataFrame
+    columns: pd.DataFrame
+    relationships: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=RELATIONSHIP_COLUMNS))
+    report_name: str = 'PBIReport'
+    dataset_id: str = '0'
+    report_id: str = None
+    configured_by: str = None
+
+    @property
+    def empty(self):
+        return self.tables.empty
+
+    def _table_names(self, keys):
+        """Resolve as chaves 'TableKey' para os nomes (categóricos) das tabelas."""
+        return self.tables['NomeTabela'].array.take(keys.to_numpy())
+
+    def measures_frame(self):
+        """Medidas com o nome da tabela, no formato usado pela documentação."""
+        df = self.measures.drop(columns='TableKey')
+        df.insert(0, 'NomeTabela', self._table_names(self.measures['TableKey']))
+        return df
+
+    def columns_frame(self):
+        """Colunas com o nome da tabela, no formato usado pela documentação."""
+        df = self.columns.drop(columns='TableKey')
+        df.insert(0, 'NomeTabela', self._table_names(self.columns['TableKey']))
+        return df
+
+def tables_frame(names, sources, storage_modes=None):
+    """Monta o DataFrame de tabelas de um ModelSnapshot, com a chave inteira e o nome categórico.
+
+    Usado também pelo catálogo local para remontar os modelos a partir do SQLite.
+    """
+    return pd.DataFrame({
+        'TableKey': pd.array(range(len(names)), dtype='int32'),
+        'NomeTabela': pd.Categorical(names),
+        'FonteDados': sources,
+        'storageMode': storage_modes if storage_modes is not None else [None] * len(names)
+    })
+
+def child_frame(keys, **columns):
+    """Monta o DataFrame de medidas ou colunas referenciando a tabela por 'TableKey'."""
+    return pd.DataFrame({'TableKey': pd.array(keys, dtype='int32'), **columns})
+
+# Endereço da API administrativa do Power BI (pode apontar para um serviço local em testes)
+POWERBI_ADMIN_URL = os.getenv('POWERBI_ADMIN_URL', 'https://api.powerbi.com/v1.0/myorg/admin')
+
+# Tempo máximo, em segundos, para aguardar um escaneamento de workspace
+SCAN_TIMEOUT = float(os.getenv('SCAN_TIMEOUT', 300))
+SCAN_POLL_INITIAL_DELAY = 0.5
+SCAN_POLL_MAX_DELAY = 10
+
+# Listagem de workspaces: páginas de $top itens buscadas em paralelo e cache por tenant
+WORKSPACES_PAGE_SIZE = 1000
+WORKSPACES_PAGE_CONCURRENCY = 4
+WORKSPACES_TIMEOUT = 60
+WORKSPACES_CACHE_TTL = float(os.getenv('WORKSPACES_CACHE_TTL', 300))
+_workspaces_cache = {}
+_workspaces_cache_lock = threading.Lock()
+
+# O getInfo aceita até 100 workspaces por chamada; a API limita os escaneamentos simultâneos
+SCAN_BATCH_SIZE = 100
+SCAN_MAX_IN_FLIGHT = int(os.getenv('SCAN_MAX_IN_FLIGHT', 4))
+
+# Sessão HTTP compartilhada (keep-alive) para todas as chamadas à API administrativa
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 16))
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 4))
+HTTP_RETRY_STATUS = {500, 502, 503, 504}
+_http_session = None
+_http_session_pid = None
+_http_session_lock = threading.Lock()
+_http_metrics = {}
+_http_metrics_lock = threading.Lock()
+
+POWERBI_SCOPES = ["https://analysis.windows.net/powerbi/api/.default"]
+
+# O MSAL ignora tokens do cache que expiram em menos de 5 minutos, então a renovação em
+# segundo plano precisa acontecer dentro dessa janela para obter de fato um token novo
+TOKEN_REFRESH_MARGIN = 240
+
+# Um cliente sem chamadas a get_token há mais de TOKEN_IDLE_TIMEOUT segundos deixa de ser
+# renovado e sai do dicionário de clientes
+TOKEN_IDLE_TIMEOUT = 3600
+
+# Clientes MSAL do processo, compartilhados entre sessões e reruns do Streamlit,
+# indexados por (tenant, app, hash do segredo)
+_token_clients = {}
+_token_clients_lock = threading.Lock()
+
+@dataclass
+class _TokenClient:
+    key: tuple
+    app: msal.ConfidentialClientApplication
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    timer: threading.Timer = None
+    last_used: float = field(default_factory=time.monotonic)
+
+def _token_client(app_id, tenant_id, secret_value):
+    """Retorna o cliente MSAL (com cache de tokens) da combinação tenant/app, criando-o uma única vez."""
+    key = (tenant_id, app_id, hashlib.sha256(secret_value.encode('utf-8')).hexdigest())
+    with _token_clients_lock:
+        client = _token_clients.get(key)
+        if client is None:
+            app = msal.ConfidentialClientApplication(
+                app_id,
+                authority=f"https://login.microsoftonline.com/{tenant_id}",
+                client_credential=secret_value,
+                token_cache=msal.SerializableTokenCache()
+            )
+            client = _token_clients[key] = _TokenClient(key, app)
+        client.last_used = time.monotonic()
+        return client
+
+def _acquire_token(client):
+    """Obtém o token do cache do MSAL e, se não houver renovação pendente, agenda uma antes de expirar.
+
+    O agendamento usa o 'expires_in' da resposta, que o MSAL informa tanto para tokens novos
+    quanto para os que vêm do cache (o tempo que ainda resta).
+    """
+    with client.lock:
+        result = client.app.acquire_token_for_client(scopes=POWERBI_SCOPES)
+        if 'access_token' in result and 'expires_in' in result and client.timer is None:
+            delay = max(float(result['expires_in']) - TOKEN_REFRESH_MARGIN, 1)
+            client.timer = threading.Timer(delay, _refresh_token, args=(client,))
+            client.timer.daemon = True
+            client.timer.start()
+        return result
+
+def _refresh_token(client):
+    with client.lock:
+        client.timer = None
+    # Cliente ocioso: não renova mais e sai do dicionário; o próximo get_token cria outro
+    if time.monotonic() - client.last_used > TOKEN_IDLE_TIMEOUT:
+        with _token_clients_lock:
+            if _token_clients.get(client.key) is client:
+                del _token_clients[client.key]
+        return
+    # Falhas na renovação em segundo plano são ignoradas: a próxima chamada a get_token tenta de novo
+    try:
+        _acquire_token(client)
+    except Exception:
+        pass
 
 def get_token(APP_ID, TENANT_ID, SECRET_VALUE):
-    """Obtém o token de autenticação da Microsoft para acessar a API do Power BI."""
-    authority = f"https://login.microsoftonline.com/{TENANT_ID}"
-    scopes = ["https://analysis.windows.net/powerbi/api/.default"]
+    """Obtém o token de autenticação da Microsoft para acessar a API do Power BI.
 
-    app = msal.ConfidentialClientApplication(APP_ID, authority=authority, client_credential=SECRET_VALUE)
-    result = app.acquire_token_for_client(scopes=scopes)
+    Os tokens ficam no cache do MSAL do processo e são reaproveitados até pouco antes de
+    expirar; a renovação é feita em segundo plano, sem ida ao AAD a cada rerun, enquanto
+    houver chamadas nos últimos TOKEN_IDLE_TIMEOUT segundos.
+    """
+    result = _acquire_token(_token_client(APP_ID, TENANT_ID, SECRET_VALUE))
     access_token = result["access_token"]
 
     headers = {
@@ -21,106 +208,347 @@ def get_token(APP_ID, TENANT_ID, SECRET_VALUE):
 
     return headers
 
-def get_workspaces_id(headers):
-    """Obtém os IDs e nomes das workspaces do Power BI."""
-    retries = 5
-    workspaces_url = 'https://api.powerbi.com/v1.0/myorg/admin/groups?$top=100'
-
-    for i in range(retries):
-        response_workspaces = requests.get(url=workspaces_url, headers=headers)
-        if response_workspaces.status_code == 200:
-            workspaces = response_workspaces.json().get('value', [])
-            workspace_dict = {workspace['name']: workspace['id'] for workspace in workspaces}
-            return workspace_dict
-        elif response_workspaces.status_code == 429:
-            time.sleep(2 ** i)
+def _get_workspaces_page(headers, skip, filter_expr, deadline):
+    """Busca uma página da listagem de workspaces a partir de 'skip'."""
+    params = {'$top': WORKSPACES_PAGE_SIZE, '$skip': skip}
+    if filter_expr:
+        params['$filter'] = filter_expr
+    response = _admin_request('GET', f'{POWERBI_ADMIN_URL}/groups', headers, deadline, params=params)
+    return response_json(response).get('value', [])
+
+def get_workspaces_id(headers, tenant_id=None, filter_expr=None, refresh=False):
+    """Obtém os IDs e nomes de todas as workspaces do Power BI, em um dicionário {id: nome}.
+
+    O dicionário é indexado pelo ID porque o nome de uma workspace não é único no tenant. Percorre a listagem com $skip buscando várias páginas em paralelo e aceita um $filter
+    OData aplicado no servidor. O resultado fica em cache por tenant e filtro durante
+    WORKSPACES_CACHE_TTL segundos; 'refresh' força uma nova consulta.
+    """
+    cache_key = (tenant_id or headers.get('Authorization'), filter_expr)
+    if not refresh:
+        with _workspaces_cache_lock:
+            cached = _workspaces_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return dict(cached[1])
+
+    deadline = time.monotonic() + WORKSPACES_TIMEOUT
+    workspaces = []
+    skip = 0
+    try:
+        with ThreadPoolExecutor(max_workers=WORKSPACES_PAGE_CONCURRENCY) as pool:
+            while True:
+                skips = [skip + i * WORKSPACES_PAGE_SIZE for i in range(WORKSPACES_PAGE_CONCURRENCY)]
+                pages = list(pool.map(lambda page_skip: _get_workspaces_page(headers, page_skip, filter_expr, deadline), skips))
+                for page in pages:
+                    workspaces.extend(page)
+                # Uma página incompleta indica o fim da listagem
+                if any(len(page) < WORKSPACES_PAGE_SIZE for page in pages):
+                    break
+                skip += WORKSPACES_PAGE_CONCURRENCY * WORKSPACES_PAGE_SIZE
+    except (requests.RequestException, TimeoutError, ValueError) as e:
+        # ValueError: uma página que não veio em JSON (página de erro de um proxy, por exemplo)
+        print(f"Erro ao listar as workspaces: {e}")
+        return None
+
+    workspace_dict = {workspace['id']: workspace['name'] for workspace in workspaces}
+    with _workspaces_cache_lock:
+        _workspaces_cache[cache_key] = (time.monotonic() + WORKSPACES_CACHE_TTL, workspace_dict)
+    return dict(workspace_dict)
+
+def workspace_name_filter(text):
+    """Monta o $filter OData que busca workspaces cujo nome contém o texto informado."""
+    text = (text or '').strip()
+    if not text:
+        return None
+    return "contains(name,'{}')".format(text.replace("'", "''"))
+
+def _retry_after(response, default):
+    """Lê o cabeçalho Retry-After (em segundos) ou usa o intervalo padrão."""
+    try:
+        return max(float(response.headers.get('Retry-After')), 0)
+    except (TypeError, ValueError):
+        return default
+
+def _sleep_until(deadline, wait, message):
+    """Aguarda 'wait' segundos sem ultrapassar o prazo final."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(message)
+    time.sleep(min(wait, remaining))
+
+def get_http_session():
+    """Retorna a sessão HTTP do processo, com pool de conexões persistentes."""
+    global _http_session, _http_session_pid
+    with _http_session_lock:
+        # Uma sessão herdada via fork não pode reaproveitar os sockets do processo pai
+        if _http_session is None or _http_session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session, _http_session_pid = session, os.getpid()
+        return _http_session
+
+def _endpoint_name(method, url):
+    """Nome do endpoint para as métricas, sem query string e com os ids substituídos."""
+    path = url.split('?', 1)[0]
+    if path.startswith(POWERBI_ADMIN_URL):
+        path = path[len(POWERBI_ADMIN_URL):] or '/'
+    return f"{method} {re.sub(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}', '{id}', path)}"
+
+def _record_http_call(endpoint, elapsed, retries, failed):
+    with _http_metrics_lock:
+        stats = _http_metrics.setdefault(endpoint, {'calls': 0, 'retries': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['calls'] += 1
+        stats['retries'] += retries
+        stats['errors'] += failed
+        stats['total_seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+def get_http_metrics():
+    """Retorna as métricas de latência por endpoint da API administrativa."""
+    with _http_metrics_lock:
+        rows = [{'Endpoint': endpoint,
+                 'Chamadas': stats['calls'],
+                 'Repeticoes': stats['retries'],
+                 'Erros': stats['errors'],
+                 'LatenciaMedia_ms': round(1000 * stats['total_seconds'] / stats['calls'], 1),
+                 'LatenciaMax_ms': round(1000 * stats['max_seconds'], 1)}
+                for endpoint, stats in sorted(_http_metrics.items())]
+    return pd.DataFrame(rows, columns=['Endpoint', 'Chamadas', 'Repeticoes', 'Erros', 'LatenciaMedia_ms', 'LatenciaMax_ms'])
+
+def _jitter(delay):
+    # Metade fixa e metade aleatória, para que chamadas paralelas não repitam juntas
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _admin_request(method, url, headers, deadline, **kwargs):
+    """Chama a API administrativa pela sessão compartilhada, repetindo falhas transitórias até o prazo.
+
+    Respostas 429 são repetidas enquanto houver prazo, respeitando o Retry-After; respostas
+    5xx e erros de conexão são repetidos até HTTP_MAX_RETRIES vezes com backoff e jitter,
+    só em GET, pois um POST repetido (getInfo) pode disparar um escaneamento em duplicidade.
+    """
+    session = get_http_session()
+    endpoint = _endpoint_name(method, url)
+    message = f'Tempo esgotado aguardando a API do Power BI: {url}'
+    delay = SCAN_POLL_INITIAL_DELAY
+    retries = failures = 0
+    started = time.monotonic()
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _record_http_call(endpoint, time.monotonic() - started, retries, True)
+            raise TimeoutError(message)
+        timeout = (min(HTTP_CONNECT_TIMEOUT, remaining), min(HTTP_READ_TIMEOUT, remaining))
+
+        try:
+            response = session.request(method, url=url, headers=headers, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            failures += 1
+            if method != 'GET' or failures > HTTP_MAX_RETRIES:
+                _record_http_call(endpoint, time.monotonic() - started, retries, True)
+                raise
+            wait = _jitter(delay)
         else:
-            break
-    return None
+            if response.status_code == 429:
+                wait = _retry_after(response, _jitter(delay))
+            elif response.status_code in HTTP_RETRY_STATUS and method == 'GET' and failures < HTTP_MAX_RETRIES:
+                failures += 1
+                wait = _retry_after(response, _jitter(delay))
+            else:
+                _record_http_call(endpoint, time.monotonic() - started, retries, not response.ok)
+                response.raise_for_status()
+                return response
 
-def scan_workspace(headers, workspace_id):
-    """Escaneia a workspace selecionada e recupera suas informações."""
-    url = 'https://api.powerbi.com/v1.0/myorg/admin/workspaces/getInfo?datasetSchema=True&datasetExpressions=True'
-    body = {"workspaces": [f'{workspace_id}']}
+        retries += 1
+        try:
+            _sleep_until(deadline, wait, message)
+        except TimeoutError:
+            _record_http_call(endpoint, time.monotonic() - started, retries, True)
+            raise
+        delay = min(delay * 2, SCAN_POLL_MAX_DELAY)
 
-    response = requests.post(url=url, headers=headers, json=body)
-    scanId = response.json()['id']
-        
-    time.sleep(5)  # Aguarda a finalização do escaneamento
-    
-    scan_url = f'https://api.powerbi.com/v1.0/myorg/admin/workspaces/scanResult/{scanId}'
+def start_scan(headers, workspace_ids, deadline):
+    """Dispara o getInfo para as workspaces informadas e retorna o id do escaneamento."""
+    url = f'{POWERBI_ADMIN_URL}/workspaces/getInfo?datasetSchema=True&datasetExpressions=True'
+    body = {"workspaces": [f'{workspace_id}' for workspace_id in workspace_ids]}
+    return response_json(_admin_request('POST', url, headers, deadline, json=body))['id']
+
+def wait_scan(headers, scan_id, deadline):
+    """Consulta o scanStatus com backoff adaptativo até o escaneamento terminar."""
+    url = f'{POWERBI_ADMIN_URL}/workspaces/scanStatus/{scan_id}'
+    delay = SCAN_POLL_INITIAL_DELAY
+
+    while True:
+        response = _admin_request('GET', url, headers, deadline)
+        status = response_json(response).get('status')
+        if status == 'Succeeded':
+            return
+        if status == 'Failed':
+            raise RuntimeError(f'O escaneamento {scan_id} falhou.')
+        _sleep_until(deadline, _retry_after(response, delay), f'Tempo esgotado aguardando o escaneamento {scan_id}.')
+        delay = min(delay * 2, SCAN_POLL_MAX_DELAY)
+
+def get_scan_result(headers, scan_id, deadline):
+    """Recupera o resultado de um escaneamento concluído."""
+    url = f'{POWERBI_ADMIN_URL}/workspaces/scanResult/{scan_id}'
+    return response_json(_admin_request('GET', url, headers, deadline))
+
+def scan_workspace(headers, workspace_id, timeout=None):
+    """Escaneia a workspace selecionada e recupera suas informações.
+
+    Em vez de um tempo fixo, acompanha o scanStatus com backoff adaptativo, respeitando
+    Retry-After e respostas 429, até o prazo 'timeout' (SCAN_TIMEOUT por padrão).
+    """
+    deadline = time.monotonic() + (SCAN_TIMEOUT if timeout is None else timeout)
 
-    scan_response = requests.get(url=scan_url, headers=headers)
-    reports = scan_response.json()['workspaces'][0]
+    scan_id = start_scan(headers, [workspace_id], deadline)
+    wait_scan(headers, scan_id, deadline)
+    reports = get_scan_result(headers, scan_id, deadline)['workspaces'][0]
     
     return reports
 
-def clean_reports(reports, option):
-    """Limpa o JSON recebido da API da Microsoft e armazena em um DataFrame do Pandas."""
-    df_workspaces = pd.json_normalize(reports).explode('datasets', ignore_index=True)
+def _scan_batch(headers, workspace_ids, timeout):
+    """Escaneia um lote de workspaces e retorna o scanResult completo."""
+    deadline = time.monotonic() + timeout
+    scan_id = start_scan(headers, workspace_ids, deadline)
+    wait_scan(headers, scan_id, deadline)
+    return get_scan_result(headers, scan_id, deadline)
 
-    # Filtrando e tratando o dataset principal
-    df_normalized = pd.json_normalize(df_workspaces['datasets'])
-    df_normalized = df_normalized.query(f"name == '{option}'")
+def scan_workspaces(headers, workspace_ids, batch_size=SCAN_BATCH_SIZE, max_in_flight=None, timeout=None):
+    """Escaneia muitas workspaces em lotes de até 100 ids, com vários escaneamentos simultâneos.
 
-    # Verificando se a coluna 'expressions' existe antes de tentar acessá-la
-    expected_columns = ['id', 'name', 'configuredBy', 'createdDate', 'tables']
-    if 'expressions' in df_normalized.columns:
-        expected_columns.append('expressions')
+    Gera (ids do lote, resultado) à medida que cada lote termina. O resultado é o scanResult
+    do lote (com a lista 'workspaces') ou a exceção que interrompeu aquele lote. O prazo
+    'timeout' (SCAN_TIMEOUT por padrão) vale para cada lote.
+    """
+    workspace_ids = list(workspace_ids)
+    batches = [workspace_ids[i:i + batch_size] for i in range(0, len(workspace_ids), batch_size)]
+    if not batches:
+        return
+    timeout = SCAN_TIMEOUT if timeout is None else timeout
 
-    df_normalized = df_normalized[expected_columns].copy()
-    df_normalized.rename(columns={'id': 'DatasetId', 'name': 'ReportName'}, inplace=True)
-    datasets_exploded = df_normalized.explode('tables', ignore_index=True)
+    with ThreadPoolExecutor(max_workers=min(max_in_flight or SCAN_MAX_IN_FLIGHT, len(batches))) as pool:
+        futures = {pool.submit(_scan_batch, headers, batch, timeout): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield futures[future], result
 
-    # Normalizando e tratando a tabela de 'tables'
-    tables_normalized = pd.concat([datasets_exploded[['DatasetId', 'ReportName', 'configuredBy']], pd.json_normalize(datasets_exploded['tables'])], axis=1)
-    tables_normalized.rename(columns={'name': 'NomeTabela'}, inplace=True)
-    
-    if 'source' in tables_normalized.columns:
-        tables_normalized['source'] = tables_normalized['source'].apply(lambda x: x[0]['expression'] if isinstance(x, list) and len(x) > 0 else None)
-    else:
-        tables_normalized['source'] = None
-    
-    if 'storageMode' not in tables_normalized.columns:
-        tables_normalized['storageMode'] = None
-
-    # Criando e tratando a tabela de medidas, verificando se a coluna 'measures' existe
-    if 'measures' in tables_normalized.columns:
-        measures_normalized = tables_normalized.explode('measures', ignore_index=True)
-        measures_normalized = pd.concat([measures_normalized[['NomeTabela']], pd.json_normalize(measures_normalized['measures'])], axis=1)
-        measures_normalized['name'] = measures_normalized.get('name', 'N/A')
-        measures_normalized['expression'] = measures_normalized.get('expression', 'N/A')
-        measures_normalized = measures_normalized[['NomeTabela', 'name', 'expression']]
-        measures_normalized.rename(columns={'name': 'NomeMedida', 'expression': 'ExpressaoMedida'}, inplace=True)
-    else:
-        measures_normalized = pd.DataFrame(columns=['NomeTabela', 'NomeMedida', 'ExpressaoMedida'])
-
-    # Criando e tratando a tabela de colunas, verificando se a coluna 'columns' existe
-    if 'columns' in tables_normalized.columns:
-        columns_normalized = tables_normalized.explode('columns', ignore_index=True)
-        columns_normalized = pd.concat([columns_normalized[['NomeTabela']], pd.json_normalize(columns_normalized['columns'])], axis=1)
-        
-        # Verificando se as colunas existem antes de acessá-las
-        if 'expression' in columns_normalized.columns:
-            columns_normalized['expression'] = columns_normalized['expression'].fillna('N/A')
-        else:
-            columns_normalized['expression'] = 'N/A'
-        
-        columns_normalized = columns_normalized[['NomeTabela', 'name', 'dataType', 'columnType', 'expression']]
-        columns_normalized.rename(columns={'name': 'NomeColuna', 'dataType': 'TipoDadoColuna', 'columnType': 'TipoColuna', 'expression': 'ExpressaoColuna'}, inplace=True)
-    else:
-        columns_normalized = pd.DataFrame(columns=['NomeTabela', 'NomeColuna', 'TipoDadoColuna', 'TipoColuna', 'ExpressaoColuna'])
-
-    # Verificando se a coluna 'NomeTabela' existe antes de continuar
-    if 'NomeTabela' in tables_normalized.columns:
-        tables_normalized = tables_normalized[['DatasetId', 'ReportName', 'NomeTabela', 'storageMode', 'source', 'configuredBy']]
-        tables_normalized.rename(columns={'source': 'FonteDados'}, inplace=True)
-        dataset_desnormalized = tables_normalized.merge(measures_normalized, on='NomeTabela', how='left')
-        dataset_desnormalized = dataset_desnormalized.merge(columns_normalized, on='NomeTabela', how='left')
-    else:
-        dataset_desnormalized = pd.DataFrame(columns=['DatasetId', 'ReportName', 'NomeTabela', 'storageMode', 'FonteDados', 'configuredBy', 'NomeMedida', 'ExpressaoMedida', 'NomeColuna', 'TipoDadoColuna', 'TipoColuna', 'ExpressaoColuna'])
+def get_modified_workspaces(headers, modified_since=None, exclude_personal=True):
+    """Lista os ids das workspaces alteradas desde 'modified_since' (datetime em UTC)."""
+    params = {'excludePersonalWorkspaces': exclude_personal}
+    if modified_since is not None:
+        params['modifiedSince'] = modified_since.strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+    deadline = time.monotonic() + WORKSPACES_TIMEOUT
+    response = _admin_request('GET', f'{POWERBI_ADMIN_URL}/workspaces/modified', headers, deadline, params=params)
+    return [workspace['id'] for workspace in response_json(response)]
+
+def _empty_snapshot(report_name=None):
+    return ModelSnapshot(tables_frame([], []), child_frame([], NomeMedida=[], ExpressaoMedida=[]),
+                         child_frame([], NomeColuna=[], TipoDadoColuna=[], TipoColuna=[], ExpressaoColuna=[]),
+                         report_name=report_name or 'PBIReport')
+
+def snapshots_from_datasets(datasets):
+    """Monta os ModelSnapshot de vários datasets do escaneamento em uma única passada.
+
+    As linhas de todos os datasets são acumuladas em listas únicas, cada DataFrame de medidas
+    e colunas é criado uma vez e depois fatiado pelo intervalo contíguo de cada dataset.
+    """
+    tab_names, tab_sources, tab_storage = [], [], []
+    measure_keys, measure_names, measure_expression = [], [], []
+    col_keys, col_names, col_datatypes, col_types, col_expressions = [], [], [], [], []
+    bounds = []
+
+    for dataset in datasets:
+        first_table, first_measure, first_column = len(tab_names), len(measure_keys), len(col_keys)
+
+        for table in dataset.get('tables') or []:
+            table_key = len(tab_names) - first_table
+            source = table.get('source')
+            tab_names.append(table.get('name'))
+            tab_sources.append(source[0].get('expression') if isinstance(source, list) and len(source) > 0 else None)
+            tab_storage.append(table.get('storageMode'))
+
+            for m in table.get('measures') or []:
+                measure_keys.append(table_key)
+                measure_names.append(m.get('name', 'N/A'))
+                measure_expression.append(m.get('expression', 'N/A'))
+
+            for c in table.get('columns') or []:
+                expr = c.get('expression')
+                col_keys.append(table_key)
+                col_names.append(c.get('name'))
+                col_datatypes.append(c.get('dataType'))
+                col_types.append(c.get('columnType'))
+                col_expressions.append('N/A' if expr is None else expr)
+
+        bounds.append((first_table, len(tab_names), first_measure, len(measure_keys), first_column, len(col_keys)))
 
-    return dataset_desnormalized
+    measures = child_frame(measure_keys, NomeMedida=measure_names, ExpressaoMedida=measure_expression)
+    columns = child_frame(col_keys, NomeColuna=col_names, TipoDadoColuna=col_datatypes,
+                           TipoColuna=col_types, ExpressaoColuna=col_expressions)
+
+    snapshots = []
+    for dataset, (t0, t1, m0, m1, c0, c1) in zip(datasets, bounds):
+        snapshots.append(ModelSnapshot(
+            tables=tables_frame(tab_names[t0:t1], tab_sources[t0:t1], tab_storage[t0:t1]),
+            measures=measures.iloc[m0:m1].reset_index(drop=True),
+            columns=columns.iloc[c0:c1].reset_index(drop=True),
+            report_name=dataset.get('name') or 'PBIReport',
+            dataset_id=dataset.get('id'),
+            configured_by=dataset.get('configuredBy')
+        ))
+    return snapshots
+
+class DatasetIndex:
+    """Índice dos datasets de um escaneamento por nome.
+
+    É montado uma vez por escaneamento; os modelos normalizados são criados sob demanda e
+    guardados, então selecionar (ou voltar a selecionar) um relatório é uma consulta ao dicionário.
+    """
+
+    def __init__(self, scan_response):
+        self._datasets = {}
+        for dataset in scan_response.get('datasets', []):
+            # Com nomes repetidos vale o primeiro dataset, como na busca original
+            self._datasets.setdefault(dataset.get('name'), dataset)
+        self._models = {}
+
+    def __contains__(self, name):
+        return name in self._datasets
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def report_names(self):
+        """Nomes dos datasets em modo de importação, sem os relatórios de métricas de uso."""
+        return [name for name, dataset in self._datasets.items()
+                if 'PbixInImportMode' in (dataset.get('contentProviderType') or '') and 'Usage Metrics Report' not in (name or '')]
+
+    def get(self, name):
+        """Retorna o modelo normalizado do dataset (vazio se o nome não existir)."""
+        return self.models([name])[name]
+
+    def models(self, names):
+        """Retorna {nome: modelo} para vários datasets, normalizando os que faltam em uma única passada."""
+        missing = [name for name in dict.fromkeys(names) if name not in self._models and name in self._datasets]
+        if missing:
+            self._models.update(zip(missing, snapshots_from_datasets([self._datasets[name] for name in missing])))
+        return {name: self._models[name] if name in self._models else _empty_snapshot(name) for name in names}
+
+def clean_reports(reports, option):
+    """Limpa o JSON recebido da API da Microsoft e monta o modelo normalizado do dataset.
+
+    'reports' pode ser a resposta do escaneamento ou um DatasetIndex já montado; 'option'
+    pode ser um nome (retorna o modelo) ou uma lista de nomes (retorna {nome: modelo}).
+    """
+    index = reports if isinstance(reports, DatasetIndex) else DatasetIndex(reports)
+    if isinstance(option, (list, tuple)):
+        return index.models(option)
+    return index.get(option)
 
 def extract_relationships(json_data):
     relationships = json_data['model'].get('relationships', [])
@@ -138,138 +566,596 @@ def extract_relationships(json_data):
     
     return relationship_info
 
+# Leitura incremental do DataModelSchema: o membro do ZIP é decodificado em blocos e cada
+# objeto (medida, coluna, partição, relacionamento) é lido isoladamente, então o pico de
+# memória fica limitado ao maior objeto e não ao arquivo inteiro.
+SCHEMA_CHUNK_SIZE = 1 << 20
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iter_schema_chunks(stream, encoding='utf-16-le', chunk_size=SCHEMA_CHUNK_SIZE):
+    """Decodifica o stream binário em blocos de texto, sem carregar o membro inteiro."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    first = True
+    while True:
+        raw = stream.read(chunk_size)
+        text = decoder.decode(raw, final=not raw)
+        if first and text:
+            text = text.lstrip('\ufeff')
+            first = False
+        if text:
+            yield text
+        if not raw:
+            return
+
+class _SchemaReader:
+    """Cursor sobre o texto JSON em blocos, que decodifica um valor por vez."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _more(self, min_chars=0):
+        """Descarta o trecho já consumido e lê ao menos mais um bloco (ou min_chars)."""
+        pieces = [self.buf[self.pos:]]
+        read = 0
+        while not self.eof and (read == 0 or read < min_chars):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.eof = True
+                break
+            pieces.append(chunk)
+            read += len(chunk)
+        self.buf = ''.join(pieces)
+        self.pos = 0
+
+    def peek(self):
+        """Retorna o próximo caractere significativo ('' no fim do arquivo)."""
+        while True:
+            if self.pos < len(self.buf) and self.buf[self.pos] not in ' \t\n\r':
+                return self.buf[self.pos]
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ''
+            self._more()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON inválido: esperado '{char}', encontrado '{found}'")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica o próximo valor completo, lendo mais blocos se ele estiver cortado."""
+        self.peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # Um número no fim do buffer pode continuar no próximo bloco
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            # Dobra o buffer a cada tentativa para não redecodificar objetos grandes muitas vezes
+            self._more(min_chars=len(self.buf) - self.pos)
+
+    def keys(self):
+        """Itera sobre as chaves de um objeto; o chamador deve consumir cada valor."""
+        self.expect('{')
+        while True:
+            char = self.peek()
+            if char == '}':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self.value()
+            self.expect(':')
+            yield key
+
+    def elements(self):
+        """Itera sobre os elementos de um array; o chamador deve consumir cada elemento."""
+        self.expect('[')
+        while True:
+            char = self.peek()
+            if char == ']':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            yield
+
+def _table_events(reader):
+    """Emite os eventos de uma tabela: medidas, colunas e partições e, por fim, a própria tabela."""
+    table = {}
+    pending = []
+    for key in reader.keys():
+        if key in ('measures', 'columns', 'partitions'):
+            kind = key[:-1]
+            for _ in reader.elements():
+                obj = reader.value()
+                if 'name' in table:
+                    yield kind, table['name'], obj
+                else:
+                    pending.append((kind, obj))
+        else:
+            table[key] = reader.value()
+            if key == 'name':
+                for kind, obj in pending:
+                    yield kind, table['name'], obj
+                pending = []
+    for kind, obj in pending:
+        yield kind, table.get('name'), obj
+    yield 'table', table.get('name'), table
+
+def iter_schema_events(chunks):
+    """Lê o DataModelSchema de forma incremental e emite eventos (tipo, tabela, objeto).
+
+    Tipos emitidos: 'measure', 'column', 'partition' e 'table' (ao fechar a tabela, sem os
+    filhos) para cada tabela do modelo, e 'relationship' (com tabela None).
+    """
+    reader = _SchemaReader(chunks)
+    for key in reader.keys():
+        if key != 'model':
+            reader.value()
+            continue
+        for model_key in reader.keys():
+            if model_key == 'tables':
+                for _ in reader.elements():
+                    yield from _table_events(reader)
+            elif model_key == 'relationships':
+                for _ in reader.elements():
+                    yield 'relationship', None, reader.value()
+            else:
+                reader.value()
+
+# Esquemas até este tamanho (bytes em UTF-16) são decodificados de uma vez, o que é bem mais
+# rápido; os maiores seguem pela leitura incremental para limitar o pico de memória (que se
+# multiplica pelos workers de upload_files). 0 desativa o caminho rápido
+SCHEMA_FAST_PATH_MAX_BYTES = int(os.getenv('SCHEMA_FAST_PATH_MAX_BYTES', 4 * 1024 * 1024))
+
+def schema_events(schema):
+    """Emite os mesmos eventos de iter_schema_events a partir do DataModelSchema já decodificado."""
+    for key, value in (schema.get('model') or {}).items():
+        if key == 'tables':
+            for table in value or []:
+                children = {k: v for k, v in table.items() if k in ('measures', 'columns', 'partitions')}
+                for child_key, objs in children.items():
+                    for obj in objs or []:
+                        yield child_key[:-1], table.get('name'), obj
+                yield 'table', table.get('name'), {k: v for k, v in table.items() if k not in children}
+        elif key == 'relationships':
+            for rel in value or []:
+                yield 'relationship', None, rel
+
+def read_schema(member, size):
+    """Lê o membro DataModelSchema (UTF-16 LE) e retorna os eventos do modelo.
+
+    Até SCHEMA_FAST_PATH_MAX_BYTES o membro é transcodificado em blocos de UTF-16 para bytes
+    UTF-8, que o backend JSON decodifica de uma vez; acima disso é lido de forma incremental.
+    """
+    if size <= SCHEMA_FAST_PATH_MAX_BYTES:
+        return schema_events(json_loads(schema_utf8(member)))
+    return iter_schema_events(iter_schema_chunks(member))
+
+def schema_utf8(member):
+    """Transcodifica o membro de UTF-16 LE para UTF-8, sem montar o texto inteiro nem ler o membro de uma vez."""
+    data = bytearray()
+    for text in iter_schema_chunks(member):
+        data += text.encode('utf-8')
+    return data
+
+def _snapshot_from_events(events):
+    """Monta o ModelSnapshot em uma única passada sobre os eventos do DataModelSchema."""
+    measure_keys, measure_names, measure_expression = [], [], []
+    col_keys, col_names, col_datatypes, col_types, col_expressions = [], [], [], [], []
+    tab_names, tab_sources = [], []
+    table_keys, with_source = {}, set()
+    rels = []
+
+    def table_key(name):
+        if name not in table_keys:
+            table_keys[name] = len(tab_names)
+            tab_names.append(name)
+            tab_sources.append('N/A')
+        return table_keys[name]
+
+    for kind, table_name, obj in events:
+        if kind == 'relationship':
+            rels.append({
+                'FromTable': obj.get('fromTable'),
+                'FromColumn': obj.get('fromColumn'),
+                'ToTable': obj.get('toTable'),
+                'ToColumn': obj.get('toColumn'),
+                'Cardinality': obj.get('cardinality')
+            })
+            continue
+
+        # pular tabelas de data geradas automaticamente
+        if 'DateTable' in (table_name or ''):
+            continue
+
+        key = table_key(table_name)
+
+        if kind == 'measure':
+            folder = obj.get('displayFolder')
+            full_name = f"{folder} / {obj.get('name')}" if folder else obj.get('name')
+            expr = obj.get('expression', 'N/A')
+            if isinstance(expr, list):
+                expr = ''.join(expr)
+            measure_keys.append(key)
+            measure_names.append(full_name)
+            measure_expression.append(expr)
+
+        elif kind == 'column':
+            expr = obj.get('expression', 'N/A')
+            if isinstance(expr, list):
+                expr = ''.join(expr)
+            col_keys.append(key)
+            col_names.append(obj.get('name'))
+            col_datatypes.append(obj.get('dataType', 'N/A'))
+            col_types.append(obj.get('type', 'N/A'))
+            col_expressions.append(expr)
+
+        elif kind == 'partition' and key not in with_source:
+            # Fonte (M code) da primeira partição
+            with_source.add(key)
+            mcode = (obj.get('source') or {}).get('expression', 'N/A')
+            if isinstance(mcode, list):
+                mcode = ''.join(mcode)
+            tab_sources[key] = mcode
+
+    return ModelSnapshot(
+        tables=tables_frame(tab_names, tab_sources),
+        measures=child_frame(measure_keys, NomeMedida=measure_names, ExpressaoMedida=measure_expression),
+        columns=child_frame(col_keys, NomeColuna=col_names, TipoDadoColuna=col_datatypes,
+                             TipoColuna=col_types, ExpressaoColuna=col_expressions),
+        relationships=pd.DataFrame(rels, columns=RELATIONSHIP_COLUMNS)
+    )
+
+# Cache em disco dos modelos extraídos, endereçado pelo hash do arquivo e compartilhado
+# por todas as sessões do host. Cada entrada é um diretório com um Parquet por DataFrame.
+CACHE_DIR = os.getenv('AUTODOC_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'autodoc_cache'))
+PARSE_CACHE_ENABLED = os.getenv('PARSE_CACHE', '1') != '0'
+PARSE_CACHE_MAX_BYTES = int(os.getenv('PARSE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+_PARSE_CACHE_FRAMES = ('tables', 'measures', 'columns', 'relationships')
+# Versão da extração do modelo, parte do nome de cada entrada do cache: deve ser incrementada
+# a cada mudança no que upload_file extrai, para que entradas antigas não sejam mais usadas
+# (elas saem pelo limite de tamanho, como as demais)
+PARSER_VERSION = 3
+
+def _parse_cache_dir():
+    return os.path.join(CACHE_DIR, 'parse')
+
+def _parse_cache_entry(digest):
+    return os.path.join(_parse_cache_dir(), f'{digest}-v{PARSER_VERSION}')
+
+def archive_digest(archive, block_size=1 << 20):
+    """Calcula o SHA-256 do arquivo lendo em blocos, sem copiá-lo inteiro."""
+    digest = hashlib.sha256()
+    if isinstance(archive, io.BytesIO):
+        with archive.getbuffer() as view:
+            digest.update(view)
+    else:
+        archive.seek(0)
+        for block in iter(lambda: archive.read(block_size), b''):
+            digest.update(block)
+    archive.seek(0)
+    return digest.hexdigest()
+
+def parse_cache_get(digest):
+    """Retorna o ModelSnapshot em cache para o hash informado, ou None."""
+    if not PARSE_CACHE_ENABLED:
+        return None
+    entry = _parse_cache_entry(digest)
+    if not os.path.isdir(entry):
+        return None
+    try:
+        frames = {name: pd.read_parquet(os.path.join(entry, f'{name}.parquet')) for name in _PARSE_CACHE_FRAMES}
+        with open(os.path.join(entry, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        # Marca o acesso para a política LRU
+        os.utime(entry)
+    except Exception:
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+    return ModelSnapshot(**frames, **meta)
+
+def parse_cache_put(digest, model):
+    """Grava o modelo no cache de forma atômica e aplica o limite de tamanho."""
+    if not PARSE_CACHE_ENABLED:
+        return
+    cache_dir = _parse_cache_dir()
+    entry = _parse_cache_entry(digest)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(prefix=f'.{digest}-', dir=cache_dir)
+        for name in _PARSE_CACHE_FRAMES:
+            getattr(model, name).to_parquet(os.path.join(tmp_entry, f'{name}.parquet'), index=False)
+        with open(os.path.join(tmp_entry, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'dataset_id': model.dataset_id, 'report_id': model.report_id}, f)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Outra sessão gravou a mesma entrada antes
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        _parse_cache_evict(cache_dir)
+    except Exception as e:
+        print(f"Não foi possível gravar o cache do modelo: {e}")
+
+def _parse_cache_evict(cache_dir):
+    """Remove as entradas usadas há mais tempo até o cache caber em PARSE_CACHE_MAX_BYTES."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        try:
+            size = sum(e.stat().st_size for e in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= PARSE_CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+# Uploads sem seek são copiados em blocos para um arquivo temporário que fica em memória
+# até este tamanho e depois passa para o disco
+UPLOAD_SPOOL_MAX_SIZE = int(os.getenv('UPLOAD_SPOOL_MAX_SIZE', 32 * 1024 * 1024))
+
+class _MappedArchive:
+    """Visão somente leitura de um mmap com a interface de arquivo que o ZipFile espera."""
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        # O ZipFile espera OSError (como em arquivos comuns) ao buscar antes do início
+        try:
+            self._mapped.seek(pos, whence)
+        except ValueError as e:
+            raise OSError(str(e)) from e
+        return self._mapped.tell()
+
+    def __getattr__(self, name):
+        return getattr(self._mapped, name)
+
+def _fileno(f):
+    try:
+        return f.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def _seekable(f):
+    try:
+        return f.seekable()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+@contextmanager
+def open_upload(uploaded_file):
+    """Entrega o arquivo enviado ao ZipFile sem criar cópias completas em memória.
+
+    Retorna (arquivo, tamanho). Caminhos e arquivos em disco são lidos por mmap; buffers
+    em memória com seek (como o UploadedFile do Streamlit) são usados diretamente; streams
+    sem seek são copiados em blocos para um SpooledTemporaryFile, mapeado por mmap quando
+    passa de UPLOAD_SPOOL_MAX_SIZE e vai para o disco.
+    """
+    with ExitStack() as stack:
+        if isinstance(uploaded_file, (str, os.PathLike)):
+            source = stack.enter_context(open(uploaded_file, 'rb'))
+            on_disk = True
+        elif _seekable(uploaded_file):
+            source = uploaded_file
+            on_disk = not isinstance(uploaded_file, io.BytesIO) and _fileno(uploaded_file) is not None
+        else:
+            source = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE))
+            shutil.copyfileobj(uploaded_file, source)
+            on_disk = source.tell() > UPLOAD_SPOOL_MAX_SIZE
+
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+
+        if on_disk and size > 0:
+            mapped = stack.enter_context(mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ))
+            source = _MappedArchive(mapped)
+
+        yield source, size
+
 def upload_file(uploaded_file):
-    """Processa o upload do arquivo .pbit ou .zip e extrai os dados relevantes."""
+    """Processa o upload do arquivo .pbit ou .zip e extrai os dados relevantes.
+
+    O .zip pode conter um .pbit extraído (DataModelSchema) ou um projeto PBIP, com o
+    modelo em model.bim ou em TMDL (definition/tables/*.tmdl).
+
+    Aceita o UploadedFile do Streamlit, qualquer objeto de arquivo com 'name' ou um caminho.
+    """
     # Verifica se o arquivo não é nulo ou vazio
     if uploaded_file is None:
         return 'Nenhum arquivo foi selecionado'
-    
+
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        file_name = os.path.basename(uploaded_file)
+    else:
+        file_name = os.path.basename(uploaded_file.name)
+
     # Aceita .pbit ou .zip
-    if not uploaded_file.name.endswith(('.pbit', '.zip')):
+    if not file_name.endswith(('.pbit', '.zip')):
         return 'Arquivo não suportado'
 
-    # Lê o conteúdo do arquivo
-    file_content = uploaded_file.read()
-    if not file_content or len(file_content) == 0:
-        return 'O arquivo está vazio'
-
     datasetid_content = None
     reportid_content = None
-    reportname_content = uploaded_file.name.rsplit('.', 1)[0]
-    content = {}  # <- IMPORTANT: inicializar para evitar UnboundLocalError
-
-    # Garantir um buffer "seekable"
-    buf = io.BytesIO(file_content)
+    reportname_content = file_name.rsplit('.', 1)[0]
 
     try:
-        with ZipFile(buf, 'r') as zipf:
-            members = set(zipf.namelist())
-
-            # alguns pacotes trazem subpastas; casamos pelo sufixo
-            def open_member(name):
-                for m in members:
-                    if m.endswith(name):
-                        return zipf.open(m)
-                return None
-
-            # Connections (UTF-8)
-            f = open_member('Connections')
-            if f is not None:
-                connections_content = json.loads(f.read().decode('utf-8'))
-                ra = (connections_content.get('RemoteArtifacts') or [{}])[0]
-                datasetid_content = ra.get('DatasetId')
-                reportid_content  = ra.get('ReportId')
-
-            # DataModelSchema (UTF-16 LE)
-            f = open_member('DataModelSchema')
-            if f is None:
-                return "Arquivo inválido: não contém 'DataModelSchema'."
-            raw = f.read()
-            try:
-                content = json.loads(raw.decode('utf-16-le'))
-            except Exception as e:
-                return f"Falha ao ler DataModelSchema (UTF-16-LE): {e}"
+        with open_upload(uploaded_file) as (archive, size):
+            if size == 0:
+                return 'O arquivo está vazio'
+
+            # Uploads repetidos do mesmo arquivo são servidos pelo cache
+            digest = archive_digest(archive)
+            cached = parse_cache_get(digest)
+            if cached is not None:
+                cached.report_name = reportname_content or 'PBIReport'
+                return cached
+
+            with ZipFile(archive, 'r') as zipf:
+                members = set(zipf.namelist())
+
+                # alguns pacotes trazem subpastas; casamos pelo sufixo
+                def find_member(name):
+                    for m in members:
+                        if m.endswith(name):
+                            return zipf.getinfo(m)
+                    return None
+
+                # Connections (UTF-8)
+                info = find_member('Connections')
+                if info is not None:
+                    with zipf.open(info) as f:
+                        connections_content = json_loads(f.read())
+                    ra = (connections_content.get('RemoteArtifacts') or [{}])[0]
+                    datasetid_content = ra.get('DatasetId')
+                    reportid_content  = ra.get('ReportId')
+
+                # DataModelSchema (UTF-16 LE) do .pbit
+                info = find_member('DataModelSchema')
+                if info is not None:
+                    try:
+                        with zipf.open(info) as f:
+                            model = _snapshot_from_events(read_schema(f, info.file_size))
+                    except Exception as e:
+                        return f"Falha ao ler DataModelSchema (UTF-16-LE): {e}"
+
+                # Projeto PBIP zipado: model.bim (TMSL, UTF-8) ou pasta definition/ em TMDL
+                elif (info := find_member('model.bim')) is not None:
+                    try:
+                        with zipf.open(info) as f:
+                            model = _snapshot_from_events(schema_events(json_loads(f.read().decode('utf-8-sig'))))
+                    except Exception as e:
+                        return f"Falha ao ler model.bim: {e}"
+                elif find_definition(members) is not None:
+                    try:
+                        model = _snapshot_from_events(tmdl_events(zipf, members))
+                    except Exception as e:
+                        return f"Falha ao ler o modelo TMDL: {e}"
+                else:
+                    return "Arquivo inválido: não contém 'DataModelSchema'."
 
     except BadZipFile:
         return 'Arquivo inválido: não é um ZIP/PBIT válido.'
     except Exception as e:
         return f'Falha ao abrir o arquivo: {e}'
 
-    # --------- Extração dos dados ---------
-    df_columns = pd.DataFrame()
-    df_tables  = pd.DataFrame()
-    measure_names, measure_expression, tables_names = [], [], []
+    model.dataset_id = datasetid_content or '0'
+    model.report_id = reportid_content
+    parse_cache_put(digest, model)
 
-    model = content.get('model', {})
-    for rows in model.get('tables', []):
-        # pular tabelas de data geradas automaticamente
-        if 'DateTable' in rows.get('name', ''):
-            continue
+    model.report_name = reportname_content or 'PBIReport'
+    return model
 
-        # Medidas
-        for m in rows.get('measures', []):
-            folder = m.get('displayFolder')
-            full_name = f"{folder} / {m.get('name')}" if folder else m.get('name')
-            expr = m.get('expression', 'N/A')
-            if isinstance(expr, list):
-                expr = ''.join(expr)
-            tables_names.append(rows.get('name'))
-            measure_names.append(full_name)
-            measure_expression.append(expr)
+# Número de processos usados para processar vários arquivos de uma vez
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', min(4, os.cpu_count() or 1)))
 
-        # Colunas
-        for c in rows.get('columns', []):
-            col_data = pd.DataFrame([{
-                'NomeTabela': rows.get('name'),
-                'NomeColuna': c.get('name'),
-                'TipoDadoColuna': c.get('dataType', 'N/A'),
-                'TipoColuna': c.get('type', 'N/A'),
-                'ExpressaoColuna': c.get('expression', 'N/A')
-            }])
-            df_columns = pd.concat([df_columns, col_data], ignore_index=True)
-
-        # Fonte (M code) da primeira partição, se existir
-        part = (rows.get('partitions') or [{}])[0]
-        src = part.get('source', {})
-        mcode = src.get('expression', 'N/A')
-        if isinstance(mcode, list):
-            mcode = ''.join(mcode)
-
-        df_tables_rows = pd.DataFrame([{
-            'DatasetId': datasetid_content or '0',
-            'ReportId':  reportid_content,
-            'ReportName': reportname_content or 'PBIReport',
-            'NomeTabela': rows.get('name'),
-            'FonteDados': mcode
-        }])
-        df_tables = pd.concat([df_tables, df_tables_rows], ignore_index=True)
-
-    # Normalizações finais
-    df_columns['ExpressaoColuna'] = df_columns['ExpressaoColuna'].apply(
-        lambda v: ''.join(v) if isinstance(v, list) else v
-    )
+# Pool de processos do upload_files, criado uma vez e reaproveitado entre reruns. Os processos
+# são iniciados por 'spawn': um fork do servidor do Streamlit, que já tem outras threads
+# (Tornado, renovação de tokens, tokenizador), pode herdar locks presos e travar.
+_upload_pool = None
+_upload_pool_key = None
+_upload_pool_lock = threading.Lock()
 
-    df_measures = pd.DataFrame({
-        'NomeTabela': tables_names,
-        'NomeMedida': measure_names,
-        'ExpressaoMedida': measure_expression
-    })
+def get_upload_pool(max_workers=None):
+    """Pool de processos compartilhado para upload_files (recriado se o tamanho mudar)."""
+    global _upload_pool, _upload_pool_key
+    key = (os.getpid(), max_workers or UPLOAD_WORKERS)
+    with _upload_pool_lock:
+        if _upload_pool is None or _upload_pool_key != key:
+            if _upload_pool is not None and _upload_pool_key[0] == os.getpid():
+                _upload_pool.shutdown(wait=False)
+            _upload_pool = ProcessPoolExecutor(max_workers=key[1], mp_context=multiprocessing.get_context('spawn'))
+            _upload_pool_key = key
+        return _upload_pool
 
-    # Relacionamentos (se existirem)
-    rels = []
-    for r in model.get('relationships', []):
-        rels.append({
-            'FromTable': r.get('fromTable'),
-            'FromColumn': r.get('fromColumn'),
-            'ToTable': r.get('toTable'),
-            'ToColumn': r.get('toColumn'),
-            'Cardinality': r.get('cardinality')
-        })
-    df_relationships = pd.DataFrame(rels)
+@atexit.register
+def _shutdown_upload_pool():
+    if _upload_pool is not None and _upload_pool_key[0] == os.getpid():
+        _upload_pool.shutdown(wait=False, cancel_futures=True)
 
-    df_normalized = pd.merge(
-        pd.merge(df_tables, df_measures, on='NomeTabela', how='left'),
-        df_columns, on='NomeTabela', how='left'
-    )
+def _cached_upload(uploaded_file):
+    """ModelSnapshot do cache de modelos para o arquivo enviado, ou None se não estiver em cache."""
+    if not PARSE_CACHE_ENABLED or not os.path.basename(uploaded_file.name).endswith(('.pbit', '.zip')):
+        return None
+    # Um stream sem seek só pode ser lido uma vez, pelo upload_file
+    if not _seekable(uploaded_file):
+        return None
+    try:
+        with open_upload(uploaded_file) as (archive, size):
+            cached = parse_cache_get(archive_digest(archive)) if size else None
+    except Exception:
+        return None
+    if cached is not None:
+        cached.report_name = os.path.basename(uploaded_file.name).rsplit('.', 1)[0] or 'PBIReport'
+    return cached
+
+def upload_files(uploaded_files, max_workers=None):
+    """Processa vários arquivos .pbit/.zip em paralelo em um pool de processos.
+
+    Gera (índice, nome, resultado) à medida que cada arquivo termina, em ordem de conclusão.
+    O resultado é o mesmo de upload_file (ModelSnapshot ou mensagem de erro) ou a exceção
+    levantada pelo processamento. Os arquivos que estão no cache de modelos são servidos no
+    próprio processo; só os demais são gravados uma vez em um diretório temporário com o
+    nome original e processados no pool (get_upload_pool), que os lê por mmap.
+    """
+    pending = []
+    for idx, uploaded_file in enumerate(uploaded_files):
+        cached = _cached_upload(uploaded_file)
+        if cached is not None:
+            yield idx, uploaded_file.name, cached
+        else:
+            pending.append((idx, uploaded_file))
 
-    return df_normalized, df_relationships
+    if len(pending) <= 1 or (max_workers or UPLOAD_WORKERS) <= 1:
+        for idx, uploaded_file in pending:
+            try:
+                result = upload_file(uploaded_file)
+            except Exception as e:
+                result = e
+            yield idx, uploaded_file.name, result
+        return
+
+    pool = get_upload_pool(max_workers)
+    with tempfile.TemporaryDirectory(prefix='autodoc_upload_') as tmp_dir:
+        futures = {}
+        for idx, uploaded_file in pending:
+            file_dir = os.path.join(tmp_dir, str(idx))
+            os.mkdir(file_dir)
+            path = os.path.join(file_dir, os.path.basename(uploaded_file.name))
+            uploaded_file.seek(0)
+            with open(path, 'wb') as out:
+                shutil.copyfileobj(uploaded_file, out)
+            futures[pool.submit(upload_file, path)] = (idx, uploaded_file.name)
+
+        for future in as_completed(futures):
+            idx, name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield idx, name, result
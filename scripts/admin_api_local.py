@@ -0,0 +1,177 @@
+"""Serviço local que imita a API administrativa do Power BI, para testar o escaneamento sem um tenant.
+
+Atende getInfo, scanStatus, scanResult, a listagem de workspaces (/groups) e
+/workspaces/modified. O comportamento de cada cenário fica em AdminAPIState: duração do
+escaneamento (ou nunca termina), escaneamento que falha, respostas 429 com Retry-After no
+getInfo, respostas 5xx e listagens que não vêm em JSON. Para usar com o app, aponte POWERBI_ADMIN_URL para o endereço impresso:
+
+    python scripts/admin_api_local.py --port 8765 --scan-seconds 3
+    POWERBI_ADMIN_URL=http://127.0.0.1:8765/v1.0/myorg/admin streamlit run app.py
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ADMIN_PATH = '/v1.0/myorg/admin'
+
+class AdminAPIState:
+    """Cenário simulado e registro das chamadas recebidas.
+
+    'scan_seconds' é o tempo até o scanStatus responder Succeeded (None = nunca termina);
+    'fail' faz o escaneamento terminar como Failed; 'throttle_getinfo' é quantos getInfo são
+    recusados com 429 e 'retry_after' o Retry-After dessas recusas; 'server_errors' é quantas
+    chamadas seguidas respondem 503 antes das respostas normais; 'html_groups' é quantas
+    listagens de /groups respondem 200 com uma página HTML, como faz um proxy no meio do caminho.
+    """
+
+    def __init__(self, scan_seconds=1.0, fail=False, throttle_getinfo=0, retry_after=0.2, server_errors=0, n_workspaces=5,
+                 html_groups=0):
+        self.scan_seconds = scan_seconds
+        self.fail = fail
+        self.throttle_getinfo = throttle_getinfo
+        self.retry_after = retry_after
+        self.server_errors = server_errors
+        self.html_groups = html_groups
+        self.workspaces = [{'id': f'ws{i}', 'name': f'Workspace {i}'} for i in range(n_workspaces)]
+        self.modified = [workspace['id'] for workspace in self.workspaces]
+        self.scans = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def record(self, method, path):
+        with self.lock:
+            self.calls.append((time.monotonic(), method, urlparse(path).path))
+
+    def count(self, method, fragment):
+        with self.lock:
+            return sum(1 for _, m, path in self.calls if m == method and fragment in path)
+
+    def times(self, method, fragment):
+        with self.lock:
+            return [at for at, m, path in self.calls if m == method and fragment in path]
+
+def _dataset(workspace_id):
+    return {'id': f'ds-{workspace_id}', 'name': f'Dataset {workspace_id}', 'contentProviderType': 'PbixInImportMode',
+            'tables': [{'name': 'Vendas', 'source': [{'expression': 'let Fonte = 1 in Fonte'}],
+                        'measures': [{'name': 'Total', 'expression': 'SUM(Vendas[Valor])'}],
+                        'columns': [{'name': 'Valor', 'dataType': 'Double', 'columnType': 'Data'}]}]}
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_html(self, status, text):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _server_error(self):
+        with self.state.lock:
+            if self.state.server_errors <= 0:
+                return False
+            self.state.server_errors -= 1
+        self._send(503, {'error': 'ServiceUnavailable'}, {'Retry-After': '0.1'})
+        return True
+
+    def do_POST(self):
+        self.state.record('POST', self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self._server_error():
+            return
+        if urlparse(self.path).path != f'{ADMIN_PATH}/workspaces/getInfo':
+            return self._send(404, {})
+        with self.state.lock:
+            throttled = self.state.throttle_getinfo > 0
+            if throttled:
+                self.state.throttle_getinfo -= 1
+            else:
+                scan_id = str(uuid.uuid4())
+                self.state.scans[scan_id] = {'started': time.monotonic(), 'workspaces': body.get('workspaces', [])}
+        if throttled:
+            return self._send(429, {'error': 'TooManyRequests'}, {'Retry-After': str(self.state.retry_after)})
+        self._send(202, {'id': scan_id, 'status': 'NotStarted'})
+
+    def do_GET(self):
+        self.state.record('GET', self.path)
+        if self._server_error():
+            return
+        url = urlparse(self.path)
+        path = url.path
+        if path.startswith(f'{ADMIN_PATH}/workspaces/scanStatus/'):
+            scan = self.state.scans.get(path.rsplit('/', 1)[1])
+            if scan is None:
+                return self._send(404, {})
+            elapsed = time.monotonic() - scan['started']
+            done = self.state.scan_seconds is not None and elapsed >= self.state.scan_seconds
+            status = ('Failed' if self.state.fail else 'Succeeded') if done else 'Running'
+            return self._send(200, {'id': path.rsplit('/', 1)[1], 'status': status})
+        if path.startswith(f'{ADMIN_PATH}/workspaces/scanResult/'):
+            scan = self.state.scans.get(path.rsplit('/', 1)[1])
+            if scan is None:
+                return self._send(404, {})
+            return self._send(200, {'workspaces': [{'id': workspace_id, 'name': workspace_id, 'datasets': [_dataset(workspace_id)]}
+                                                   for workspace_id in scan['workspaces']]})
+        if path == f'{ADMIN_PATH}/workspaces/modified':
+            return self._send(200, [{'id': workspace_id} for workspace_id in self.state.modified])
+        if path == f'{ADMIN_PATH}/groups':
+            with self.state.lock:
+                html = self.state.html_groups > 0
+                if html:
+                    self.state.html_groups -= 1
+            if html:
+                return self._send_html(200, '<html><body>Gateway</body></html>')
+            query = parse_qs(url.query)
+            top = int(query.get('$top', ['100'])[0])
+            skip = int(query.get('$skip', ['0'])[0])
+            return self._send(200, {'value': self.state.workspaces[skip:skip + top]})
+        self._send(404, {})
+
+def serve(state, port=0):
+    """Sobe o serviço em uma thread e retorna (servidor, URL base da API administrativa).
+
+    O cenário pode ser trocado entre testes atribuindo um novo AdminAPIState a servidor.state.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}{ADMIN_PATH}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scan-seconds', type=float, default=3.0, help='duração de cada escaneamento (negativo = nunca termina)')
+    parser.add_argument('--fail', action='store_true', help='os escaneamentos terminam como Failed')
+    parser.add_argument('--throttle', type=int, default=0, help='getInfo recusados com 429 antes de aceitar')
+    args = parser.parse_args()
+
+    state = AdminAPIState(scan_seconds=args.scan_seconds if args.scan_seconds >= 0 else None, fail=args.fail, throttle_getinfo=args.throttle)
+    server, url = serve(state, args.port)
+    print(f'POWERBI_ADMIN_URL={url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark do agrupamento de trechos em chamadas ao LLM (plan_chunks).
+
+Gera medidas sintéticas com tamanhos log-normais (a maioria curta, algumas expressões DAX
+longas) e compara os modos 'ordered' (guloso, na ordem) e 'ffd' (first-fit decreasing) em
+quantidade de chamadas, preenchimento médio de cada chamada e tempo de planejamento.
+
+    python scripts/bench_chunks.py
+    python scripts/bench_chunks.py --measures 1000 5000 --max-tokens 2048 8192 --seed 7
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documenta import plan_chunks
+
+_WORDS = ['CALCULATE', 'SUM', 'FILTER', 'ALL', 'DIVIDE', 'SUMX', 'VALUES', 'Vendas', 'Valor', 'Quantidade',
+          'Data', 'Cliente', 'Produto', '>', '=', '+', '0', '1', 'Ano', 'Mes']
+
+def make_segments(n_measures, seed, mu=3.5, sigma=1.0):
+    """Trechos de medidas como os de textos_medidas, com expressões de tamanho log-normal (em palavras)."""
+    rng = random.Random(seed)
+    segments = []
+    for i in range(n_measures):
+        size = max(1, int(rng.lognormvariate(mu, sigma)))
+        expression = ' '.join(rng.choice(_WORDS) for _ in range(size))
+        segments.append(f'<tag>Nome da Medida: Medida {i}\nExpressão DAX: {expression}\n')
+    return segments
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--measures', type=int, nargs='+', default=[500, 2000, 5000])
+    parser.add_argument('--max-tokens', type=int, nargs='+', default=[2048, 4096, 8192])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'medidas':>8} {'max_tokens':>10} {'modo':>8} {'chamadas':>9} {'preench_medio':>14} {'plano_ms':>9}")
+    for n_measures in args.measures:
+        segments = make_segments(n_measures, args.seed)
+        for max_tokens in args.max_tokens:
+            calls = {}
+            for mode in ('ordered', 'ffd'):
+                start = time.perf_counter()
+                plan = plan_chunks(segments, max_tokens, mode)
+                seconds = time.perf_counter() - start
+                fill = sum(plan.fill_ratios) / plan.calls
+                calls[mode] = plan.calls
+                print(f'{n_measures:>8} {max_tokens:>10} {mode:>8} {plan.calls:>9} {fill:>14.1%} {seconds * 1000:>9.1f}')
+            saved = 1 - calls['ffd'] / calls['ordered']
+            print(f"{'':>8} {'':>10} {'ffd':>8} economiza {saved:.1%} das chamadas")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark dos backends JSON e dos caminhos de leitura do DataModelSchema.
+
+Para cada template sintético compara o backend (json padrão e orjson, se instalado) e o
+caminho de leitura (de uma vez ou incremental), medindo o melhor
+tempo de upload_file e o pico de memória acima da linha de base. Cada combinação roda em um
+processo novo, para que o pico de uma não contamine a outra.
+
+    python scripts/bench_json.py
+    python scripts/bench_json.py --tables 100 500 2000 --repeat 5
+"""
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from zipfile import ZipFile
+
+os.environ['PARSE_CACHE'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelo_sintetico import make_schema, make_pbit
+
+def _peak_mb():
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def _run(path, backend, one_pass, repeat):
+    import relatorio
+    relatorio.JSON_BACKEND = backend
+    relatorio.SCHEMA_FAST_PATH_MAX_BYTES = sys.maxsize if one_pass else 0
+    baseline = _peak_mb()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        relatorio.upload_file(path)
+        best = min(best, time.perf_counter() - start)
+    return best, _peak_mb() - baseline
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--cols', type=int, default=50, help='colunas por tabela')
+    parser.add_argument('--measures', type=int, default=10, help='medidas por tabela')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import orjson  # noqa: F401
+        backends = ['json', 'orjson']
+    except ImportError:
+        print('orjson não instalado: comparando só os caminhos de leitura com o json padrão')
+        backends = ['json']
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'tabelas':>8} {'schema_MB':>10} {'backend':>8} {'leitura':>11} {'tempo_ms':>9} {'pico_MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_tables in args.tables:
+            path = os.path.join(tmp, f'sintetico_{n_tables}.pbit')
+            with open(path, 'wb') as f:
+                f.write(make_pbit(make_schema(n_tables, args.cols, args.measures)))
+            with ZipFile(path) as z:
+                schema_mb = z.getinfo('DataModelSchema').file_size / 1024 / 1024
+            for backend in backends:
+                for one_pass in (True, False):
+                    with context.Pool(1) as pool:
+                        seconds, peak = pool.apply(_run, (path, backend, one_pass, args.repeat))
+                    leitura = 'de uma vez' if one_pass else 'incremental'
+                    print(f'{n_tables:>8} {schema_mb:>10.1f} {backend:>8} {leitura:>11} {seconds * 1000:>9.1f} {peak:>8.1f}')
+
+if __name__ == '__main__':
+    main()
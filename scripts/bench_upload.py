@@ -0,0 +1,54 @@
+"""Benchmark de regressão do upload_file: o tempo de leitura deve crescer linearmente com o modelo.
+
+Gera templates sintéticos de tamanho crescente, mede o melhor tempo de upload_file de cada um
+(sem o cache em disco) e mostra o tempo por coluna. Se o tempo por coluna do maior modelo
+passar de --max-ratio vezes o do menor, o crescimento deixou de ser linear e o script sai com
+código 1.
+
+    python scripts/bench_upload.py
+    python scripts/bench_upload.py --tables 2 200 2000 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+
+os.environ['PARSE_CACHE'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from relatorio import upload_file
+from modelo_sintetico import make_schema, make_pbit, Upload
+
+def bench(n_tables, n_cols, n_meas, repeat):
+    data = make_pbit(make_schema(n_tables, n_cols, n_meas))
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = upload_file(Upload(data, 'sintetico.pbit'))
+        best = min(best, time.perf_counter() - start)
+        if isinstance(result, str):
+            sys.exit(f'upload_file falhou: {result}')
+    return n_tables * n_cols, n_tables * n_meas, len(data), best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, nargs='+', default=[2, 20, 100, 200, 500, 1000])
+    parser.add_argument('--cols', type=int, default=50, help='colunas por tabela')
+    parser.add_argument('--measures', type=int, default=10, help='medidas por tabela')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-ratio', type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"{'tabelas':>8} {'colunas':>8} {'medidas':>8} {'pbit_KB':>9} {'tempo_ms':>9} {'us/coluna':>10}")
+    per_column = []
+    for n_tables in args.tables:
+        n_columns, n_measures, size, seconds = bench(n_tables, args.cols, args.measures, args.repeat)
+        per_column.append(seconds / max(n_columns, 1) * 1e6)
+        print(f'{n_tables:>8} {n_columns:>8} {n_measures:>8} {size / 1024:>9.0f} {seconds * 1000:>9.1f} {per_column[-1]:>10.2f}')
+
+    ratio = per_column[-1] / per_column[0]
+    print(f'tempo por coluna, maior / menor modelo: {ratio:.2f}x (limite {args.max_ratio}x)')
+    sys.exit(0 if ratio <= args.max_ratio else 1)
+
+if __name__ == '__main__':
+    main()
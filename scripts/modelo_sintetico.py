@@ -0,0 +1,44 @@
+import io
+import json
+from zipfile import ZipFile, ZIP_DEFLATED
+
+# Templates .pbit sintéticos para os benchmarks desta pasta. O DataModelSchema segue o formato
+# gerado pelo Power BI Desktop (JSON em UTF-16 LE), com colunas calculadas, medidas em pastas,
+# partições com código M em várias linhas, um relacionamento e uma tabela de datas automática.
+
+def make_schema(n_tables=10, n_cols=10, n_meas=5):
+    """DataModelSchema com 'n_tables' tabelas de 'n_cols' colunas e 'n_meas' medidas cada."""
+    tables = []
+    for t in range(n_tables):
+        tables.append({
+            'name': f'Tabela {t}',
+            'columns': [{'name': f'Coluna{c}', 'dataType': 'string',
+                         **({'type': 'calculated', 'expression': ['RELATED(', f"'Tabela {t}'[Coluna0])"]} if c % 3 == 0 else {})}
+                        for c in range(n_cols)],
+            'measures': [{'name': f'Medida {t}.{m}', 'expression': f"SUM('Tabela {t}'[Coluna{m % max(n_cols, 1)}])",
+                          **({'displayFolder': 'KPIs'} if m % 2 else {})}
+                         for m in range(n_meas)],
+            'partitions': [{'name': f'Tabela {t}', 'source': {'type': 'm', 'expression': [
+                'let', f'    Fonte = Sql.Database("servidor", "base"),', f'    Dados = Fonte{{[Schema="dbo",Item="tabela_{t}"]}}[Data]', 'in', '    Dados']}}],
+        })
+    tables.append({'name': 'LocalDateTable_0', 'columns': [{'name': 'Date', 'dataType': 'dateTime'}]})
+    return {'name': 'modelo_sintetico', 'compatibilityLevel': 1550,
+            'model': {'culture': 'pt-BR', 'tables': tables,
+                      'relationships': [{'name': 'r1', 'fromTable': 'Tabela 0', 'fromColumn': 'Coluna1',
+                                         'toTable': 'Tabela 1', 'toColumn': 'Coluna1', 'cardinality': 'many'}]}}
+
+def make_pbit(schema):
+    """Bytes de um .pbit com o DataModelSchema informado."""
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as z:
+        z.writestr('Version', '1.28')
+        z.writestr('Connections', json.dumps({'RemoteArtifacts': [{'DatasetId': 'dataset', 'ReportId': 'relatorio'}]}))
+        z.writestr('DataModelSchema', json.dumps(schema).encode('utf-16-le'))
+    return buffer.getvalue()
+
+class Upload(io.BytesIO):
+    """Arquivo em memória com 'name', como o UploadedFile do Streamlit."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
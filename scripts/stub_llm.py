@@ -0,0 +1,203 @@
+"""LLM local para testes e benchmarks sem rede.
+
+Modelos com o prefixo "stub/" (ex.: stub/echo) respondem com um JSON no formato esperado
+pelos prompts, montado a partir dos nomes de medidas e tabelas presentes na mensagem, após
+STUB_LLM_LATENCY segundos. O app não sabe deste módulo: os scripts chamam install(), que
+encaminha para cá as chamadas do documenta a esses modelos.
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import httpx
+from litellm import RateLimitError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokenizador import count_tokens
+
+STUB_PREFIX = 'stub/'
+STUB_LLM_LATENCY = float(os.getenv('STUB_LLM_LATENCY', 0.5))
+# Tamanho (caracteres) de cada pedaço das respostas em streaming
+STUB_STREAM_PIECE = 40
+# Limites por minuto impostos pelo provedor simulado (0 = sem limite). Acima deles a chamada é
+# recusada com RateLimitError (429) e o cabeçalho retry-after, como fazem os provedores reais.
+STUB_LLM_RPM = int(os.getenv('STUB_LLM_RPM', 0))
+STUB_LLM_TPM = int(os.getenv('STUB_LLM_TPM', 0))
+
+_MEASURE = re.compile(r'Nome da medida: (.*?) Expressão da medida:')
+_SOURCE = re.compile(r'NomeTabela: (.*?) Fonte de Dados:')
+_REPORT = re.compile(r'Relatório: (.*)')
+
+def is_stub(modelo):
+    return (modelo or '').startswith(STUB_PREFIX)
+
+# Falhas programadas por modelo: [erro, chamadas restantes, pedaços enviados antes do erro]
+_failures = {}
+_failures_lock = threading.Lock()
+
+def fail(model, error, times=1, after_pieces=0):
+    """As próximas 'times' chamadas a 'model' levantam 'error'.
+
+    Em streaming, 'after_pieces' pedaços da resposta são enviados antes do erro, como em uma
+    conexão que cai no meio da resposta. fail(model, None) cancela as falhas programadas.
+    """
+    with _failures_lock:
+        if error is None:
+            _failures.pop(model, None)
+        else:
+            _failures[model] = [error, times, after_pieces]
+
+def _take_failure(model):
+    with _failures_lock:
+        failure = _failures.get(model)
+        if failure is None:
+            return None, 0
+        failure[1] -= 1
+        if failure[1] <= 0:
+            del _failures[model]
+        return failure[0], failure[2]
+
+class _Quota:
+    """Cotas de requisições e tokens do provedor simulado, reabastecidas continuamente."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.levels = {}
+
+    def charge(self, model, tokens):
+        with self.lock:
+            now = time.monotonic()
+            retry_after = 0.0
+            charges = []
+            for kind, limit, amount in (('rpm', STUB_LLM_RPM, 1), ('tpm', STUB_LLM_TPM, tokens)):
+                if not limit:
+                    continue
+                key = (model, kind)
+                level, updated = self.levels.get(key, (limit, now))
+                level = min(limit, level + (now - updated) * limit / 60)
+                self.levels[key] = (level, now)
+                if amount > level:
+                    retry_after = max(retry_after, (min(amount, limit) - level) * 60 / limit)
+                charges.append((key, amount))
+            if retry_after:
+                raise RateLimitError(f'Limite do provedor simulado excedido para {model}.', llm_provider='stub', model=model,
+                                     response=httpx.Response(429, headers={'retry-after': f'{retry_after:.3f}'},
+                                                             request=httpx.Request('POST', 'http://stub.local/chat/completions')))
+            for key, amount in charges:
+                self.levels[key] = (self.levels[key][0] - amount, now)
+
+_quota = _Quota()
+
+def _prompt_tokens(messages):
+    return sum(count_tokens(m.get('content') or '') for m in messages)
+
+def _content(messages, response_format=None):
+    """JSON da resposta; com um response_format json_schema, só as chaves do esquema, como faria o provedor."""
+    text = '\n'.join(message.get('content') or '' for message in messages)
+    report = _REPORT.search(text)
+    measures = [name.strip() for name in _MEASURE.findall(text)]
+    sources = [name.strip() for name in _SOURCE.findall(text)]
+    content = {
+        'Relatorio': {
+            'Titulo': report.group(1).strip() if report else 'Relatório',
+            'Descricao': 'Documentação gerada pelo LLM local de testes.',
+            'Principais_KPIs_e_Metricas': measures[:5],
+            'Publico_Alvo': 'Testes',
+            'Exemplos_de_Uso': []
+        },
+        'Tabelas_do_Relatorio': [{'Nome': name, 'Descricao': f'Tabela {name}.'} for name in sources],
+        'Medidas_do_Relatorio': [{'Nome': name, 'Descricao': f'Medida {name}.'} for name in measures],
+        'Fontes_de_Dados': [{'Nome': name, 'Descricao': f'Fonte da tabela {name}.', 'Tabelas_Contidas_no_M': [name], 'NomeTabela': name}
+                            for name in sources]
+    }
+    if response_format and response_format.get('type') == 'json_schema':
+        properties = response_format['json_schema']['schema']['properties']
+        content = {key: value for key, value in content.items() if key in properties}
+    return json.dumps(content, ensure_ascii=False)
+
+def _generate(messages, max_tokens, response_format=None):
+    """Conteúdo da resposta e finish_reason; acima de max_tokens a resposta é cortada ('length')."""
+    content = _content(messages, response_format)
+    tokens = count_tokens(content)
+    if max_tokens and tokens > max_tokens:
+        return content[:len(content) * max_tokens // tokens], 'length'
+    return content, 'stop'
+
+def _response(model, messages, max_tokens=None, response_format=None):
+    content, finish_reason = _generate(messages, max_tokens, response_format)
+    usage = SimpleNamespace(prompt_tokens=_prompt_tokens(messages),
+                            completion_tokens=count_tokens(content))
+    usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+    return SimpleNamespace(model=model, choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)], usage=usage)
+
+def _pieces(messages, max_tokens, response_format=None):
+    """Pedaços da resposta no formato dos chunks de streaming do litellm."""
+    content, finish_reason = _generate(messages, max_tokens, response_format)
+    pieces = [content[i:i + STUB_STREAM_PIECE] for i in range(0, len(content), STUB_STREAM_PIECE)] or ['']
+    return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=finish_reason if i == len(pieces) - 1 else None)])
+            for i, piece in enumerate(pieces)]
+
+def _stream(chunks, error=None, after_pieces=0):
+    # Metade da latência antes do primeiro pedaço e o restante distribuído entre os pedaços
+    for i, chunk in enumerate(chunks):
+        if error is not None and i == after_pieces:
+            raise error
+        time.sleep(STUB_LLM_LATENCY / 2 / len(chunks))
+        yield chunk
+
+async def _astream(chunks, error=None, after_pieces=0):
+    for i, chunk in enumerate(chunks):
+        if error is not None and i == after_pieces:
+            raise error
+        await asyncio.sleep(STUB_LLM_LATENCY / 2 / len(chunks))
+        yield chunk
+
+def completion(model, messages, stream=False, **kwargs):
+    """Equivalente local de litellm.completion."""
+    max_tokens = kwargs.get('max_tokens', 0)
+    response_format = kwargs.get('response_format')
+    _quota.charge(model, _prompt_tokens(messages) + max_tokens)
+    error, after_pieces = _take_failure(model)
+    if error is not None and not (stream and after_pieces):
+        raise error
+    if stream:
+        time.sleep(STUB_LLM_LATENCY / 2)
+        return _stream(_pieces(messages, max_tokens, response_format), error, after_pieces)
+    time.sleep(STUB_LLM_LATENCY)
+    return _response(model, messages, max_tokens, response_format)
+
+async def acompletion(model, messages, stream=False, **kwargs):
+    """Equivalente local de litellm.acompletion."""
+    max_tokens = kwargs.get('max_tokens', 0)
+    response_format = kwargs.get('response_format')
+    _quota.charge(model, _prompt_tokens(messages) + max_tokens)
+    error, after_pieces = _take_failure(model)
+    if error is not None and not (stream and after_pieces):
+        raise error
+    if stream:
+        await asyncio.sleep(STUB_LLM_LATENCY / 2)
+        return _astream(_pieces(messages, max_tokens, response_format), error, after_pieces)
+    await asyncio.sleep(STUB_LLM_LATENCY)
+    return _response(model, messages, max_tokens, response_format)
+
+def install():
+    """Encaminha ao LLM local as chamadas do documenta a modelos "stub/"; os demais seguem para o litellm."""
+    import documenta
+    if getattr(documenta.acompletion, 'stub_llm', False):
+        return
+    real_completion, real_acompletion = documenta.completion, documenta.acompletion
+
+    def routed_completion(**kwargs):
+        return (completion if is_stub(kwargs.get('model')) else real_completion)(**kwargs)
+
+    async def routed_acompletion(**kwargs):
+        return await (acompletion if is_stub(kwargs.get('model')) else real_acompletion)(**kwargs)
+
+    routed_completion.stub_llm = routed_acompletion.stub_llm = True
+    documenta.completion, documenta.acompletion = routed_completion, routed_acompletion
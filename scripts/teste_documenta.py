@@ -0,0 +1,196 @@
+"""Testes da geração de documentação contra o LLM local (scripts/stub_llm.py), sem rede.
+
+Gera templates sintéticos, encaminha ao stub as chamadas a modelos "stub/" e confere a
+documentação de uma chamada única e de modelos divididos em partes enviadas em paralelo,
+com e sem streaming, com o cache, com saída estruturada, com falhas do provedor e com
+respostas interrompidas no meio do streaming. Os caches ficam em um diretório temporário. Sai com código 1 se algum cenário
+falhar.
+
+    python scripts/teste_documenta.py
+"""
+import os
+import sys
+import time
+import tempfile
+import traceback
+from contextlib import contextmanager
+
+os.environ['AUTODOC_CACHE_DIR'] = tempfile.mkdtemp(prefix='teste_documenta_')
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_llm
+from modelo_sintetico import make_schema, make_pbit, Upload
+
+import litellm
+import documenta
+import esquemas
+import tarefas
+from relatorio import upload_file
+
+stub_llm.install()
+stub_llm.STUB_LLM_LATENCY = 0.05
+
+MODELO = 'stub/echo'
+documenta.MODELO_RESERVA = 'stub/reserva'
+tarefas.JOB_PART_RETRIES = 1
+
+def _modelo(n_tables, n_cols, n_meas):
+    model = upload_file(Upload(make_pbit(make_schema(n_tables, n_cols, n_meas)), 'sintetico.pbit'))
+    assert not isinstance(model, str), model
+    return model
+
+@contextmanager
+def _conta_chamadas():
+    """Lista que recebe o response_format de cada resposta gerada pelo stub."""
+    calls = []
+    generate = stub_llm._generate
+    stub_llm._generate = lambda messages, max_tokens, response_format=None: (calls.append(response_format),
+                                                                             generate(messages, max_tokens, response_format))[1]
+    try:
+        yield calls
+    finally:
+        stub_llm._generate = generate
+
+def _gera(model, **kwargs):
+    items = []
+    kwargs.setdefault('incremental', False)
+    result = documenta.gerar_documentacao(model, MODELO, 'Portuguese', on_item=lambda array, item: items.append((array, item['Nome'])),
+                                          **kwargs)
+    return result, items
+
+def _confere(model, result):
+    """Todas as medidas e fontes do modelo documentadas, uma vez cada."""
+    measures = [item['Nome'] for item in result['response_measures']]
+    sources = [item['NomeTabela'] for item in result['response_source']]
+    assert sorted(measures) == sorted(model.measures['NomeMedida']), (len(measures), len(model.measures))
+    assert sorted(sources) == sorted(model.tables['NomeTabela']), (len(sources), len(model.tables))
+    assert result['response_info'].get('Titulo'), result['response_info']
+
+def cenario_chamada_unica():
+    """Um modelo pequeno é documentado em uma única chamada."""
+    model = _modelo(2, 3, 2)
+    result, items = _gera(model, max_tokens=100000)
+    _confere(model, result)
+    assert len(items) == len(result['response_measures']) + len(result['response_source']), len(items)
+
+def cenario_partes():
+    """Um modelo maior que max_tokens é dividido em várias partes de medidas e fontes enviadas em paralelo."""
+    model = _modelo(30, 5, 8)
+    with _conta_chamadas() as calls:
+        result, items = _gera(model, max_tokens=400)
+    _confere(model, result)
+    assert len(calls) > 2, len(calls)
+
+def cenario_sem_streaming():
+    """Sem streaming os itens são repassados a on_item quando cada resposta termina."""
+    documenta.LLM_STREAMING = False
+    try:
+        model = _modelo(10, 5, 4)
+        result, items = _gera(model, max_tokens=400)
+    finally:
+        documenta.LLM_STREAMING = True
+    _confere(model, result)
+    assert len(items) == len(result['response_measures']) + len(result['response_source']), len(items)
+
+def cenario_regenerar():
+    """As partes repetidas vêm do cache_llm, mas "regenerar tudo" (incremental=False) chama o LLM de novo."""
+    model = _modelo(8, 4, 4)
+    textos = documenta.text_to_document(model, max_tokens=200)[1]
+    partes = [(documenta.defined_prompt_medidas('Portuguese'), text) for text in textos]
+    with _conta_chamadas() as calls:
+        documenta.documenta_partes(partes, MODELO, max_tokens=200, resumable=False)
+        first = len(calls)
+        documenta.documenta_partes(partes, MODELO, max_tokens=200, resumable=False)
+        assert len(calls) == first, (first, len(calls))
+
+    with _conta_chamadas() as calls:
+        _gera(model, max_tokens=200)
+        first = len(calls)
+        _gera(model, max_tokens=200)
+        assert first > 0 and len(calls) == 2 * first, (first, len(calls))
+
+def cenario_reserva():
+    """Com o provedor indisponível (503) as partes vão para o modelo reserva, e o resultado informa quantas."""
+    model = _modelo(10, 4, 4)
+    stub_llm.fail(MODELO, litellm.ServiceUnavailableError('indisponível', llm_provider='stub', model=MODELO), times=3)
+    try:
+        result, items = _gera(model, max_tokens=300)
+    finally:
+        stub_llm.fail(MODELO, None)
+    _confere(model, result)
+    assert len(result['chamadas_reserva']) == 3, result['chamadas_reserva']
+
+def cenario_erro_sem_reserva():
+    """Outros erros (uma requisição inválida, por exemplo) não trocam de modelo: a geração falha."""
+    model = _modelo(3, 3, 2)
+    stub_llm.fail(MODELO, litellm.BadRequestError('requisição inválida', model=MODELO, llm_provider='stub'), times=100)
+    stub_llm.fail(documenta.MODELO_RESERVA, AssertionError('modelo reserva chamado'), times=100)
+    try:
+        _gera(model, max_tokens=100000)
+    except litellm.BadRequestError:
+        pass
+    else:
+        raise AssertionError('a geração não falhou')
+    finally:
+        stub_llm.fail(MODELO, None)
+        stub_llm.fail(documenta.MODELO_RESERVA, None)
+
+def _confere_itens(result, items):
+    """Cada medida e fonte do resultado repassada a on_item exatamente uma vez."""
+    assert len(items) == len(set(items)), [item for item in set(items) if items.count(item) > 1]
+    expected = ({('Medidas_do_Relatorio', item['Nome']) for item in result['response_measures']} |
+                {('Fontes_de_Dados', item['Nome']) for item in result['response_source']})
+    assert set(items) == expected, (len(items), len(expected))
+
+def cenario_itens_unicos():
+    """Itens já repassados a on_item não se repetem quando a parte é refeita.
+
+    A resposta cai no meio do streaming, depois de alguns itens, e a parte é refeita no modelo
+    reserva (provedor indisponível) ou repetida no mesmo modelo (outro erro).
+    """
+    model = _modelo(10, 4, 6)
+    for error in (litellm.APIConnectionError('conexão perdida', llm_provider='stub', model=MODELO),
+                  litellm.BadRequestError('resposta interrompida', model=MODELO, llm_provider='stub')):
+        stub_llm.fail(MODELO, error, times=2, after_pieces=25)
+        try:
+            result, items = _gera(model, max_tokens=300)
+        finally:
+            stub_llm.fail(MODELO, None)
+        _confere(model, result)
+        _confere_itens(result, items)
+
+def cenario_esquemas():
+    """Com saída estruturada, só a primeira parte pede as informações do relatório; as demais usam os esquemas enxutos."""
+    model = _modelo(12, 4, 6)
+    supports_schema = esquemas.supports_schema
+    esquemas.supports_schema = lambda modelo: True
+    try:
+        with _conta_chamadas() as calls:
+            result, items = _gera(model, max_tokens=300)
+    finally:
+        esquemas.supports_schema = supports_schema
+    _confere(model, result)
+    names = [call['json_schema']['name'] for call in calls]
+    assert sum(name.endswith('_relatorio') for name in names) == 1, names
+    assert {'documentacao_medidas', 'documentacao_fontes'} <= set(names), names
+
+CENARIOS = [cenario_chamada_unica, cenario_partes, cenario_sem_streaming, cenario_regenerar, cenario_reserva, cenario_erro_sem_reserva,
+            cenario_itens_unicos, cenario_esquemas]
+
+def main():
+    failures = 0
+    for cenario in CENARIOS:
+        start = time.monotonic()
+        try:
+            cenario()
+        except Exception:
+            failures += 1
+            print(f'FALHOU {cenario.__name__}')
+            traceback.print_exc()
+        else:
+            print(f'ok     {cenario.__name__} ({time.monotonic() - start:.1f} s)')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Testes do escaneamento de workspaces (scanStatus com backoff e prazo) contra a API local.
+
+Sobe scripts/admin_api_local.py, aponta POWERBI_ADMIN_URL para ele e roda cenários de
+escaneamento rápido, lento, com 429 no getInfo, com 5xx, que falha e que nunca termina, além da
+listagem de workspaces. Sai com código 1 se algum cenário falhar.
+
+    python scripts/teste_scan.py
+"""
+import os
+import sys
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admin_api_local import AdminAPIState, serve
+
+server, url = serve(AdminAPIState())
+os.environ['POWERBI_ADMIN_URL'] = url
+
+import relatorio
+
+HEADERS = {'Authorization': 'Bearer teste'}
+
+def _cenario(state):
+    server.state = state
+    return state
+
+def _timed(call):
+    start = time.monotonic()
+    result = call()
+    return result, time.monotonic() - start
+
+def cenario_rapido():
+    """Um escaneamento curto termina logo na primeira ou segunda consulta, sem esperar um tempo fixo."""
+    state = _cenario(AdminAPIState(scan_seconds=0.2))
+    workspace, elapsed = _timed(lambda: relatorio.scan_workspace(HEADERS, 'ws0', timeout=10))
+    assert workspace['id'] == 'ws0', workspace
+    assert state.count('GET', 'scanStatus') <= 2, state.count('GET', 'scanStatus')
+    assert elapsed < 1.5, elapsed
+
+def cenario_lento():
+    """Um escaneamento longo é acompanhado com intervalos crescentes entre as consultas."""
+    state = _cenario(AdminAPIState(scan_seconds=4))
+    workspace, elapsed = _timed(lambda: relatorio.scan_workspace(HEADERS, 'ws1', timeout=30))
+    assert workspace['id'] == 'ws1', workspace
+    polls = state.times('GET', 'scanStatus')
+    intervals = [b - a for a, b in zip(polls, polls[1:])]
+    assert all(b > a for a, b in zip(intervals, intervals[1:])), intervals
+    assert len(polls) <= 5, len(polls)
+    assert elapsed < 4 + relatorio.SCAN_POLL_MAX_DELAY, elapsed
+
+def cenario_429():
+    """getInfo recusado com 429 é repetido após o Retry-After, sem falhar o escaneamento."""
+    state = _cenario(AdminAPIState(scan_seconds=0.2, throttle_getinfo=2, retry_after=0.3))
+    workspace, elapsed = _timed(lambda: relatorio.scan_workspace(HEADERS, 'ws2', timeout=10))
+    assert workspace['id'] == 'ws2', workspace
+    assert state.count('POST', 'getInfo') == 3, state.count('POST', 'getInfo')
+    assert elapsed >= 0.6, elapsed
+
+def cenario_falha():
+    """Um escaneamento que termina como Failed levanta RuntimeError."""
+    _cenario(AdminAPIState(scan_seconds=0.2, fail=True))
+    try:
+        relatorio.scan_workspace(HEADERS, 'ws3', timeout=10)
+    except RuntimeError:
+        return
+    raise AssertionError('RuntimeError não levantado')
+
+def cenario_prazo():
+    """Um escaneamento que nunca termina levanta TimeoutError no prazo, sem esperar além dele."""
+    _cenario(AdminAPIState(scan_seconds=None))
+    start = time.monotonic()
+    try:
+        relatorio.scan_workspace(HEADERS, 'ws4', timeout=2)
+    except TimeoutError:
+        elapsed = time.monotonic() - start
+        assert elapsed < 2.5, elapsed
+        return
+    raise AssertionError('TimeoutError não levantado')
+
+def cenario_5xx():
+    """Respostas 5xx são repetidas no GET (scanStatus), mas não no POST (getInfo)."""
+    state = _cenario(AdminAPIState(scan_seconds=0.2))
+    scan_id = relatorio.start_scan(HEADERS, ['ws0'], time.monotonic() + 10)
+    state.server_errors = 2
+    relatorio.wait_scan(HEADERS, scan_id, time.monotonic() + 10)
+    assert state.count('GET', 'scanStatus') >= 3, state.count('GET', 'scanStatus')
+
+    state.server_errors = 1
+    try:
+        relatorio.start_scan(HEADERS, ['ws0'], time.monotonic() + 10)
+    except relatorio.requests.HTTPError:
+        assert state.count('POST', 'getInfo') == 2, state.count('POST', 'getInfo')
+        return
+    raise AssertionError('getInfo repetido após 503')
+
+def cenario_lotes():
+    """scan_workspaces divide as workspaces em lotes e devolve o resultado de todos."""
+    state = _cenario(AdminAPIState(scan_seconds=0.3, n_workspaces=5))
+    ids = [workspace['id'] for workspace in state.workspaces]
+    results = list(relatorio.scan_workspaces(HEADERS, ids, batch_size=2, timeout=10))
+    assert len(results) == 3, results
+    scanned = sorted(workspace['id'] for _, result in results for workspace in result['workspaces'])
+    assert scanned == sorted(ids), scanned
+
+def cenario_listagem():
+    """Workspaces com o mesmo nome continuam distintas na listagem, e uma página que não é JSON não derruba o app."""
+    state = _cenario(AdminAPIState())
+    state.workspaces = [{'id': 'ws0', 'name': 'Vendas'}, {'id': 'ws1', 'name': 'Vendas'}, {'id': 'ws2', 'name': 'RH'}]
+    workspaces = relatorio.get_workspaces_id(HEADERS, 'listagem', refresh=True)
+    assert workspaces == {'ws0': 'Vendas', 'ws1': 'Vendas', 'ws2': 'RH'}, workspaces
+
+    state.html_groups = 1
+    assert relatorio.get_workspaces_id(HEADERS, 'listagem', refresh=True) is None
+
+CENARIOS = [cenario_rapido, cenario_lento, cenario_429, cenario_falha, cenario_prazo, cenario_5xx, cenario_lotes, cenario_listagem]
+
+def main():
+    failures = 0
+    for cenario in CENARIOS:
+        start = time.monotonic()
+        try:
+            cenario()
+        except Exception:
+            failures += 1
+            print(f'FALHOU {cenario.__name__}')
+            traceback.print_exc()
+        else:
+            print(f'ok     {cenario.__name__} ({time.monotonic() - start:.1f} s)')
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
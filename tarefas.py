@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from relatorio import CACHE_DIR
+
+# Tarefas de documentação retomáveis: cada envio de partes ao LLM (documenta_partes) é uma
+# tarefa com id determinístico, derivado do modelo e do conteúdo das partes. A resposta de
+# cada parte é gravada assim que chega, então um erro, um rerun do Streamlit ou o reinício do
+# processo não perdem as partes concluídas: ao gerar de novo, só as pendentes são enviadas.
+DOC_JOBS = os.getenv('DOC_JOBS', '1') != '0'
+DOC_JOBS_PATH = os.getenv('DOC_JOBS_PATH', os.path.join(CACHE_DIR, 'tarefas.sqlite'))
+# Novas tentativas de uma parte que falhou, antes de desistir da tarefa nesta execução
+JOB_PART_RETRIES = int(os.getenv('JOB_PART_RETRIES', 2))
+# Dias que uma tarefa não concluída fica guardada para ser retomada
+JOB_MAX_AGE_DAYS = float(os.getenv('JOB_MAX_AGE_DAYS', 7))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    model TEXT,
+    total INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_parts (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    response TEXT,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+def connect(path=None):
+    """Abre (e cria, se necessário) o registro de tarefas, descartando as mais antigas que JOB_MAX_AGE_DAYS."""
+    path = path or DOC_JOBS_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    limit = time.time() - JOB_MAX_AGE_DAYS * 86400
+    with conn:
+        conn.execute('DELETE FROM job_parts WHERE job_id IN (SELECT job_id FROM jobs WHERE updated_at < ?)', (limit,))
+        conn.execute('DELETE FROM jobs WHERE updated_at < ?', (limit,))
+    return conn
+
+def job_id(modelo, max_tokens_saida, partes):
+    """Id da tarefa: o mesmo modelo e as mesmas partes (prompt, texto) resultam sempre no mesmo id."""
+    payload = json.dumps([modelo, max_tokens_saida, [list(parte) for parte in partes]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def start_job(conn, job, modelo, total):
+    """Registra a tarefa (ou a retoma) e retorna {índice: (resposta, truncada)} das partes já concluídas."""
+    now = time.time()
+    with conn:
+        conn.execute("""INSERT INTO jobs (job_id, model, total, status, created_at, updated_at) VALUES (?, ?, ?, 'running', ?, ?)
+                        ON CONFLICT (job_id) DO UPDATE SET status = 'running', updated_at = excluded.updated_at""",
+                     (job, modelo, total, now, now))
+    rows = conn.execute("SELECT idx, response, truncated FROM job_parts WHERE job_id = ? AND status = 'done'", (job,))
+    return {idx: (json.loads(response), bool(truncated)) for idx, response, truncated in rows}
+
+def save_part(conn, job, idx, response, truncated=False):
+    """Grava a resposta de uma parte concluída."""
+    with conn:
+        conn.execute("""INSERT INTO job_parts (job_id, idx, status, response, truncated, attempts, error, updated_at) VALUES (?, ?, 'done', ?, ?, 1, NULL, ?)
+                        ON CONFLICT (job_id, idx) DO UPDATE SET status = 'done', response = excluded.response, truncated = excluded.truncated,
+                                                                attempts = attempts + 1, error = NULL, updated_at = excluded.updated_at""",
+                     (job, idx, json.dumps(response, ensure_ascii=False), int(truncated), time.time()))
+
+def fail_part(conn, job, idx, error):
+    """Registra a falha de uma parte; ela será enviada de novo na próxima tentativa ou execução."""
+    with conn:
+        conn.execute("""INSERT INTO job_parts (job_id, idx, status, attempts, error, updated_at) VALUES (?, ?, 'failed', 1, ?, ?)
+                        ON CONFLICT (job_id, idx) DO UPDATE SET status = 'failed', attempts = attempts + 1, error = excluded.error,
+                                                                updated_at = excluded.updated_at""",
+                     (job, idx, error, time.time()))
+
+def finish_job(conn, job, status='done'):
+    """Encerra a execução da tarefa. Uma tarefa concluída tem as partes apagadas: uma nova
+    geração com as mesmas partes chama o LLM de novo (ou usa o cache_llm), em vez de repetir
+    as respostas gravadas."""
+    with conn:
+        if status == 'done':
+            conn.execute('DELETE FROM job_parts WHERE job_id = ?', (job,))
+        conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?', (status, time.time(), job))
+
+def invalidate(path=None):
+    """Apaga todas as tarefas e as partes gravadas. Retorna quantas tarefas foram apagadas."""
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM job_parts')
+            return conn.execute('DELETE FROM jobs').rowcount
+    finally:
+        conn.close()
@@ -0,0 +1,255 @@
+import re
+
+# Leitura de projetos PBIP salvos em TMDL (um arquivo por tabela em definition/tables).
+# Cada arquivo é convertido para o mesmo formato de objetos do DataModelSchema (TMSL), de
+# modo que o restante da extração não precisa saber de onde o modelo veio.
+
+_CHILD_OBJECTS = ('measure', 'column', 'partition')
+_PROPERTY = re.compile(r'^([A-Za-z_][\w]*)\s*:\s*(.*)$')
+_EXPRESSION_PROPERTY = re.compile(r'^([A-Za-z_][\w]*)\s*=\s*(.*)$')
+_NAME = r"'(?:[^']|'')*'|[^\s=']+"
+_DECLARATION = re.compile(rf"^(\w+)\s+({_NAME})(?:\s*=\s*(.*))?$")
+_QUALIFIED_COLUMN = re.compile(r"^('(?:[^']|'')*'|[^.']+)\.(.+)$")
+
+def unquote(name):
+    """Remove as aspas simples de um nome TMDL ('Nome ''x''' -> Nome 'x')."""
+    name = name.strip()
+    if len(name) >= 2 and name[0] == "'" and name[-1] == "'":
+        return name[1:-1].replace("''", "'")
+    return name
+
+def _indent(line):
+    """Nível de indentação da linha (tabs; quatro espaços contam como um nível)."""
+    stripped = line.lstrip('\t')
+    tabs = len(line) - len(stripped)
+    return tabs + (len(stripped) - len(stripped.lstrip(' '))) // 4
+
+class _Lines:
+    """Cursor sobre as linhas de um arquivo TMDL, ignorando comentários de descrição (///)."""
+
+    def __init__(self, text):
+        self.lines = [line.rstrip('\r') for line in text.lstrip('\ufeff').split('\n')]
+        self.pos = 0
+
+    def next_significant(self):
+        """Avança até a próxima linha não vazia e retorna (indentação, conteúdo) ou None."""
+        while self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            content = line.strip()
+            if content and not content.startswith('///'):
+                return _indent(line), content
+            self.pos += 1
+        return None
+
+    def skip_block(self, level):
+        """Pula a linha atual e tudo que estiver indentado abaixo dela."""
+        self.pos += 1
+        while self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            if line.strip() and _indent(line) <= level:
+                return
+            self.pos += 1
+
+    def expression(self, first, level):
+        """Lê uma expressão que começa após o '=' e pode continuar nas linhas seguintes.
+
+        'level' é a indentação a partir da qual (exclusive) as linhas seguintes pertencem
+        à expressão. Expressões delimitadas por ``` são lidas até o delimitador de fechamento.
+        """
+        self.pos += 1
+        if first.strip() == '```':
+            body = []
+            while self.pos < len(self.lines) and self.lines[self.pos].strip() != '```':
+                body.append(self.lines[self.pos])
+                self.pos += 1
+            self.pos += 1
+            return _dedent(body)
+        if first:
+            return first
+
+        body = []
+        while self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            if line.strip() and _indent(line) <= level:
+                break
+            body.append(line)
+            self.pos += 1
+        return _dedent(body)
+
+def _dedent(lines):
+    while lines and not lines[-1].strip():
+        lines.pop()
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    if not lines:
+        return ''
+    margin = min(_indent(line) for line in lines if line.strip())
+    result = []
+    for line in lines:
+        for _ in range(margin):
+            if line.startswith('\t'):
+                line = line[1:]
+            elif line.startswith('    '):
+                line = line[4:]
+        result.append(line)
+    return '\n'.join(result)
+
+def _read_properties(lines, obj, level):
+    """Lê as propriedades (nível level + 1) de um objeto, pulando objetos aninhados."""
+    while True:
+        found = lines.next_significant()
+        if found is None or found[0] <= level:
+            return
+        indent, content = found
+        prop = _PROPERTY.match(content)
+        expr = _EXPRESSION_PROPERTY.match(content)
+        if indent == level + 1 and prop:
+            obj[prop.group(1)] = prop.group(2).strip()
+            lines.skip_block(indent)
+        elif indent == level + 1 and expr:
+            obj[expr.group(1)] = lines.expression(expr.group(2), indent)
+        elif indent == level + 1 and re.fullmatch(r'[A-Za-z_]\w*', content):
+            # Propriedades booleanas aparecem só com o nome (ex.: isHidden)
+            obj[content] = True
+            lines.pos += 1
+        else:
+            lines.skip_block(indent)
+
+def _declaration(lines, found):
+    """Lê a declaração de um objeto ('tipo nome = expressão') e as suas propriedades."""
+    level, content = found
+    match = _DECLARATION.match(content)
+    if match is None:
+        lines.skip_block(level)
+        return None, None
+    kind, name, expression = match.groups()
+    obj = {'name': unquote(name)}
+    if expression is not None:
+        obj['expression'] = lines.expression(expression, level + 1)
+    else:
+        lines.pos += 1
+    _read_properties(lines, obj, level)
+    return kind, obj
+
+def parse_table(text):
+    """Converte um arquivo de tabela TMDL no objeto de tabela do TMSL (com measures, columns e partitions)."""
+    lines = _Lines(text)
+    found = lines.next_significant()
+    match = _DECLARATION.match(found[1]) if found else None
+    if match is None or match.group(1) != 'table':
+        return None
+    table = {'name': unquote(match.group(2))}
+    lines.pos += 1
+
+    for child in _CHILD_OBJECTS:
+        table[child + 's'] = []
+
+    while True:
+        found = lines.next_significant()
+        if found is None:
+            break
+        indent, content = found
+        keyword = content.split(None, 1)[0]
+        if indent == 1 and keyword in _CHILD_OBJECTS:
+            kind, obj = _declaration(lines, found)
+            if obj is None:
+                continue
+            if kind == 'column' and 'expression' in obj:
+                obj['type'] = 'calculated'
+            elif kind == 'partition':
+                # 'partition Nome = m' traz o tipo no lugar da expressão e o código em 'source'
+                obj['source'] = {'type': obj.pop('expression', None), 'expression': obj.pop('source', 'N/A')}
+            table[kind + 's'].append(obj)
+        elif indent == 1 and (prop := _PROPERTY.match(content)):
+            table[prop.group(1)] = prop.group(2).strip()
+            lines.skip_block(indent)
+        else:
+            lines.skip_block(indent)
+
+    # Colunas de tabelas calculadas vêm da expressão da partição
+    if any((p.get('source') or {}).get('type') == 'calculated' for p in table['partitions']):
+        for column in table['columns']:
+            if 'type' not in column and 'sourceColumn' in column:
+                column['type'] = 'calculatedTableColumn'
+    return table
+
+def _split_column(reference):
+    """Separa 'Tabela.Coluna' (com ou sem aspas) em (tabela, coluna)."""
+    match = _QUALIFIED_COLUMN.match(reference.strip())
+    if match is None:
+        return None, unquote(reference)
+    return unquote(match.group(1)), unquote(match.group(2))
+
+def parse_relationships(text):
+    """Converte o relationships.tmdl na lista de relacionamentos do TMSL."""
+    lines = _Lines(text)
+    relationships = []
+    while True:
+        found = lines.next_significant()
+        if found is None:
+            return relationships
+        if found[0] != 0 or not found[1].startswith('relationship '):
+            lines.skip_block(found[0])
+            continue
+        _, obj = _declaration(lines, found)
+        if obj is None:
+            continue
+        relationship = {'name': obj['name']}
+        relationship['fromTable'], relationship['fromColumn'] = _split_column(obj.get('fromColumn', ''))
+        relationship['toTable'], relationship['toColumn'] = _split_column(obj.get('toColumn', ''))
+        for key, value in obj.items():
+            relationship.setdefault(key, value)
+        relationships.append(relationship)
+
+def table_order(text):
+    """Ordem das tabelas declarada no model.tmdl ('ref table Nome')."""
+    order = []
+    for line in text.split('\n'):
+        content = line.strip()
+        if content.startswith('ref table '):
+            order.append(unquote(content[len('ref table '):]))
+    return order
+
+def find_definition(members):
+    """Retorna o prefixo da pasta 'definition/' do primeiro modelo TMDL do ZIP (ou None)."""
+    prefixes = set()
+    for m in members:
+        start = ('/' + m).rfind('/definition/')
+        if m.endswith('.tmdl') and start >= 0:
+            prefixes.add(m[:start + len('definition/')])
+    return min(prefixes) if prefixes else None
+
+def _read_text(zipf, name):
+    with zipf.open(name) as f:
+        return f.read().decode('utf-8-sig')
+
+def tmdl_events(zipf, members):
+    """Emite os eventos do modelo (os mesmos de iter_schema_events) a partir de um projeto TMDL zipado.
+
+    Os arquivos de tabela são lidos um de cada vez, na ordem do model.tmdl, e cada tabela é
+    descartada depois de emitida, então só um arquivo fica em memória. A interpretação é
+    código Python puro: threads não a paralelizam por causa do GIL, e o paralelismo entre
+    arquivos enviados fica com o pool de processos do upload.
+    """
+    prefix = find_definition(members)
+    if prefix is None:
+        return
+
+    table_files = {m: m[len(prefix) + len('tables/'):-len('.tmdl')]
+                   for m in members if m.startswith(prefix + 'tables/') and m.endswith('.tmdl')}
+    order = table_order(_read_text(zipf, prefix + 'model.tmdl')) if prefix + 'model.tmdl' in members else []
+    position = {name: i for i, name in enumerate(order)}
+    files = sorted(table_files, key=lambda m: (position.get(table_files[m], len(position)), table_files[m]))
+
+    for member in files:
+        table = parse_table(_read_text(zipf, member))
+        if table is None:
+            continue
+        for child in ('measures', 'columns', 'partitions'):
+            for obj in table.pop(child):
+                yield child[:-1], table['name'], obj
+        yield 'table', table['name'], table
+
+    if prefix + 'relationships.tmdl' in members:
+        for relationship in parse_relationships(_read_text(zipf, prefix + 'relationships.tmdl')):
+            yield 'relationship', None, relationship
@@ -0,0 +1,72 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import tiktoken
+
+# Tokenizador compartilhado: a codificação é carregada uma vez por processo e as contagens
+# ficam em um cache LRU endereçado pelo hash do texto, reaproveitado entre reruns e sessões.
+TOKENIZER_ENCODING = 'cl100k_base'
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 100_000))
+TOKENIZER_THREADS = int(os.getenv('TOKENIZER_THREADS', min(8, os.cpu_count() or 1)))
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_counts = OrderedDict()
+_counts_lock = threading.Lock()
+
+def get_encoding():
+    """Retorna a codificação do tiktoken, carregada uma única vez."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return _encoding
+
+def _key(text):
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+def _remember(key, count):
+    with _counts_lock:
+        _counts[key] = count
+        _counts.move_to_end(key)
+        while len(_counts) > TOKEN_CACHE_SIZE:
+            _counts.popitem(last=False)
+
+def _cached(key):
+    with _counts_lock:
+        count = _counts.get(key)
+        if count is not None:
+            _counts.move_to_end(key)
+        return count
+
+def count_tokens(text):
+    """Conta os tokens do texto, usando o cache quando o mesmo conteúdo já foi contado."""
+    key = _key(text)
+    count = _cached(key)
+    if count is None:
+        # Textos dos relatórios podem conter marcadores como <|endoftext|>; contam como texto comum
+        count = len(get_encoding().encode(text, disallowed_special=()))
+        _remember(key, count)
+    return count
+
+def count_tokens_batch(texts, num_threads=None):
+    """Conta os tokens de vários textos; os que não estão no cache são codificados juntos em várias threads."""
+    keys = [_key(text) for text in texts]
+    counts = [_cached(key) for key in keys]
+
+    missing = {}
+    for i, count in enumerate(counts):
+        if count is None:
+            missing.setdefault(keys[i], texts[i])
+
+    if missing:
+        encoded = get_encoding().encode_batch(list(missing.values()), num_threads=num_threads or TOKENIZER_THREADS, disallowed_special=())
+        fresh = {key: len(tokens) for key, tokens in zip(missing, encoded)}
+        for key, count in fresh.items():
+            _remember(key, count)
+        counts = [fresh[key] if count is None else count for key, count in zip(keys, counts)]
+
+    return counts